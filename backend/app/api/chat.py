@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..db.database import get_db
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from ..db.models import ChatMessage
 from ..services.chat_service import ChatService
+from ..core.settings import settings
+from .deps import get_chat_service
 from ..schemas.models import (
     ChatMessageCreate,
     ChatMessageResponse,
     ChatSessionResponse,
     ChatSessionCreate
 )
+import json
 import uuid
 from uuid import UUID
 
@@ -17,45 +20,96 @@ router = APIRouter(prefix="/chat")
 @router.post("/sessions/", response_model=ChatSessionResponse)
 async def create_chat_session(
     user_id: str = Query(..., description="User ID"),
-    db: Session = Depends(get_db)
+    chat_service: ChatService = Depends(get_chat_service)
 ):
-    chat_service = ChatService(db)
     return await chat_service.create_session(user_id)
 
+# Cursor of the next page, absent on the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 @router.get("/sessions/{user_id}", response_model=List[ChatSessionResponse])
 async def get_user_sessions(
     user_id: str,
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    chat_service: ChatService = Depends(get_chat_service)
 ):
-    chat_service = ChatService(db)
-    return chat_service.get_user_sessions(user_id)
+    """Sessions newest first, pass X-Next-Cursor back as `cursor` for older ones"""
+    sessions, next_cursor = await chat_service.list_sessions(user_id, limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return sessions
 
 @router.get("/sessions/{session_id}/messages", response_model=List[ChatMessageResponse])
 async def get_chat_history(
     session_id: UUID,
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    chat_service: ChatService = Depends(get_chat_service)
 ):
-    chat_service = ChatService(db)
-    return chat_service.get_chat_history(str(session_id))
+    """The latest messages oldest first, pass X-Next-Cursor back as `cursor` for earlier ones"""
+    messages, next_cursor = await chat_service.list_messages(str(session_id), limit, cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return messages
 
 @router.post("/sessions/{session_id}/messages", response_model=List[ChatMessageResponse])
 async def create_message(
     session_id: UUID,
     message: ChatMessageCreate,
-    db: Session = Depends(get_db)
+    chat_service: ChatService = Depends(get_chat_service)
 ):
-    chat_service = ChatService(db)
     messages = await chat_service.generate_response(
         str(session_id),
-        message.content
+        message.content,
+        vector_weight=message.vector_weight,
+        lexical_weight=message.lexical_weight
     )
-    await chat_service.update_session_title(str(session_id))
     return messages
 
+@router.post("/sessions/{session_id}/messages/stream")
+async def stream_message(
+    session_id: UUID,
+    message: ChatMessageCreate,
+    chat_service: ChatService = Depends(get_chat_service)
+):
+    """Stream the assistant response as Server-Sent Events.
+
+    Events: `user_message` (saved user message), `delta` (text as it is generated),
+    `assistant_message` (saved assistant message) or `error`. The user message is
+    saved together with the assistant message, a failed turn saves neither.
+    """
+    events = chat_service.stream_response(
+        str(session_id),
+        message.content,
+        vector_weight=message.vector_weight,
+        lexical_weight=message.lexical_weight
+    )
+    # Run the turn up to its first event before the stream starts, so a missing session is a plain 404
+    first = await events.__anext__()
+
+    async def event_stream():
+        async for event, data in _chain(first, events):
+            if isinstance(data, ChatMessage):
+                data = ChatMessageResponse.model_validate(data).model_dump(mode="json")
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _chain(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
 @router.delete("/sessions/{session_id}")
 async def delete_session(
     session_id: UUID,
-    db: Session = Depends(get_db)
+    chat_service: ChatService = Depends(get_chat_service)
 ):
-    chat_service = ChatService(db)
     return await chat_service.delete_session(str(session_id)) 
\ No newline at end of file
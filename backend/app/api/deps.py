@@ -0,0 +1,26 @@
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.database import get_db
+from ..services.clients import ServiceClients
+from ..services.chat_service import ChatService
+from ..services.ingest_service import IngestService
+
+def get_clients(request: Request) -> ServiceClients:
+    """Clients created by the application lifespan"""
+    clients = getattr(request.app.state, "clients", None)
+    if clients is None:
+        # App served without its lifespan (e.g. TestClient outside a with block)
+        clients = request.app.state.clients = ServiceClients()
+    return clients
+
+def get_chat_service(
+    db: AsyncSession = Depends(get_db),
+    clients: ServiceClients = Depends(get_clients)
+) -> ChatService:
+    return clients.chat_service(db)
+
+def get_ingest_service(
+    db: AsyncSession = Depends(get_db),
+    clients: ServiceClients = Depends(get_clients)
+) -> IngestService:
+    return clients.ingest_service(db)
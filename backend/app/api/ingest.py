@@ -1,34 +1,59 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Form, Request
+from typing import List, Optional
+from uuid import UUID
 from ..services.ingest_service import IngestService
-from ..db.database import get_db
+from ..services.ingest_jobs import ingest_job_queue
+from ..schemas.models import IngestJobResponse
+from .deps import get_ingest_service
 from ..core.settings import settings
 
 router = APIRouter(prefix="/ingest")
 
-@router.post("/upload")
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+async def check_content_length(request: Request):
+    """Reject oversized uploads from the Content-Length header, before the body is parsed"""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.MAX_FILE_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE/1024/1024}MB"
+        )
+
+@router.post("/upload", response_model=IngestJobResponse, status_code=202, dependencies=[Depends(check_content_length)])
 async def upload_file(
     file: UploadFile,
     session_id: str,
-    db: Session = Depends(get_db)
+    ingest_service: IngestService = Depends(get_ingest_service)
 ):
+    """Validate an upload and queue it for ingestion, poll /ingest/jobs/{id} for progress"""
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file selected")
     
-    # Check file size
-    contents = await file.read()
-    if len(contents) > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE/1024/1024}MB"
-        )
-    await file.seek(0)  # Reset file position after reading
-    
-    ingest_service = IngestService(db)
     try:
-        result = await ingest_service.process_file(file, session_id)
-        return result
+        spooled, content_type = await ingest_service.validate_file(file)
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Error processing file. Please try again.") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error processing file. Please try again.")
+    return ingest_job_queue.enqueue(session_id, file.filename, content_type, spooled)
+
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(job_id: UUID):
+    job = ingest_job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+@router.post("/jobs/{job_id}/retry", response_model=IngestJobResponse, status_code=202)
+async def retry_ingest_job(job_id: UUID):
+    """Re-queue a failed job, chunks already stored are not embedded again"""
+    job = ingest_job_queue.retry(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+@router.get("/jobs", response_model=List[IngestJobResponse])
+async def list_ingest_jobs(session_id: Optional[str] = None):
+    return ingest_job_queue.list(session_id)
@@ -3,6 +3,11 @@ from typing import List, Dict
 import json
 from pydantic import field_validator
 
+def to_async_database_url(url: str) -> str:
+    """Swap the driver of a postgres URL for asyncpg"""
+    scheme, rest = url.split("://", 1)
+    return f"postgresql+asyncpg://{rest}" if scheme.startswith("postgres") else url
+
 class Settings(BaseSettings):
     """
     Application settings with type validation using Pydantic.
@@ -26,6 +31,16 @@ class Settings(BaseSettings):
         if self.DATABASE_URL:
             return self.DATABASE_URL
         return f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
+    @property
+    def async_database_url(self) -> str:
+        return to_async_database_url(self.sync_database_url)
+
+    # Connection pool settings
+    DB_POOL_SIZE: int
+    DB_MAX_OVERFLOW: int
+    DB_POOL_TIMEOUT: int
+    DB_POOL_RECYCLE: int
     
     # CORS settings
     BACKEND_CORS_ORIGINS: List[str]
@@ -45,7 +60,17 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str
     GEMINI_MODEL: str
     EMBEDDING_MODEL: str
+    EMBEDDING_MODEL_DIMENSIONS: int
     EMBEDDING_DIMENSIONS: int
+
+    @field_validator("EMBEDDING_DIMENSIONS")
+    @classmethod
+    def validate_embedding_dimensions(cls, v, info):
+        """Embeddings can be truncated, not extended"""
+        native = info.data.get("EMBEDDING_MODEL_DIMENSIONS")
+        if v < 1 or (native and v > native):
+            raise ValueError(f"EMBEDDING_DIMENSIONS must be between 1 and the model's {native} dimensions")
+        return v
     
     # Rate limits
     MAX_RPM: int
@@ -53,13 +78,59 @@ class Settings(BaseSettings):
     MAX_CHUNK_TOKENS: int
     EMBEDDING_MAX_RPM: int
     
+    # Upstream failure handling
+    LLM_MAX_ATTEMPTS: int
+    LLM_RETRY_BASE_DELAY: float
+    LLM_RETRY_MAX_DELAY: float
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int
+    LLM_CIRCUIT_RESET_TIMEOUT: float
+    LLM_TIMEOUT: float
+    EMBEDDING_TIMEOUT: float
+    CHAT_TURN_BUDGET: float
+    EMBEDDING_HEDGE_ENABLED: bool
+    EMBEDDING_HEDGE_DELAY: float
+    
     # Document processing settings
     CHUNK_SIZE: int
     CHUNK_OVERLAP: int
     MAX_CHUNKS_PER_DOC: int
     SIMILARITY_TOP_K: int
     EMBEDDING_BATCH_SIZE: int
+    EMBEDDING_MAX_CONCURRENCY: int
+    EMBEDDING_CACHE_ENABLED: bool
+    EMBEDDING_CACHE_MEMORY_SIZE: int
+    EMBEDDING_CACHE_DTYPE: str
     MAX_FILE_SIZE: int
+    UPLOAD_CHUNK_SIZE: int
+    UPLOAD_SPOOL_SIZE: int
+    PARSER_WORKERS: int
+    PDF_PAGES_PER_SHARD: int
+    TABLE_ROWS_PER_READ: int
+    TABLE_CHUNK_SIZE: int
+    INGEST_WORKERS: int
+    INGEST_BATCH_SIZE: int
+    INGEST_PIPELINE_DEPTH: int
+    INGEST_QUEUE_SIZE: int
+    INGEST_JOB_RETENTION: int
+    DEDUP_NEAR_DUPLICATE_CHUNKS: bool
+    DEDUP_SIMHASH_DISTANCE: int
+    
+    # Vector search settings
+    VECTOR_DISTANCE_METRIC: str
+    VECTOR_INDEX_TYPE: str
+    VECTOR_QUANTIZATION: str
+    VECTOR_RERANK_CANDIDATES: int
+    HNSW_M: int
+    HNSW_EF_CONSTRUCTION: int
+    IVFFLAT_LISTS: int
+    IVFFLAT_PROBES: int
+    HNSW_EF_SEARCH: int
+    EXACT_SEARCH_MAX_CHUNKS: int
+    TEXT_SEARCH_CONFIG: str
+    HYBRID_VECTOR_WEIGHT: float
+    HYBRID_LEXICAL_WEIGHT: float
+    HYBRID_CANDIDATES: int
+    RRF_K: int
     
     # Chat configurations
     TEMPERATURE: float
@@ -67,6 +138,16 @@ class Settings(BaseSettings):
     SYSTEM_PROMPT: str
     SIMILARITY_THRESHOLD: float
     MAX_HISTORY: int
+    PAGE_SIZE: int
+    MAX_PAGE_SIZE: int
+    IN_MEMORY_SEARCH_ENABLED: bool
+    IN_MEMORY_SEARCH_MAX_CHUNKS: int
+    IN_MEMORY_SEARCH_MAX_SESSIONS: int
+    IN_MEMORY_SEARCH_MMAP_DIR: str
+    RESPONSE_CACHE_ENABLED: bool
+    RESPONSE_CACHE_MAX_ENTRIES: int
+    RESPONSE_CACHE_TTL: float
+    RESPONSE_CACHE_RADIUS: float
     
     # Supported file types
     SUPPORTED_FILE_TYPES: Dict[str, str]
@@ -8,25 +8,80 @@ VERSION = "1.0.0"
 # CORS defaults
 BACKEND_CORS_ORIGINS = ["http://localhost:3000", "http://localhost:8000"]
 
+# Database connection pool defaults (per worker)
+DB_POOL_SIZE = 10  # Connections kept open
+DB_MAX_OVERFLOW = 20  # Extra connections allowed under burst load
+DB_POOL_TIMEOUT = 30  # Seconds to wait for a free connection
+DB_POOL_RECYCLE = 1800  # Seconds before a connection is replaced
+
 # Model defaults
 GEMINI_MODEL = "gemini-1.5-flash"
 EMBEDDING_MODEL = "models/text-embedding-004"
-EMBEDDING_DIMENSIONS = 768
+EMBEDDING_MODEL_DIMENSIONS = 768  # Full output size of EMBEDDING_MODEL
+EMBEDDING_DIMENSIONS = 768  # Stored size, smaller values keep a truncated, re-normalised prefix (Matryoshka)
 
 # Rate limits (based on Gemini API)
 MAX_RPM = 12  # Buffer below 15 RPM limit for GEMINI calls
 MAX_TPM = 28000  # Buffer below 32,000 TPM
-MAX_CHUNK_TOKENS = 1500  # Typical chunk token limit
+MAX_CHUNK_TOKENS = 1500  # Token budget for retrieved context in one prompt
 
 EMBEDDING_MAX_RPM = 1500  # Rate limit for embeddings model calls
 
+# Upstream failure handling
+LLM_MAX_ATTEMPTS = 3  # Attempts per LLM call, retried on rate limits and transient errors
+LLM_RETRY_BASE_DELAY = 1.0  # Seconds, doubled per attempt with full jitter
+LLM_RETRY_MAX_DELAY = 20.0  # Cap on the backoff, a server's Retry-After can exceed it
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures before failing fast
+LLM_CIRCUIT_RESET_TIMEOUT = 30.0  # Seconds to fail fast before probing again
+LLM_TIMEOUT = 30.0  # Seconds per LLM request, and between streamed chunks
+EMBEDDING_TIMEOUT = 10.0  # Seconds per embedding request
+CHAT_TURN_BUDGET = 60.0  # Seconds for retrieval plus generation of one answer (first token when streaming)
+EMBEDDING_HEDGE_ENABLED = False  # Send a duplicate query embedding request when the first is slow
+EMBEDDING_HEDGE_DELAY = 1.0  # Seconds before hedging until enough latencies are seen to use their p95
+
 # Document processing defaults
 CHUNK_SIZE = 500  # ~300 words per chunk
 CHUNK_OVERLAP = 50  # 20% overlap for context
 MAX_CHUNKS_PER_DOC = 100  # Balance between completeness and rate limits
 SIMILARITY_TOP_K = 3  # Balance between context and token usage
-EMBEDDING_BATCH_SIZE = 5  # 5 chunks per batch
+EMBEDDING_BATCH_SIZE = 20  # Chunks sent in one batch embedding request (API max 100)
+EMBEDDING_MAX_CONCURRENCY = 4  # Batch requests in flight at once per process
+EMBEDDING_CACHE_ENABLED = True  # Reuse embeddings of identical text across uploads and queries
+EMBEDDING_CACHE_MEMORY_SIZE = 10000  # In-process LRU entries in front of the Postgres cache table
+EMBEDDING_CACHE_DTYPE = "float32"  # Stored precision: "float32" or "float16" (half the size)
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB to handle PDFs and spreadsheets
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Uploads are copied and size-checked in blocks of this size
+UPLOAD_SPOOL_SIZE = 1024 * 1024  # Uploads larger than this are spooled to disk instead of memory
+PARSER_WORKERS = 2  # Processes for PDF/CSV/XLSX extraction, 0 parses in a thread instead
+PDF_PAGES_PER_SHARD = 20  # PDF pages extracted per process pool task
+TABLE_ROWS_PER_READ = 1000  # CSV rows parsed at a time while grouping rows into chunks
+TABLE_CHUNK_SIZE = 2000  # Characters of rows per table chunk, larger than CHUNK_SIZE so the repeated header is a small share
+INGEST_WORKERS = 2  # Background ingestion workers per process
+INGEST_BATCH_SIZE = 100  # Chunks embedded and committed together, searchable once committed
+INGEST_PIPELINE_DEPTH = 2  # Batches buffered between split, embed and insert stages
+INGEST_QUEUE_SIZE = 100  # Uploads waiting for a worker before new ones are rejected
+INGEST_JOB_RETENTION = 1000  # Finished jobs kept for status lookups
+DEDUP_NEAR_DUPLICATE_CHUNKS = False  # Skip chunks whose SimHash is within DEDUP_SIMHASH_DISTANCE bits of a chunk already in the session
+DEDUP_SIMHASH_DISTANCE = 3  # Max differing bits of 64 for two chunks to count as near duplicates
+
+# Vector search defaults
+VECTOR_DISTANCE_METRIC = "cosine"  # Must match the operator class of the embedding index
+VECTOR_INDEX_TYPE = "hnsw"  # "hnsw" (no training, good recall as data grows) or "ivfflat"
+VECTOR_QUANTIZATION = "none"  # Index "halfvec" or "binary" quantised embeddings (pgvector >= 0.7), re-ranked exactly
+VECTOR_RERANK_CANDIDATES = 100  # Candidates taken from a quantised index for the exact re-rank
+HNSW_M = 16  # Max connections per hnsw graph node
+HNSW_EF_CONSTRUCTION = 64  # Candidate list size while building the hnsw graph
+IVFFLAT_LISTS = 0  # ivfflat lists, 0 = size from row count at build time
+IVFFLAT_PROBES = 10  # Lists scanned per ivfflat query (recall vs latency)
+HNSW_EF_SEARCH = 40  # Candidate list size per hnsw query (recall vs latency)
+EXACT_SEARCH_MAX_CHUNKS = 5000  # Sessions up to this many chunks are scanned exactly instead of through the shared index
+
+# Hybrid retrieval settings
+TEXT_SEARCH_CONFIG = "english"  # Postgres text search configuration of document_chunks.content_tsv
+HYBRID_VECTOR_WEIGHT = 1.0  # Weight of the vector ranking in reciprocal rank fusion
+HYBRID_LEXICAL_WEIGHT = 1.0  # Weight of the full-text ranking, 0 for vector-only retrieval
+HYBRID_CANDIDATES = 20  # Candidates taken from each ranking before fusion
+RRF_K = 60  # Reciprocal rank fusion constant, higher flattens the contribution of top ranks
 
 # Chat defaults
 TEMPERATURE = 0.1
@@ -37,8 +92,19 @@ SYSTEM_PROMPT = """You are a helpful AI assistant. When answering questions:
 3. For numerical data, specify the source file and relevant details
 4. If analyzing spreadsheets or CSV data, explain your interpretation
 5. Maintain the original formatting when quoting text"""
-SIMILARITY_THRESHOLD = 0.7
-MAX_HISTORY = 10
+SIMILARITY_THRESHOLD = 0.5  # Minimum similarity of vector matches used as context
+MAX_HISTORY = 10  # Latest messages sent with each prompt
+PAGE_SIZE = 50  # Default page size of session and message listings
+MAX_PAGE_SIZE = 200
+IN_MEMORY_SEARCH_ENABLED = False  # Search small sessions with NumPy in process instead of pgvector
+IN_MEMORY_SEARCH_MAX_CHUNKS = 2000  # Larger sessions are always searched with pgvector
+IN_MEMORY_SEARCH_MAX_SESSIONS = 100  # Sessions held in the in-process LRU
+IN_MEMORY_SEARCH_MMAP_DIR = ""  # Directory to memory-map session matrices from, empty keeps them on the heap
+
+RESPONSE_CACHE_ENABLED = False  # Reuse answers to near-identical questions over the same documents
+RESPONSE_CACHE_MAX_ENTRIES = 1000  # In-process LRU entries
+RESPONSE_CACHE_TTL = 3600  # Seconds before a cached answer expires
+RESPONSE_CACHE_RADIUS = 0.05  # Max cosine distance between question embeddings for a hit
 
 # Supported file types
 SUPPORTED_FILE_TYPES = {
@@ -58,20 +124,67 @@ settings = Settings(
     API_V1_STR=API_V1_STR,
     PROJECT_NAME=PROJECT_NAME,
     VERSION=VERSION,
+    DB_POOL_SIZE=DB_POOL_SIZE,
+    DB_MAX_OVERFLOW=DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT=DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE=DB_POOL_RECYCLE,
     GEMINI_MODEL=GEMINI_MODEL,
     EMBEDDING_MODEL=EMBEDDING_MODEL,
+    EMBEDDING_MODEL_DIMENSIONS=EMBEDDING_MODEL_DIMENSIONS,
     EMBEDDING_DIMENSIONS=EMBEDDING_DIMENSIONS,
     CHUNK_SIZE=CHUNK_SIZE,
     CHUNK_OVERLAP=CHUNK_OVERLAP,
     MAX_CHUNKS_PER_DOC=MAX_CHUNKS_PER_DOC,
     SIMILARITY_TOP_K=SIMILARITY_TOP_K,
     EMBEDDING_BATCH_SIZE=EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY=EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_CACHE_ENABLED=EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MEMORY_SIZE=EMBEDDING_CACHE_MEMORY_SIZE,
+    EMBEDDING_CACHE_DTYPE=EMBEDDING_CACHE_DTYPE,
     MAX_FILE_SIZE=MAX_FILE_SIZE,
+    UPLOAD_CHUNK_SIZE=UPLOAD_CHUNK_SIZE,
+    UPLOAD_SPOOL_SIZE=UPLOAD_SPOOL_SIZE,
+    PARSER_WORKERS=PARSER_WORKERS,
+    PDF_PAGES_PER_SHARD=PDF_PAGES_PER_SHARD,
+    TABLE_ROWS_PER_READ=TABLE_ROWS_PER_READ,
+    TABLE_CHUNK_SIZE=TABLE_CHUNK_SIZE,
+    INGEST_WORKERS=INGEST_WORKERS,
+    INGEST_BATCH_SIZE=INGEST_BATCH_SIZE,
+    INGEST_PIPELINE_DEPTH=INGEST_PIPELINE_DEPTH,
+    INGEST_QUEUE_SIZE=INGEST_QUEUE_SIZE,
+    INGEST_JOB_RETENTION=INGEST_JOB_RETENTION,
+    DEDUP_NEAR_DUPLICATE_CHUNKS=DEDUP_NEAR_DUPLICATE_CHUNKS,
+    DEDUP_SIMHASH_DISTANCE=DEDUP_SIMHASH_DISTANCE,
+    VECTOR_DISTANCE_METRIC=VECTOR_DISTANCE_METRIC,
+    VECTOR_INDEX_TYPE=VECTOR_INDEX_TYPE,
+    VECTOR_QUANTIZATION=VECTOR_QUANTIZATION,
+    VECTOR_RERANK_CANDIDATES=VECTOR_RERANK_CANDIDATES,
+    HNSW_M=HNSW_M,
+    HNSW_EF_CONSTRUCTION=HNSW_EF_CONSTRUCTION,
+    IVFFLAT_LISTS=IVFFLAT_LISTS,
+    IVFFLAT_PROBES=IVFFLAT_PROBES,
+    HNSW_EF_SEARCH=HNSW_EF_SEARCH,
+    EXACT_SEARCH_MAX_CHUNKS=EXACT_SEARCH_MAX_CHUNKS,
+    TEXT_SEARCH_CONFIG=TEXT_SEARCH_CONFIG,
+    HYBRID_VECTOR_WEIGHT=HYBRID_VECTOR_WEIGHT,
+    HYBRID_LEXICAL_WEIGHT=HYBRID_LEXICAL_WEIGHT,
+    HYBRID_CANDIDATES=HYBRID_CANDIDATES,
+    RRF_K=RRF_K,
     TEMPERATURE=TEMPERATURE,
     MAX_TOKENS=MAX_TOKENS,
     SYSTEM_PROMPT=SYSTEM_PROMPT,
     SIMILARITY_THRESHOLD=SIMILARITY_THRESHOLD,
     MAX_HISTORY=MAX_HISTORY,
+    PAGE_SIZE=PAGE_SIZE,
+    MAX_PAGE_SIZE=MAX_PAGE_SIZE,
+    IN_MEMORY_SEARCH_ENABLED=IN_MEMORY_SEARCH_ENABLED,
+    IN_MEMORY_SEARCH_MAX_CHUNKS=IN_MEMORY_SEARCH_MAX_CHUNKS,
+    IN_MEMORY_SEARCH_MAX_SESSIONS=IN_MEMORY_SEARCH_MAX_SESSIONS,
+    IN_MEMORY_SEARCH_MMAP_DIR=IN_MEMORY_SEARCH_MMAP_DIR,
+    RESPONSE_CACHE_ENABLED=RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ENTRIES=RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL=RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_RADIUS=RESPONSE_CACHE_RADIUS,
     BACKEND_CORS_ORIGINS=BACKEND_CORS_ORIGINS,
     SUPPORTED_FILE_TYPES=SUPPORTED_FILE_TYPES,
     LOG_FORMAT=LOG_FORMAT,
@@ -79,5 +192,15 @@ settings = Settings(
     MAX_RPM=MAX_RPM,
     MAX_TPM=MAX_TPM,
     MAX_CHUNK_TOKENS=MAX_CHUNK_TOKENS,
-    EMBEDDING_MAX_RPM=EMBEDDING_MAX_RPM
+    EMBEDDING_MAX_RPM=EMBEDDING_MAX_RPM,
+    LLM_MAX_ATTEMPTS=LLM_MAX_ATTEMPTS,
+    LLM_RETRY_BASE_DELAY=LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY=LLM_RETRY_MAX_DELAY,
+    LLM_CIRCUIT_FAILURE_THRESHOLD=LLM_CIRCUIT_FAILURE_THRESHOLD,
+    LLM_CIRCUIT_RESET_TIMEOUT=LLM_CIRCUIT_RESET_TIMEOUT,
+    LLM_TIMEOUT=LLM_TIMEOUT,
+    EMBEDDING_TIMEOUT=EMBEDDING_TIMEOUT,
+    CHAT_TURN_BUDGET=CHAT_TURN_BUDGET,
+    EMBEDDING_HEDGE_ENABLED=EMBEDDING_HEDGE_ENABLED,
+    EMBEDDING_HEDGE_DELAY=EMBEDDING_HEDGE_DELAY
 ) 
\ No newline at end of file
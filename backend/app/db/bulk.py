@@ -0,0 +1,83 @@
+"""Bulk writes of document chunks with binary COPY.
+
+Rows are encoded straight into PostgreSQL's binary COPY format, with embeddings
+packed from float32 arrays into pgvector's binary representation, and streamed
+through asyncpg's copy_to_table on the session's own connection (so the rows
+commit with the surrounding transaction). Nothing goes through the ORM or the
+text form of vectors.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+import numpy as np
+import io
+import json
+import struct
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_COLUMNS = ("id", "document_id", "chunk_index", "content", "embedding", "simhash", "meta_info")
+
+# (document_id, chunk_index, content, embedding, simhash, meta_info), simhash a signed
+# 64-bit value or None, meta_info a JSON-serialisable dict or None
+ChunkRow = Tuple[uuid.UUID, int, str, Sequence[float], Optional[int], Optional[Dict[str, Any]]]
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+
+_field_count = struct.pack("!h", len(CHUNK_COLUMNS))
+_uuid_field = struct.Struct("!i16s")
+_int_field = struct.Struct("!ii")
+_bigint_field = struct.Struct("!iq")
+_null_field = struct.pack("!i", -1)
+
+def encode_vector(embedding: Sequence[float]) -> bytes:
+    """pgvector binary format: int16 dimensions, int16 unused, big-endian float4 values"""
+    values = np.asarray(embedding, dtype=">f4")
+    return struct.pack("!hh", values.shape[0], 0) + values.tobytes()
+
+def encode_jsonb(value: Dict[str, Any]) -> bytes:
+    """jsonb binary format: version 1, then the JSON text"""
+    return b"\x01" + json.dumps(value).encode("utf-8")
+
+def encode_chunk_rows(rows: Iterable[ChunkRow]) -> bytes:
+    """Binary COPY payload for `rows`, columns in CHUNK_COLUMNS order"""
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    for document_id, chunk_index, content, embedding, simhash, meta_info in rows:
+        text = content.encode("utf-8")
+        vector = encode_vector(embedding)
+        buffer.write(_field_count)
+        buffer.write(_uuid_field.pack(16, uuid.uuid4().bytes))
+        buffer.write(_uuid_field.pack(16, document_id.bytes))
+        buffer.write(_int_field.pack(4, chunk_index))
+        buffer.write(struct.pack("!i", len(text)))
+        buffer.write(text)
+        buffer.write(struct.pack("!i", len(vector)))
+        buffer.write(vector)
+        buffer.write(_null_field if simhash is None else _bigint_field.pack(8, simhash))
+        if meta_info is None:
+            buffer.write(_null_field)
+        else:
+            meta = encode_jsonb(meta_info)
+            buffer.write(struct.pack("!i", len(meta)))
+            buffer.write(meta)
+    buffer.write(COPY_TRAILER)
+    return buffer.getvalue()
+
+async def copy_chunks(db: AsyncSession, rows: List[ChunkRow], table: str = "document_chunks") -> int:
+    """COPY `rows` into `table` within the session's current transaction"""
+    if not rows:
+        return 0
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    payload = encode_chunk_rows(rows)
+    await raw.driver_connection.copy_to_table(
+        table,
+        source=io.BytesIO(payload),
+        columns=list(CHUNK_COLUMNS),
+        format="binary"
+    )
+    logger.debug(f"Copied {len(rows)} chunks ({len(payload)} bytes) into {table}")
+    return len(rows)
@@ -0,0 +1,146 @@
+"""Resize stored chunk embeddings to EMBEDDING_DIMENSIONS.
+
+New vectors are written to a staging column in id order, batch by batch, so an
+interrupted run resumes where it stopped. The staging column is then swapped in
+and the embedding index rebuilt for the new size.
+
+With --source stored (the default) the stored vectors are truncated and
+re-normalised. For Matryoshka models such as text-embedding-004, that is the
+vector the API returns at the smaller size, so no API calls are made, but it
+can only go down in size. --source api embeds the chunk content again.
+
+Stop ingestion while it runs: new chunks would not fit the old column.
+
+Admin entry point:
+    python -m app.db.embedding_migration [--source stored|api] [--batch-size 500]
+"""
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.engine import Engine
+from pgvector.sqlalchemy import Vector
+from app.core.settings import settings
+from .vector_index import INDEX_NAME, rebuild_index
+import argparse
+import asyncio
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+STAGING_COLUMN = "embedding_resized"
+
+Embed = Callable[[List[str]], List[List[float]]]
+
+def column_dimensions(conn, column: str = "embedding") -> Optional[int]:
+    """Declared size of a vector column of document_chunks, None if it does not exist"""
+    typmod = conn.execute(
+        text("""
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'document_chunks'::regclass AND attname = :column AND NOT attisdropped
+        """),
+        {"column": column}
+    ).scalar()
+    return typmod if typmod and typmod > 0 else None
+
+def migrate_embeddings(engine: Engine, embed: Optional[Embed] = None, batch_size: int = 500) -> Dict[str, Any]:
+    """Resize document_chunks.embedding to EMBEDDING_DIMENSIONS.
+
+    Vectors come from `embed(contents)` when given, otherwise from truncating the
+    stored ones. Returns the old and new sizes and the number of chunks written.
+    """
+    # Imported here, the service layer is not needed by the rest of app.db
+    from app.services.embeddings_service import reduce_dimensions
+
+    dimensions = settings.EMBEDDING_DIMENSIONS
+    with engine.connect() as conn:
+        current = column_dimensions(conn)
+        if current == dimensions:
+            logger.info(f"document_chunks.embedding already has {dimensions} dimensions")
+            return {"from": current, "to": dimensions, "chunks": 0}
+        if embed is None and current is not None and current < dimensions:
+            raise ValueError(
+                f"Stored embeddings have {current} dimensions, they cannot be truncated to {dimensions}. "
+                "Re-embed the chunks with --source api."
+            )
+        if column_dimensions(conn, STAGING_COLUMN) not in (None, dimensions):
+            # Left behind by an interrupted run for another size
+            conn.execute(text(f"ALTER TABLE document_chunks DROP COLUMN {STAGING_COLUMN}"))
+        conn.execute(text(f"ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS {STAGING_COLUMN} vector({dimensions})"))
+        conn.commit()
+
+        select_batch = text(f"""
+            SELECT id, content, embedding FROM document_chunks
+            WHERE id > :after AND embedding IS NOT NULL AND {STAGING_COLUMN} IS NULL
+            ORDER BY id
+            LIMIT :limit
+        """).columns(id=UUID(as_uuid=True), embedding=Vector())
+        update = text(f"UPDATE document_chunks SET {STAGING_COLUMN} = :embedding WHERE id = :id").bindparams(
+            bindparam("embedding", type_=Vector(dimensions)),
+            bindparam("id", type_=UUID(as_uuid=True))
+        )
+
+        started = time.perf_counter()
+        migrated = 0
+        after = "00000000-0000-0000-0000-000000000000"
+        while True:
+            rows = conn.execute(select_batch, {"after": after, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            if embed is not None:
+                vectors = embed([row.content for row in rows])
+            else:
+                vectors = [reduce_dimensions(row.embedding.tolist(), dimensions) for row in rows]
+            if len(vectors) != len(rows):
+                raise RuntimeError(f"Expected {len(rows)} embeddings, got {len(vectors)}")
+            conn.execute(update, [{"id": row.id, "embedding": vector} for row, vector in zip(rows, vectors)])
+            conn.commit()
+            migrated += len(rows)
+            after = str(rows[-1].id)
+            logger.info(f"Resized {migrated} chunk embeddings to {dimensions} dimensions")
+
+        # Swap in one transaction, with writers locked out
+        conn.execute(text("LOCK TABLE document_chunks IN ACCESS EXCLUSIVE MODE"))
+        left = conn.execute(text(
+            f"SELECT count(*) FROM document_chunks WHERE embedding IS NOT NULL AND {STAGING_COLUMN} IS NULL"
+        )).scalar()
+        if left:
+            conn.rollback()
+            raise RuntimeError(f"{left} chunks were added during the migration, stop ingestion and run it again")
+        conn.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+        conn.execute(text("ALTER TABLE document_chunks DROP COLUMN embedding"))
+        conn.execute(text(f"ALTER TABLE document_chunks RENAME COLUMN {STAGING_COLUMN} TO embedding"))
+        conn.commit()
+        seconds = time.perf_counter() - started
+
+    logger.info(f"Resized {migrated} chunk embeddings from {current} to {dimensions} dimensions in {seconds:.2f}s")
+    return {
+        "from": current,
+        "to": dimensions,
+        "chunks": migrated,
+        "seconds": round(seconds, 3),
+        "index": rebuild_index(engine)
+    }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Resize stored chunk embeddings to EMBEDDING_DIMENSIONS")
+    parser.add_argument("--source", choices=["stored", "api"], default="stored",
+                        help="Truncate the stored vectors, or embed the chunk content again")
+    parser.add_argument("--batch-size", type=int, default=500, help="Chunks written per transaction")
+    args = parser.parse_args(argv)
+
+    embed = None
+    if args.source == "api":
+        from app.services.embeddings_service import GeminiEmbeddings
+
+        # One loop for every batch, the rate limiter and semaphores are bound to it
+        loop = asyncio.new_event_loop()
+        embeddings = GeminiEmbeddings()
+        embed = lambda contents: loop.run_until_complete(embeddings.aembed_documents(contents))
+    print(json.dumps(migrate_embeddings(engine, embed, args.batch_size), indent=2))
+
+if __name__ == "__main__":
+    main()
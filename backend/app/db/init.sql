@@ -39,21 +39,52 @@ CREATE TABLE IF NOT EXISTS documents (
     filename VARCHAR NOT NULL,
     file_type VARCHAR NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    meta_info JSONB
+    meta_info JSONB,
+    content_hash VARCHAR(64),
+    text_hash VARCHAR(64)
 );
 
 CREATE TABLE IF NOT EXISTS document_chunks (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     document_id UUID REFERENCES documents(id) ON DELETE CASCADE,
     content TEXT NOT NULL,
-    embedding vector(768),
+    embedding vector(768),  -- EMBEDDING_DIMENSIONS, change with python -m app.db.embedding_migration
     chunk_index INTEGER,
+    simhash BIGINT,
     meta_info JSONB,
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed cache of embeddings, keyed by model, task type and sha256 of the text
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    model VARCHAR NOT NULL,
+    task_type VARCHAR NOT NULL,
+    text_hash VARCHAR(64) NOT NULL,
+    embedding BYTEA NOT NULL,
+    dtype VARCHAR NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, task_type, text_hash)
+);
+
 -- Create index on embeddings for similarity search
-CREATE INDEX ON document_chunks USING ivfflat (embedding vector_cosine_ops);
+-- (operator class must match VECTOR_DISTANCE_METRIC, searches use the <=> cosine operator).
+-- HNSW needs no training data, so it can be built on the empty table. To switch type or
+-- parameters later, run: python -m app.db.vector_index rebuild
+CREATE INDEX idx_document_chunks_embedding ON document_chunks USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+-- Full-text index for the lexical half of hybrid retrieval
+CREATE INDEX idx_document_chunks_content_tsv ON document_chunks USING gin (content_tsv);
+
+-- Add index for faster document lookup, unique per position so resumed ingestion skips stored chunks
+CREATE UNIQUE INDEX idx_document_chunks_document_chunk ON document_chunks(document_id, chunk_index);
+
+-- Add index for session-scoped retrieval
+CREATE INDEX idx_documents_session_id ON documents(session_id);
+
+-- Lookup of an already indexed copy of an uploaded file
+CREATE INDEX idx_documents_content_hash ON documents(content_hash);
 
--- Add index for faster document lookup
-CREATE INDEX idx_document_chunks_document_id ON document_chunks(document_id);
\ No newline at end of file
+-- Keyset pagination on (created_at, id) and the latest messages of a session
+CREATE INDEX idx_chat_sessions_user_created ON chat_sessions(user_id, created_at, id);
+CREATE INDEX idx_chat_messages_session_created ON chat_messages(session_id, created_at, id);
\ No newline at end of file
@@ -1,12 +1,14 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Enum, Text, JSON, Boolean
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
-from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, BigInteger, Enum, Text, JSON, Boolean, Index, LargeBinary, Computed
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR, JSONB
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.sql import func, text
 from datetime import datetime
 import uuid
 from .database import Base
+from .vector_index import INDEX_NAME, index_expression, index_params
 from ..schemas.models import MessageRole
 from pgvector.sqlalchemy import Vector
+from app.core.settings import settings
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
@@ -21,6 +23,11 @@ class ChatSession(Base):
     messages = relationship("ChatMessage", back_populates="session")
     documents = relationship("Document", back_populates="session")
 
+    __table_args__ = (
+        # Keyset pagination of a user's sessions, newest first
+        Index("idx_chat_sessions_user_created", "user_id", "created_at", "id"),
+    )
+
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
 
@@ -33,27 +40,69 @@ class ChatMessage(Base):
     
     session = relationship("ChatSession", back_populates="messages")
 
+    __table_args__ = (
+        # Latest messages of a session, for the prompt history and keyset pagination
+        Index("idx_chat_messages_session_created", "session_id", "created_at", "id"),
+    )
+
 class Document(Base):
     __tablename__ = "documents"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id"))
+    session_id = Column(UUID(as_uuid=True), ForeignKey("chat_sessions.id"), index=True)
     filename = Column(String)  # Keep track of source file
     file_type = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     meta_info = Column(JSON)
+    content_hash = Column(String(64), nullable=True)  # sha256 hex of the uploaded bytes
+    text_hash = Column(String(64), nullable=True)  # sha256 hex of the normalised extracted text
     
     session = relationship("ChatSession", back_populates="documents")
     chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete")
 
+    __table_args__ = (
+        # Uploads of a file that is already indexed reuse its document or its chunks
+        Index("idx_documents_content_hash", "content_hash"),
+    )
+
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"))
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(768))
+    embedding = Column(Vector(settings.EMBEDDING_DIMENSIONS))  # Resized with python -m app.db.embedding_migration
     chunk_index = Column(Integer)
+    simhash = Column(BigInteger, nullable=True)  # 64-bit SimHash of the content, for near-duplicate detection
+    meta_info = Column(JSONB, nullable=True)  # Sheet and row range of table chunks, JSONB as in init.sql for binary COPY
+    # Full-text index of the content for lexical retrieval, maintained by Postgres
+    content_tsv = deferred(Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{settings.TEXT_SEARCH_CONFIG}', content)", persisted=True)
+    ))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
-    document = relationship("Document", back_populates="chunks") 
\ No newline at end of file
+    document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        # One row per position, lets a resumed ingestion skip chunks that are already stored
+        Index("idx_document_chunks_document_chunk", "document_id", "chunk_index", unique=True),
+        Index("idx_document_chunks_content_tsv", "content_tsv", postgresql_using="gin"),
+        # Operator class must match the operator used in similarity search, or the planner ignores the index
+        Index(
+            INDEX_NAME,
+            text(index_expression()),
+            postgresql_using=settings.VECTOR_INDEX_TYPE,
+            postgresql_with=index_params()
+        ),
+    ) 
+
+class EmbeddingCache(Base):
+    __tablename__ = "embedding_cache"
+
+    model = Column(String, primary_key=True)
+    task_type = Column(String, primary_key=True)
+    text_hash = Column(String(64), primary_key=True)  # sha256 hex of the embedded text
+    embedding = Column(LargeBinary, nullable=False)  # Packed float32/float16 values
+    dtype = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,341 @@
+"""pgvector index management and search helpers for document_chunks.embedding.
+
+With VECTOR_QUANTIZATION set, the index is built on a compact expression of the
+column, halfvec (2 bytes per dimension) or binary_quantize (1 bit per dimension),
+and searches re-rank the VECTOR_RERANK_CANDIDATES it returns by exact distance on
+the full-precision column. Both need pgvector 0.7.0 or later.
+
+Admin entry point:
+    python -m app.db.vector_index report [--sample 50] [--k 10]
+    python -m app.db.vector_index rebuild [--type hnsw|ivfflat]
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import BindParameter, TextClause
+from sqlalchemy.orm import Session
+from app.core.settings import settings
+import argparse
+import json
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "idx_document_chunks_embedding"
+INDEX_TYPES = ("hnsw", "ivfflat")
+# Upper bounds of the hnsw.ef_search and ivfflat.probes settings
+MAX_HNSW_EF_SEARCH = 1000
+MAX_IVFFLAT_PROBES = 32768
+
+# Distance metric -> (pgvector operator, operator class the index must be built with)
+DISTANCE_OPERATORS = {
+    "cosine": ("<=>", "vector_cosine_ops"),
+    "l2": ("<->", "vector_l2_ops"),
+    "inner_product": ("<#>", "vector_ip_ops"),
+}
+
+QUANTIZATIONS = ("none", "halfvec", "binary")
+
+# Distance metric -> halfvec operator class, the operators are the same as for vector
+HALFVEC_OPERATOR_CLASSES = {
+    "cosine": "halfvec_cosine_ops",
+    "l2": "halfvec_l2_ops",
+    "inner_product": "halfvec_ip_ops",
+}
+
+# First pgvector release with halfvec, bit indexing and binary_quantize
+QUANTIZATION_MIN_VERSION = (0, 7, 0)
+
+def _resolve_metric(metric: Optional[str]) -> str:
+    metric = metric or settings.VECTOR_DISTANCE_METRIC
+    if metric not in DISTANCE_OPERATORS:
+        raise ValueError(f"Unsupported distance metric: {metric}. Supported: {', '.join(DISTANCE_OPERATORS)}")
+    return metric
+
+def distance_operator(metric: Optional[str] = None) -> str:
+    """SQL operator for the configured metric, so ORDER BY matches the index"""
+    return DISTANCE_OPERATORS[_resolve_metric(metric)][0]
+
+def operator_class(metric: Optional[str] = None) -> str:
+    """Operator class the embedding index is built with for the configured metric"""
+    return DISTANCE_OPERATORS[_resolve_metric(metric)][1]
+
+def _resolve_quantization(quantization: Optional[str]) -> str:
+    quantization = quantization or settings.VECTOR_QUANTIZATION
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unsupported vector quantization: {quantization}. Supported: {', '.join(QUANTIZATIONS)}")
+    return quantization
+
+def index_expression(quantization: Optional[str] = None) -> str:
+    """Indexed expression and operator class, the column itself unless quantised"""
+    quantization = _resolve_quantization(quantization)
+    dimensions = settings.EMBEDDING_DIMENSIONS
+    if quantization == "halfvec":
+        return f"(embedding::halfvec({dimensions})) {HALFVEC_OPERATOR_CLASSES[_resolve_metric(None)]}"
+    if quantization == "binary":
+        return f"(binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops"
+    return f"embedding {operator_class()}"
+
+def quantized_order(query: str = ":query_embedding", column: str = "c.embedding", quantization: Optional[str] = None) -> Optional[str]:
+    """ORDER BY expression that walks a quantised index, None when the index is on the column itself.
+    Candidates found with it are re-ranked by the exact distance."""
+    quantization = _resolve_quantization(quantization)
+    dimensions = settings.EMBEDDING_DIMENSIONS
+    if quantization == "halfvec":
+        return f"({column}::halfvec({dimensions})) {distance_operator()} CAST({query} AS halfvec({dimensions}))"
+    if quantization == "binary":
+        return f"(binary_quantize({column})::bit({dimensions})) <~> binary_quantize(CAST({query} AS vector({dimensions})))"
+    return None
+
+def rerank_candidates(limit: int) -> int:
+    """Rows taken from a quantised index for the exact re-rank, at least `limit`"""
+    return max(settings.VECTOR_RERANK_CANDIDATES, limit)
+
+def pgvector_version(conn) -> Tuple[int, ...]:
+    version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(part) for part in version.split(".")) if version else ()
+
+def check_quantization_support(conn, quantization: Optional[str] = None) -> None:
+    """Raise if the server's pgvector cannot build the configured quantised index"""
+    quantization = _resolve_quantization(quantization)
+    if quantization == "none":
+        return
+    version = pgvector_version(conn)
+    if version < QUANTIZATION_MIN_VERSION:
+        installed = ".".join(map(str, version)) or "not installed"
+        raise RuntimeError(
+            f"VECTOR_QUANTIZATION={quantization} needs pgvector {'.'.join(map(str, QUANTIZATION_MIN_VERSION))} "
+            f"or later, the server has {installed}. Upgrade the extension (ALTER EXTENSION vector UPDATE) first."
+        )
+
+def similarity_to_distance(similarity: float, metric: Optional[str] = None) -> float:
+    """Distance cutoff for a similarity threshold, as returned by the metric's operator.
+
+    Similarity is 1 - distance for cosine, the inner product for inner_product (the
+    <#> operator returns its negation) and 1 / (1 + distance) for l2.
+    """
+    metric = _resolve_metric(metric)
+    if metric == "cosine":
+        return 1 - similarity
+    if metric == "inner_product":
+        return -similarity
+    return 1 / similarity - 1 if similarity > 0 else math.inf
+
+def _resolve_index_type(index_type: Optional[str]) -> str:
+    index_type = index_type or settings.VECTOR_INDEX_TYPE
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported vector index type: {index_type}. Supported: {', '.join(INDEX_TYPES)}")
+    return index_type
+
+def ivfflat_lists(row_count: int) -> int:
+    """Lists for an ivfflat build: the configured value, or pgvector's guidance
+    (rows / 1000 up to 1M rows, sqrt(rows) beyond) when IVFFLAT_LISTS is 0"""
+    if settings.IVFFLAT_LISTS:
+        return settings.IVFFLAT_LISTS
+    if row_count <= 1_000_000:
+        return max(row_count // 1000, 1)
+    return int(math.sqrt(row_count))
+
+def index_params(index_type: Optional[str] = None, row_count: int = 0) -> Dict[str, int]:
+    """WITH (...) storage parameters for the configured index type"""
+    if _resolve_index_type(index_type) == "hnsw":
+        return {"m": settings.HNSW_M, "ef_construction": settings.HNSW_EF_CONSTRUCTION}
+    return {"lists": ivfflat_lists(row_count)}
+
+def create_index_sql(name: str = INDEX_NAME, index_type: Optional[str] = None, row_count: int = 0, concurrently: bool = False) -> str:
+    index_type = _resolve_index_type(index_type)
+    params = ", ".join(f"{key} = {value}" for key, value in index_params(index_type, row_count).items())
+    return (
+        f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} ON document_chunks "
+        f"USING {index_type} ({index_expression()}) WITH ({params})"
+    )
+
+def rebuild_index(engine: Engine, index_type: Optional[str] = None) -> Dict[str, Any]:
+    """Rebuild the embedding index online.
+
+    Builds a new index with CREATE INDEX CONCURRENTLY under a temporary name, then
+    swaps the names in one transaction, so reads and ingestion keep running and
+    always have an index. The old one is dropped afterwards. ivfflat lists are sized from
+    the rows present now, which is the point of rebuilding after data has grown.
+    Switching VECTOR_QUANTIZATION on or off is a rebuild too, the column is unchanged.
+    """
+    index_type = _resolve_index_type(index_type)
+    new_name = f"{INDEX_NAME}_new"
+    old_name = f"{INDEX_NAME}_old"
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        check_quantization_support(conn)
+        row_count = conn.execute(text("SELECT count(*) FROM document_chunks")).scalar()
+        # Left behind by an interrupted rebuild
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"))
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {old_name}"))
+
+        logger.info(f"Building {index_type} index on {row_count} chunks")
+        started = time.perf_counter()
+        conn.execute(text(create_index_sql(new_name, index_type, row_count, concurrently=True)))
+        build_seconds = time.perf_counter() - started
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER INDEX IF EXISTS {INDEX_NAME} RENAME TO {old_name}"))
+        conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {INDEX_NAME}"))
+
+    # A plain DROP INDEX in the swap would lock the table until running queries finish
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {old_name}"))
+    logger.info(f"Rebuilt {INDEX_NAME} as {index_type} ({settings.VECTOR_QUANTIZATION}) in {build_seconds:.2f}s")
+    return {
+        "index_type": index_type,
+        "quantization": settings.VECTOR_QUANTIZATION,
+        "params": index_params(index_type, row_count),
+        "rows": row_count,
+        "build_seconds": round(build_seconds, 3)
+    }
+
+def index_stats(db: Session) -> Dict[str, Any]:
+    """Definition and on-disk size of the embedding index"""
+    row = db.execute(
+        text("""
+        SELECT i.indexdef, pg_relation_size(to_regclass(:name)) AS size_bytes
+        FROM pg_indexes i
+        WHERE i.tablename = 'document_chunks' AND i.indexname = :name
+        """),
+        {"name": INDEX_NAME}
+    ).first()
+    if not row:
+        return {"index": INDEX_NAME, "exists": False}
+    return {
+        "index": INDEX_NAME,
+        "exists": True,
+        "definition": row.indexdef,
+        "size_bytes": row.size_bytes,
+        "size_mb": round(row.size_bytes / 1024 / 1024, 2)
+    }
+
+def measure_recall(db: Session, sample_size: int = 50, k: int = 10) -> Dict[str, Any]:
+    """Recall@k of the index (with the re-rank when quantised) against an exact scan,
+    using stored chunk embeddings as queries"""
+    operator = distance_operator()
+    queries = db.execute(
+        text("SELECT embedding FROM document_chunks WHERE embedding IS NOT NULL ORDER BY random() LIMIT :n"),
+        {"n": sample_size}
+    ).scalars().all()
+    exact_k = text(f"""
+        SELECT id FROM document_chunks
+        ORDER BY embedding {operator} CAST(:query AS vector)
+        LIMIT :k
+    """)
+    quantized = quantized_order(":query", column="embedding")
+    ann_k = exact_k if quantized is None else text(f"""
+        SELECT id FROM (
+            SELECT id, embedding {operator} CAST(:query AS vector) AS distance
+            FROM document_chunks
+            ORDER BY {quantized}
+            LIMIT :candidates
+        ) candidates
+        ORDER BY distance
+        LIMIT :k
+    """)
+    search_limit = k if quantized is None else rerank_candidates(k)
+
+    hits = 0
+    ann_seconds = exact_seconds = 0.0
+    for query in queries:
+        params = {"query": query if isinstance(query, str) else str(list(map(float, query))), "k": k, "candidates": search_limit}
+
+        apply_search_tuning(db, search_limit)
+        started = time.perf_counter()
+        ann_ids = set(db.execute(ann_k, params).scalars())
+        ann_seconds += time.perf_counter() - started
+        db.rollback()
+
+        db.execute(text("SET LOCAL enable_indexscan = off"))
+        started = time.perf_counter()
+        exact_ids = set(db.execute(exact_k, params).scalars())
+        exact_seconds += time.perf_counter() - started
+        db.rollback()
+
+        hits += len(ann_ids & exact_ids) / max(len(exact_ids), 1)
+
+    n = len(queries)
+    return {
+        "queries": n,
+        "k": k,
+        "recall": round(hits / n, 4) if n else None,
+        "ann_avg_ms": round(ann_seconds / n * 1000, 2) if n else None,
+        "exact_avg_ms": round(exact_seconds / n * 1000, 2) if n else None
+    }
+
+def search_tuning(
+    limit: int,
+    probes: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    scope_rows: Optional[str] = None
+) -> Tuple[TextClause, Dict[str, int]]:
+    """Statement and params setting ivfflat/hnsw search parameters for the current transaction only.
+
+    set_config(..., true) behaves like SET LOCAL, and unlike SET it accepts bind
+    parameters. ef_search is raised to at least `limit`, otherwise hnsw can never
+    return a full page of results. The index is shared by every session and a
+    filter only applies to the rows it returns, so with `scope_rows`, a query
+    counting the rows the search is filtered to, both are multiplied by the table
+    size over that count (up to what pgvector accepts). The statement returns the
+    count as `rows`, with the values set. Returned unexecuted so sync and async
+    sessions can share it.
+    """
+    if scope_rows is None:
+        rows, scale = "NULL::bigint", "1"
+    else:
+        # reltuples is an estimate, -1 before the table is first analyzed
+        rows = f"({scope_rows})"
+        scale = "greatest((SELECT reltuples FROM pg_class WHERE oid = 'document_chunks'::regclass) / greatest(scope.rows, 1), 1)"
+    return (
+        text(f"""
+        SELECT scope.rows,
+               set_config('ivfflat.probes', least(ceil(:probes * {scale}), {MAX_IVFFLAT_PROBES})::int::text, true) AS probes,
+               set_config('hnsw.ef_search', least(ceil(:ef_search * {scale}), {MAX_HNSW_EF_SEARCH})::int::text, true) AS ef_search
+        FROM (SELECT {rows} AS rows) scope
+        """),
+        {"probes": probes or settings.IVFFLAT_PROBES, "ef_search": max(ef_search or settings.HNSW_EF_SEARCH, limit)}
+    )
+
+def apply_search_tuning(db: Session, limit: int, probes: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    db.execute(*search_tuning(limit, probes, ef_search))
+
+def explain_statement(sql: str, bindparams: List[BindParameter] = ()) -> TextClause:
+    """EXPLAIN wrapper for a statement, the plan is read without executing it"""
+    return text(f"EXPLAIN {sql}").bindparams(*bindparams)
+
+def uses_sequential_scan(plan: List[str], table: str = "document_chunks") -> bool:
+    """True if the plan falls back to a full scan of `table`"""
+    return any(f"Seq Scan on {table}" in line for line in plan)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from .database import engine, SessionLocal
+
+    parser = argparse.ArgumentParser(description="Manage the document_chunks embedding index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="Report index size and recall against an exact scan")
+    report_parser.add_argument("--sample", type=int, default=50, help="Stored embeddings to use as queries")
+    report_parser.add_argument("--k", type=int, default=10, help="Recall cutoff")
+    rebuild_parser = subparsers.add_parser("rebuild", help="Rebuild the index online with CREATE INDEX CONCURRENTLY")
+    rebuild_parser.add_argument("--type", choices=INDEX_TYPES, default=None, help="Index type (defaults to VECTOR_INDEX_TYPE)")
+    rebuild_parser.add_argument("--sample", type=int, default=50, help="Stored embeddings to use as queries")
+    rebuild_parser.add_argument("--k", type=int, default=10, help="Recall cutoff")
+    args = parser.parse_args(argv)
+
+    report: Dict[str, Any] = {}
+    if args.command == "rebuild":
+        report["build"] = rebuild_index(engine, args.type)
+
+    db = SessionLocal()
+    try:
+        report["index"] = index_stats(db)
+        report["recall"] = measure_recall(db, sample_size=args.sample, k=args.k)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
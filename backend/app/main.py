@@ -1,13 +1,36 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from .api import chat, ingest
 from app.core.settings import settings
 from app.core.logging import setup_logging
+from app.services.rate_limiter import llm_rate_limiter, embedding_rate_limiter
+from app.services.embedding_cache import embedding_cache
+from app.services.response_cache import response_cache
+from app.services.memory_search import memory_search
+from app.services.ingest_jobs import ingest_job_queue
+from app.services.parsers import shutdown_parser_pool
+from app.services.clients import ServiceClients
+from app.services.llm_service import llm_attempts, llm_circuit_breaker
+from app.services.embeddings_service import query_attempts
+from app.services.resilience import UpstreamError
+import math
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared by every request, only the database session is created per request
+    app.state.clients = ServiceClients()
+    ingest_job_queue.start(app.state.clients)
+    yield
+    await ingest_job_queue.stop()
+    shutdown_parser_pool()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=getattr(settings, 'VERSION'),
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -17,12 +40,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers with API version prefix
 app.include_router(chat.router, prefix=settings.API_V1_STR, tags=["chat"])
 app.include_router(ingest.router, prefix=settings.API_V1_STR, tags=["ingest"])
 
+@app.exception_handler(UpstreamError)
+async def upstream_error_handler(request: Request, exc: UpstreamError):
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
 # Setup logging
 setup_logging()
 
@@ -32,4 +61,19 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "rate_limiters": {
+            "llm": llm_rate_limiter.stats(),
+            "embedding": embedding_rate_limiter.stats()
+        },
+        "llm": {
+            "circuit": llm_circuit_breaker.stats(),
+            "attempts": llm_attempts.stats()
+        },
+        "embedding_queries": query_attempts.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "in_memory_search": memory_search.stats(),
+        "ingest_jobs": ingest_job_queue.stats()
+    }
\ No newline at end of file
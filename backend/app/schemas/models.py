@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -29,6 +29,15 @@ class DocumentResponse(BaseModel):
 # Chat schemas
 class ChatMessageCreate(BaseModel):
     content: str = Field(..., min_length=1)
+    # Retrieval weights for this message, settings defaults when omitted (lexical 0 = vector only)
+    vector_weight: Optional[float] = Field(None, ge=0)
+    lexical_weight: Optional[float] = Field(None, ge=0)
+
+    @model_validator(mode='after')
+    def check_weights(self):
+        if self.vector_weight == 0 and self.lexical_weight == 0:
+            raise ValueError('vector_weight and lexical_weight cannot both be 0')
+        return self
 
 class ChatMessageResponse(BaseModel):
     id: UUID
@@ -56,6 +65,31 @@ class ChatSessionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Ingestion job schemas
+class IngestJobStatus(str, Enum):
+    QUEUED = 'queued'
+    PARSING = 'parsing'
+    EMBEDDING = 'embedding'
+    INDEXED = 'indexed'
+    FAILED = 'failed'
+
+class IngestJobResponse(BaseModel):
+    id: UUID
+    session_id: str
+    filename: str
+    status: IngestJobStatus
+    document_id: Optional[UUID] = None
+    chunk_count: Optional[int] = None
+    size_bytes: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    chunks_per_second: Optional[float] = None
+
+    class Config:
+        from_attributes = True
+
 class LogLevel(str, Enum):
     INFO = 'info'
     WARNING = 'warning'
@@ -1,7 +1,14 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from sqlalchemy import select, true
+from sqlalchemy.orm import aliased, noload
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.llm_service import LLMService
 from app.services.document_service import DocumentService
+from app.services.context_builder import ContextBuilder
+from app.services.pagination import newest_first, page
+from app.services.resilience import UpstreamError, deadline_after, with_deadline
+from app.services.response_cache import CachedResponse, ResponseCache, response_cache
+from app.db.vector_index import similarity_to_distance
 from ..db.models import ChatSession, ChatMessage
 from ..schemas.models import MessageRole, ChatMessageResponse
 import uuid
@@ -12,11 +19,36 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+class ChatTurn:
+    """A user message and what is needed to answer it, saved together with the answer"""
+
+    def __init__(self, session: ChatSession, new_messages: List[ChatMessage], messages: List[dict]):
+        self.session = session
+        # Messages to save with the answer: the user message, after the system prompt of a new conversation
+        self.new_messages = new_messages
+        self.user_message = new_messages[-1]
+        self.messages = messages
+        self.used_chunks: List[dict] = []
+        self.document_ids: List[uuid.UUID] = []
+        self.query_embedding: Optional[List[float]] = None
+        # (vector weight, lexical weight, top k) the context is retrieved with, part of the cache key
+        self.retrieval: Optional[Tuple[float, float, int]] = None
+        self.cached: Optional[CachedResponse] = None
+
 class ChatService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: AsyncSession,
+        cache: Optional[ResponseCache] = None,
+        llm: Optional[LLMService] = None,
+        document_service: Optional[DocumentService] = None,
+        context_builder: Optional[ContextBuilder] = None
+    ):
         self.db = db
-        self.llm = LLMService()
-        self.document_service = DocumentService(db)
+        self.llm = llm or LLMService()
+        self.document_service = document_service or DocumentService(db)
+        self.context_builder = context_builder or ContextBuilder()
+        self.cache = cache or (response_cache if settings.RESPONSE_CACHE_ENABLED else None)
         self.max_history = settings.MAX_HISTORY
         self.temperature = settings.TEMPERATURE
         
@@ -26,136 +58,291 @@ class ChatService:
             title="New Chat"
         )
         self.db.add(session)
-        self.db.commit()
-        self.db.refresh(session)
+        await self.db.commit()
+        await self.db.refresh(session)
         logger.info(f"Chat session created for user_id: {user_id} with session_id: {session.id}")
         return session
 
-    def get_session(self, session_id: str) -> Optional[ChatSession]:
-        return self.db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    async def get_session(self, session_id: str) -> Optional[ChatSession]:
+        result = await self.db.execute(select(ChatSession).where(ChatSession.id == session_id))
+        return result.scalars().first()
+
+    async def get_user_sessions(self, user_id: str) -> List[ChatSession]:
+        return (await self.list_sessions(user_id, limit=None))[0]
 
-    def get_user_sessions(self, user_id: str) -> List[ChatSession]:
-        return self.db.query(ChatSession).filter(
+    async def list_sessions(
+        self,
+        user_id: str,
+        limit: Optional[int] = settings.PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[ChatSession], Optional[str]]:
+        """Visible sessions of a user, newest first, and the cursor of the next page"""
+        query = select(ChatSession).where(
             ChatSession.user_id == user_id,
             ChatSession.hidden == False
-        ).all()
+        ).options(noload(ChatSession.messages))
+        if limit is None:
+            query = query.order_by(ChatSession.created_at.desc(), ChatSession.id.desc())
+            return list((await self.db.execute(query)).scalars().all()), None
+        return page((await self.db.execute(newest_first(query, ChatSession, limit, cursor))).scalars().all(), limit)
+
+    async def get_chat_history(self, session_id: str, limit: int = None) -> List[ChatMessage]:
+        """The latest `limit` messages of a session (all when None), oldest first"""
+        query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        if not limit:
+            query = query.order_by(ChatMessage.created_at, ChatMessage.id)
+            return list((await self.db.execute(query)).scalars().all())
+        messages, _ = page((await self.db.execute(newest_first(query, ChatMessage, limit))).scalars().all(), limit)
+        return messages[::-1]
+
+    async def get_session_with_history(self, session_id: str, limit: int) -> Tuple[Optional[ChatSession], List[ChatMessage]]:
+        """A session and its latest `limit` messages oldest first, in one query"""
+        latest = (
+            select(ChatMessage)
+            .where(ChatMessage.session_id == ChatSession.id)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+            .limit(limit)
+            .lateral()
+        )
+        message = aliased(ChatMessage, latest)
+        rows = (await self.db.execute(
+            select(ChatSession, message)
+            .outerjoin(latest, true())
+            .where(ChatSession.id == session_id)
+            .options(noload(ChatSession.messages))
+        )).all()
+        if not rows:
+            return None, []
+        history = sorted((row[1] for row in rows if row[1] is not None), key=lambda msg: (msg.created_at, msg.id))
+        return rows[0][0], history
 
-    def get_chat_history(self, session_id: str, limit: int = None) -> List[ChatMessage]:
-        query = self.db.query(ChatMessage).filter(ChatMessage.session_id == session_id)
-        if limit:
-            query = query.limit(limit)
-        return query.all()
+    async def list_messages(
+        self,
+        session_id: str,
+        limit: int = settings.PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[ChatMessage], Optional[str]]:
+        """A page of messages, oldest first, ending just before `cursor` (the latest when None),
+        and the cursor of the page of earlier messages"""
+        query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        messages, next_cursor = page((await self.db.execute(newest_first(query, ChatMessage, limit, cursor))).scalars().all(), limit)
+        return messages[::-1], next_cursor
 
-    async def generate_response(self, session_id: str, message_content: str) -> List[ChatMessage]:
-        # Validate session exists
-        session = self.get_session(session_id)
+    async def _prepare_turn(
+        self,
+        session_id: str,
+        message_content: str,
+        vector_weight: Optional[float] = None,
+        lexical_weight: Optional[float] = None,
+        deadline: Optional[float] = None
+    ) -> ChatTurn:
+        """Look up a cached answer or retrieve context and build the prompt for one chat
+        turn. Nothing is written until the answer is saved. Retrieval must finish before `deadline`."""
+        # Validate session exists, the last MAX_HISTORY messages come with it
+        session, history = await self.get_session_with_history(session_id, self.max_history)
         if not session:
             logger.error(f"Chat session not found: {session_id}")
             raise HTTPException(status_code=404, detail="Session not found")
         logger.info(f"Generating response for session_id: {session_id}")
-        
-        messages = self.get_chat_history(session_id, limit=self.max_history)
-        
-        # Save user message first
+
+        new_messages = []
+        # Record the system prompt if it's a new conversation
+        if len(history) == 0:
+            new_messages.append(ChatMessage(
+                id=uuid.uuid4(),
+                session_id=session.id,
+                role=MessageRole.SYSTEM,
+                content=SYSTEM_PROMPT,
+                created_at=datetime.utcnow()
+            ))
+        # Timestamped now, it is saved once the answer is ready
         user_message = ChatMessage(
-            session_id=session_id,
+            id=uuid.uuid4(),
+            session_id=session.id,
             role=MessageRole.USER,
-            content=message_content
+            content=message_content,
+            created_at=datetime.utcnow()
         )
-        self.db.add(user_message)
-        self.db.commit()
-        logger.info(f"User message saved for session_id: {session_id}")
-        
-        # Add system prompt if it's a new conversation
-        if len(messages) == 0:
-            system_message = ChatMessage(
-                session_id=session_id,
-                role=MessageRole.SYSTEM,
-                content=SYSTEM_PROMPT
-            )
-            self.db.add(system_message)
-            self.db.commit()
-            messages = [system_message, user_message]
-        else:
-            messages.append(user_message)
+        new_messages.append(user_message)
+        messages = [msg for msg in history if msg.role != MessageRole.SYSTEM] + [user_message]
 
         # Get chat history for context
-        formatted_messages = [
+        formatted_messages = [{"role": MessageRole.SYSTEM.value, "content": SYSTEM_PROMPT}] + [
             {"role": str(msg.role.value), "content": msg.content}
             for msg in messages
         ]
+        turn = ChatTurn(session, new_messages, formatted_messages)
+        vector_weight, lexical_weight = self.document_service.retrieval_weights(vector_weight, lexical_weight)
+        turn.retrieval = (vector_weight, lexical_weight, SIMILARITY_TOP_K)
 
-        # Retrieve relevant documents
-        relevant_chunks, scores = await self.document_service.search_similar_chunks(
-            message_content, 
-            session_id,
-            limit=SIMILARITY_TOP_K
+        if self.cache:
+            # Embed once for the cache lookup and the search
+            turn.query_embedding = await with_deadline(
+                self.document_service.embeddings.aembed_query(message_content), deadline, "Query embedding"
+            )
+            turn.document_ids = await self.document_service.get_session_document_ids(session_id)
+            # Without documents every session would share the same cache scope
+            turn.cached = self.cache.lookup(turn.document_ids, turn.query_embedding, turn.retrieval) if turn.document_ids else None
+            if turn.cached:
+                logger.info(f"Serving cached response for session_id: {session_id}")
+                turn.used_chunks = turn.cached.used_chunks
+                return turn
+
+        # Retrieve relevant documents, dropping vector matches below the similarity threshold
+        relevant_chunks, scores = await with_deadline(
+            self.document_service.search_similar_chunks(
+                message_content, 
+                session_id,
+                limit=SIMILARITY_TOP_K,
+                vector_weight=vector_weight,
+                lexical_weight=lexical_weight,
+                max_distance=similarity_to_distance(settings.SIMILARITY_THRESHOLD),
+                query_embedding=turn.query_embedding
+            ),
+            deadline,
+            "Retrieval"
         )
-        
+
+        # Merge neighbouring chunks and keep what fits the context token budget
+        context = self.context_builder.build(relevant_chunks, scores)
+        turn.used_chunks = [
+            {
+                "document_id": str(chunk.document.id),
+                "chunk_id": str(chunk.id),
+                "filename": chunk.document.filename,
+                "similarity_score": score
+            }
+            for chunk, score in zip(context.chunks, context.distances)
+        ]
+
         # Format context from relevant documents
-        if relevant_chunks:
-            context_text = "\n\nRelevant context:\n" + "\n\n".join([
-                f"From document '{chunk.document.filename}':\n{chunk.content}"
-                for chunk in relevant_chunks
-            ])
-            logger.debug(f"Using context: {context_text}")
+        if context.passages:
+            context_text = "\n\nRelevant context:\n" + context.format()
+            logger.debug(f"Using context ({context.tokens} tokens): {context_text}")
             
             # Add context to the user's message
             formatted_messages[-1]["content"] = f"{message_content}\n\n{context_text}"
         else:
             logger.debug("No relevant chunks found")
 
-        # Generate response using LLM
-        response_content = await self.llm.generate_response(formatted_messages)
-        logger.info("LLM response generated.")
+        return turn
 
-        # Save assistant message with source information
+    async def _save_turn(self, response_content: str, turn: ChatTurn) -> ChatMessage:
+        """Save the turn's messages and the assistant message with source information, and
+        retitle the session, in one transaction. Newly generated answers are cached."""
+        meta_info = {"used_chunks": turn.used_chunks}
+        if turn.cached:
+            meta_info["cached"] = True
         assistant_message = ChatMessage(
-            session_id=session_id,
+            id=uuid.uuid4(),
+            session_id=turn.session.id,
             role=MessageRole.ASSISTANT,
             content=response_content,
-            meta_info={
-                "used_chunks": [
-                    {
-                        "document_id": str(chunk.document.id),
-                        "chunk_id": str(chunk.id),
-                        "filename": chunk.document.filename,
-                        "similarity_score": score
-                    }
-                    for chunk, score in zip(relevant_chunks, scores)
-                ]
-            }
+            created_at=datetime.utcnow(),
+            meta_info=meta_info
         )
-        self.db.add(assistant_message)
-        self.db.commit()
-        logger.info(f"Assistant message saved for session_id: {session_id}")
-        
-        return [user_message, assistant_message]
+        self.db.add_all(turn.new_messages + [assistant_message])
+        turn.session.title = session_title(assistant_message)
+        await self.db.commit()
+        logger.info(f"Chat turn saved for session_id: {turn.session.id}")
+
+        if self.cache and turn.document_ids and not turn.cached:
+            self.cache.store(turn.document_ids, turn.query_embedding, response_content, turn.used_chunks, turn.retrieval)
+        return assistant_message
+
+    async def generate_response(
+        self,
+        session_id: str,
+        message_content: str,
+        vector_weight: Optional[float] = None,
+        lexical_weight: Optional[float] = None
+    ) -> List[ChatMessage]:
+        """Answer a message within CHAT_TURN_BUDGET seconds, raising DeadlineExceededError past it"""
+        deadline = deadline_after(settings.CHAT_TURN_BUDGET)
+        turn = await self._prepare_turn(session_id, message_content, vector_weight, lexical_weight, deadline)
+
+        if turn.cached:
+            response_content = turn.cached.content
+        else:
+            # Generate response using LLM
+            response_content = await self.llm.generate_response(turn.messages, deadline=deadline)
+            logger.info("LLM response generated.")
+
+        assistant_message = await self._save_turn(response_content, turn)
+        return [turn.user_message, assistant_message]
+
+    async def stream_response(
+        self,
+        session_id: str,
+        message_content: str,
+        vector_weight: Optional[float] = None,
+        lexical_weight: Optional[float] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Generate a response as (event, data) pairs: the user message, each text delta
+        as it arrives from the LLM, then the assistant message once both are saved.
+        CHAT_TURN_BUDGET bounds the time to the first delta."""
+        deadline = deadline_after(settings.CHAT_TURN_BUDGET)
+        try:
+            turn = await self._prepare_turn(session_id, message_content, vector_weight, lexical_weight, deadline)
+        except UpstreamError as e:
+            logger.error(f"Error retrieving context for session_id {session_id}: {str(e)}")
+            yield "error", e.detail
+            return
+        yield "user_message", turn.user_message
+
+        if turn.cached:
+            yield "delta", turn.cached.content
+            yield "assistant_message", await self._save_turn(turn.cached.content, turn)
+            return
+
+        parts: List[str] = []
+        try:
+            async for delta in self.llm.stream_response(turn.messages, deadline=deadline):
+                parts.append(delta)
+                yield "delta", delta
+        except UpstreamError as e:
+            logger.error(f"Error streaming LLM response for session_id {session_id}: {str(e)}")
+            yield "error", e.detail
+            return
+        except Exception as e:
+            logger.error(f"Error streaming LLM response for session_id {session_id}: {str(e)}", exc_info=True)
+            yield "error", "Error generating response. Please try again."
+            return
+        logger.info("LLM response streamed.")
+
+        # Persist only once generation has finished
+        yield "assistant_message", await self._save_turn("".join(parts), turn)
 
     async def delete_session(self, session_id: str):
-        session = self.get_session(session_id)
+        session = await self.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
         session.hidden = True  # Soft delete
-        self.db.commit()
+        await self.db.commit()
         return {"message": "Session hidden"}
 
     async def update_session_title(self, session_id: str):
-        session = self.get_session(session_id)
+        session = await self.get_session(session_id)
         if not session:
             return
         
         # Get the last message
-        last_message = self.db.query(ChatMessage)\
-            .filter(ChatMessage.session_id == session_id)\
-            .order_by(ChatMessage.created_at.desc())\
-            .first()
+        result = await self.db.execute(
+            select(ChatMessage)
+            .where(ChatMessage.session_id == session_id)
+            .order_by(ChatMessage.created_at.desc())
+            .limit(1)
+        )
+        last_message = result.scalars().first()
         
         if last_message:
-            # Use the first 50 characters of the last message as title
-            session.title = last_message.content[:50] + ("..." if len(last_message.content) > 50 else "")
-            self.db.commit() 
+            session.title = session_title(last_message)
+            await self.db.commit()
+
+def session_title(last_message: ChatMessage) -> str:
+    """The first 50 characters of the last message"""
+    return last_message.content[:50] + ("..." if len(last_message.content) > 50 else "")
 
 SYSTEM_PROMPT = settings.SYSTEM_PROMPT
 SIMILARITY_TOP_K = settings.SIMILARITY_TOP_K
\ No newline at end of file
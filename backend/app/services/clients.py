@@ -0,0 +1,46 @@
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.services.llm_service import LLMService
+from app.services.embeddings_service import GeminiEmbeddings
+from app.services.document_service import DocumentService, create_text_splitter
+from app.services.ingest_service import IngestService
+from app.services.chat_service import ChatService
+from app.services.context_builder import ContextBuilder
+import magic
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ServiceClients:
+    """Clients and helpers that hold no per-request state, created once for the
+    application and shared by the services built around each request's session"""
+
+    def __init__(
+        self,
+        llm: Optional[LLMService] = None,
+        embeddings: Optional[GeminiEmbeddings] = None,
+        text_splitter: Optional[RecursiveCharacterTextSplitter] = None,
+        mime: Optional[magic.Magic] = None,
+        context_builder: Optional[ContextBuilder] = None
+    ):
+        self.llm = llm or LLMService()
+        self.embeddings = embeddings or GeminiEmbeddings()
+        self.text_splitter = text_splitter or create_text_splitter()
+        self.mime = mime or magic.Magic(mime=True)
+        self.context_builder = context_builder or ContextBuilder()
+        logger.info("Service clients created")
+
+    def document_service(self, db: AsyncSession) -> DocumentService:
+        return DocumentService(db, embeddings=self.embeddings, text_splitter=self.text_splitter)
+
+    def ingest_service(self, db: AsyncSession) -> IngestService:
+        return IngestService(db, document_service=self.document_service(db), mime=self.mime)
+
+    def chat_service(self, db: AsyncSession) -> ChatService:
+        return ChatService(
+            db,
+            llm=self.llm,
+            document_service=self.document_service(db),
+            context_builder=self.context_builder
+        )
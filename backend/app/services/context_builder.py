@@ -0,0 +1,110 @@
+"""Assembly of retrieved chunks into the prompt context.
+
+Retrieved chunks are deduplicated, adjacent chunks of the same document are merged
+into one passage (dropping the CHUNK_OVERLAP text they share), and passages are
+packed in relevance order until the token budget is spent.
+"""
+from typing import List, Optional, Sequence, Tuple
+from app.db.models import DocumentChunk
+from app.services.rate_limiter import estimate_tokens
+from app.core.settings import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Shorter shared text between neighbours is treated as coincidence, not overlap
+MIN_OVERLAP = 8
+
+class ContextPassage:
+    """Consecutive chunks of one document, ranked by their best retrieved chunk"""
+
+    def __init__(self, chunk: DocumentChunk, distance: float, rank: int):
+        self.chunks: List[DocumentChunk] = [chunk]
+        self.distances: List[float] = [distance]
+        self.rank = rank
+        self.content = chunk.content
+
+    @property
+    def document(self):
+        return self.chunks[0].document
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.format())
+
+    def format(self) -> str:
+        return f"From document '{self.document.filename}':\n{self.content}"
+
+class PackedContext:
+    def __init__(self):
+        self.passages: List[ContextPassage] = []
+        self.tokens = 0
+
+    @property
+    def chunks(self) -> List[DocumentChunk]:
+        return [chunk for passage in self.passages for chunk in passage.chunks]
+
+    @property
+    def distances(self) -> List[float]:
+        return [distance for passage in self.passages for distance in passage.distances]
+
+    def format(self) -> str:
+        return "\n\n".join(passage.format() for passage in self.passages)
+
+def merge_overlap(previous: str, following: str, max_overlap: int) -> str:
+    """Join two neighbouring chunks, dropping the longest suffix of `previous` that
+    starts `following` (up to `max_overlap` characters)"""
+    for size in range(min(max_overlap, len(previous), len(following)), MIN_OVERLAP - 1, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return f"{previous}\n{following}"
+
+class ContextBuilder:
+    def __init__(self, token_budget: Optional[int] = None, overlap: Optional[int] = None):
+        self.token_budget = settings.MAX_CHUNK_TOKENS if token_budget is None else token_budget
+        # Splitter overlap is in characters; allow for whitespace it strips at the seams
+        self.overlap = 2 * (settings.CHUNK_OVERLAP if overlap is None else overlap)
+
+    def dedupe(self, chunks: Sequence[DocumentChunk], distances: Sequence[float]) -> List[Tuple[int, DocumentChunk, float]]:
+        """(rank, chunk, distance) for each chunk whose text is not contained in a better-ranked one"""
+        kept: List[Tuple[int, DocumentChunk, float]] = []
+        for rank, (chunk, distance) in enumerate(zip(chunks, distances)):
+            content = chunk.content.strip()
+            if any(content in other.content for _, other, _ in kept):
+                continue
+            kept.append((rank, chunk, distance))
+        return kept
+
+    def merge(self, ranked: List[Tuple[int, DocumentChunk, float]]) -> List[ContextPassage]:
+        """Group runs of consecutive chunk_index per document into passages, best rank first"""
+        passages: List[ContextPassage] = []
+        for rank, chunk, distance in sorted(ranked, key=lambda item: (str(item[1].document_id), item[1].chunk_index)):
+            last = passages[-1] if passages else None
+            if (
+                last is not None
+                and last.chunks[-1].document_id == chunk.document_id
+                and last.chunks[-1].chunk_index + 1 == chunk.chunk_index
+            ):
+                last.chunks.append(chunk)
+                last.distances.append(distance)
+                last.rank = min(last.rank, rank)
+                last.content = merge_overlap(last.content, chunk.content, self.overlap)
+            else:
+                passages.append(ContextPassage(chunk, distance, rank))
+        return sorted(passages, key=lambda passage: passage.rank)
+
+    def build(self, chunks: Sequence[DocumentChunk], distances: Sequence[float]) -> PackedContext:
+        """Packed context for chunks in relevance order, within the token budget"""
+        packed = PackedContext()
+        for passage in self.merge(self.dedupe(chunks, distances)):
+            tokens = passage.tokens
+            if packed.tokens + tokens > self.token_budget:
+                # Keep filling with smaller passages that still fit
+                continue
+            packed.passages.append(passage)
+            packed.tokens += tokens
+        logger.debug(
+            f"Packed {len(packed.chunks)} of {len(chunks)} chunks into {len(packed.passages)} passages, "
+            f"{packed.tokens}/{self.token_budget} tokens"
+        )
+        return packed
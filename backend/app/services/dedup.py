@@ -0,0 +1,102 @@
+"""Fingerprints for skipping duplicate uploads and near-duplicate chunks.
+
+Uploads are fingerprinted twice: sha256 of the raw bytes catches the same file
+uploaded again, sha256 of the normalised extracted text catches the same content
+in a different file (re-saved PDF, other line endings). Chunks get a 64-bit
+SimHash over word shingles, chunks within a few bits of each other are near
+duplicates (repeated headers and footers, lightly edited copies).
+"""
+from typing import AsyncIterator, BinaryIO, Dict, Iterable, List, Optional, Set
+from app.core.settings import settings
+import numpy as np
+import hashlib
+import re
+import unicodedata
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+_words = re.compile(r"\w+")
+
+def file_sha256(file: BinaryIO) -> str:
+    """sha256 of a file read in UPLOAD_CHUNK_SIZE blocks, leaving it rewound"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    while block := file.read(settings.UPLOAD_CHUNK_SIZE):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+def normalize_text(text: str) -> str:
+    """Case, Unicode compatibility forms and whitespace folded away"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class TextFingerprint:
+    """sha256 of the normalised text of a document, fed page by page as it is extracted"""
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+        self._empty = True
+
+    def update(self, page: str) -> None:
+        text = normalize_text(page)
+        if not text:
+            return
+        self._digest.update((text if self._empty else " " + text).encode("utf-8"))
+        self._empty = False
+
+    async def wrap(self, pages: AsyncIterator[str]) -> AsyncIterator[str]:
+        async for page in pages:
+            self.update(page)
+            yield page
+
+    def hexdigest(self) -> Optional[str]:
+        return None if self._empty else self._digest.hexdigest()
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the word shingles of `text`, unsigned"""
+    words = _words.findall(normalize_text(text))
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+    digests = b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles)
+    # Each bit is set when most shingle hashes have it set
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    return int.from_bytes(np.packbits(bits.sum(axis=0) * 2 > len(shingles)).tobytes(), "big")
+
+def to_signed(value: int) -> int:
+    """Unsigned 64-bit hash as a Postgres BIGINT"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << SIMHASH_BITS) - 1)
+
+class SimHashIndex:
+    """Hashes searchable for neighbours within `max_distance` differing bits.
+
+    Hashes are split into max_distance + 1 bands: two hashes that differ in at
+    most max_distance bits agree exactly on at least one band, so only hashes
+    sharing a band value are compared.
+    """
+
+    def __init__(self, hashes: Iterable[int] = (), max_distance: Optional[int] = None):
+        self.max_distance = settings.DEDUP_SIMHASH_DISTANCE if max_distance is None else max_distance
+        bands = self.max_distance + 1
+        self._width = -(-SIMHASH_BITS // bands)
+        self._bands: List[Dict[int, Set[int]]] = [{} for _ in range(bands)]
+        for value in hashes:
+            self.add(value)
+
+    def _keys(self, value: int) -> List[int]:
+        mask = (1 << self._width) - 1
+        return [value >> (band * self._width) & mask for band in range(len(self._bands))]
+
+    def add(self, value: int) -> None:
+        for band, key in zip(self._bands, self._keys(value)):
+            band.setdefault(key, set()).add(value)
+
+    def near(self, value: int) -> bool:
+        """True if a hash within max_distance bits of `value` has been added"""
+        for band, key in zip(self._bands, self._keys(value)):
+            for other in band.get(key, ()):
+                if bin(value ^ other).count("1") <= self.max_distance:
+                    return True
+        return False
@@ -1,132 +1,623 @@
-from typing import List
-from sqlalchemy.orm import Session
-from sqlalchemy import select, text
+from typing import AsyncIterable, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, text, bindparam, insert, literal
+from sqlalchemy.dialects.postgresql import UUID
+from pgvector.sqlalchemy import Vector
 from ..db.models import Document, DocumentChunk
+from ..db.bulk import copy_chunks
+from ..db.vector_index import distance_operator, search_tuning, explain_statement, quantized_order, rerank_candidates
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from ..services.embeddings_service import GeminiEmbeddings
+from ..services.response_cache import response_cache
+from ..services.memory_search import SESSION_DOCUMENTS, InMemoryVectorSearch, SessionVectors, memory_search, reciprocal_rank_fusion
+from ..services.dedup import SimHashIndex, simhash, to_signed, to_unsigned
+from ..services.parsers import TableChunk, extract_pdf_pages, is_table, iter_file_pages, parse_table, parse_text
 from app.core.settings import settings
-import PyPDF2
-import pandas as pd
-import json
-import io
+import asyncio
 import uuid
 from fastapi import HTTPException
 import logging
 
 logger = logging.getLogger(__name__)
 
+def create_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP
+    )
+
 class DocumentService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: AsyncSession,
+        embeddings: Optional[GeminiEmbeddings] = None,
+        text_splitter: Optional[RecursiveCharacterTextSplitter] = None,
+        in_memory_search: Optional[InMemoryVectorSearch] = None
+    ):
         self.db = db
-        self.embeddings = GeminiEmbeddings()
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP
-        )
+        self.embeddings = embeddings or GeminiEmbeddings()
+        self.text_splitter = text_splitter or create_text_splitter()
+        self.in_memory_search = in_memory_search or (memory_search if settings.IN_MEMORY_SEARCH_ENABLED else None)
 
-    def read_file_content(self, content: bytes, content_type: str) -> str:
-        """Extract text content from various file types"""
+    def read_file_content(self, file: BinaryIO, content_type: str) -> str:
+        """Extract text content from various file types inline, reading from a file handle"""
         try:
+            file.seek(0)
             if content_type == 'application/pdf':
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
-                return "\n".join(page.extract_text() for page in pdf_reader.pages)
-            
-            elif content_type == 'text/csv':
-                df = pd.read_csv(io.BytesIO(content))
-                return df.to_string()
-            
-            elif content_type == 'application/json':
-                return json.dumps(json.loads(content.decode()), indent=2)
-            
-            elif content_type.startswith('application/vnd.openxmlformats'):
-                df = pd.read_excel(io.BytesIO(content))
-                return df.to_string()
-            
-            return content.decode('utf-8')
+                return "\n".join(extract_pdf_pages(file))
+            elif is_table(content_type):
+                return "\n\n".join(parse_table(file, content_type))
+            return parse_text(file, content_type)
         except Exception as e:
             logger.error(f"Error reading file content: {str(e)}", exc_info=True)
             raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
 
-    async def process_document(self, session_id: str, file_content: str, filename: str, file_type: str):
-        """Process a document: create chunks and generate embeddings"""
-        logger.info(f"Starting to process document: {filename} for session: {session_id}")
-        # Create document record
+    async def read_file_pages(self, file: BinaryIO, content_type: str) -> AsyncIterator[str]:
+        """Extract text content in the parser process pool, page by page for PDFs"""
+        try:
+            async for page in iter_file_pages(file, content_type):
+                yield page
+        except Exception as e:
+            logger.error(f"Error reading file content: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+
+    async def create_document(self, session_id: str, filename: str, file_type: str, content_hash: Optional[str] = None) -> Document:
         document = Document(
             session_id=session_id,
             filename=filename,
             file_type=file_type,
-            meta_info={}
+            content_hash=content_hash,
+            meta_info={"status": "processing", "chunk_count": 0}
         )
         self.db.add(document)
-        self.db.commit()
+        await self.db.commit()
         logger.info(f"Document record created with id: {document.id}")
-        
-        # Split text into chunks
-        chunks = self.text_splitter.split_text(file_content)
-        logger.debug(f"Document {document.id} split into {len(chunks)} chunks")
-        
-        # Prepare chunks for batch processing
-        chunk_texts = []
-        db_chunks = []
-        
-        for i, chunk_content in enumerate(chunks):
-            chunk_texts.append(chunk_content)
-            chunk = DocumentChunk(
-                document_id=document.id,
-                content=chunk_content,
-                chunk_index=i
-            )
-            db_chunks.append(chunk)
-        
-        # Generate embeddings in batch
-        logger.info(f"Generating embeddings for {len(chunk_texts)} chunks in document {document.id}")
-        embeddings = await self.embeddings.aembed_documents(chunk_texts)
-        logger.info(f"Generated embeddings for document {document.id}")
-        
-        # Store chunks with embeddings
-        for chunk, embedding in zip(db_chunks, embeddings):
-            chunk.embedding = embedding
-            self.db.add(chunk)
-        
-        self.db.commit()
-        logger.info(f"Document {document.id} processing complete with {len(db_chunks)} chunks stored")
         return document
 
-    async def search_similar_chunks(self, query: str, session_id: str, limit: int | None = None) -> tuple[List[DocumentChunk], List[float]]:
-        """Search for similar chunks using vector similarity and return chunks with their scores"""
+    async def process_document(self, session_id: str, file_content: str, filename: str, file_type: str):
+        """Process a document: create chunks and generate embeddings"""
+        logger.info(f"Starting to process document: {filename} for session: {session_id}")
+        document = await self.create_document(session_id, filename, file_type)
+        return await self.ingest_pages(document, [file_content])
+
+    async def ingest_pages(
+        self,
+        document: Document,
+        pages: Union[Iterable[str], AsyncIterable[str]],
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> Document:
+        """Stream pages through split -> embed -> insert, committing one batch at a time.
+
+        Stages are connected by bounded queues (INGEST_PIPELINE_DEPTH batches of
+        INGEST_BATCH_SIZE chunks), so a slow stage holds back the ones before it and
+        only a few batches are in memory. Each batch is queryable once committed.
+        Batches are written with binary COPY. Chunks already stored for the document
+        are skipped, so re-running a failed ingestion resumes after the last
+        committed chunk_index. With DEDUP_NEAR_DUPLICATE_CHUNKS, chunks whose SimHash
+        is near one already in the session are not embedded or stored.
+        """
+        committed = (await self.db.execute(
+            select(func.count(DocumentChunk.id), func.max(DocumentChunk.chunk_index))
+            .where(DocumentChunk.document_id == document.id)
+        )).one()
+        chunk_count = committed[0]
+        resume_after = committed[1] if committed[1] is not None else -1
+        if resume_after >= 0:
+            logger.info(f"Resuming document {document.id} after chunk {resume_after}")
+
+        near_duplicates = None
+        if settings.DEDUP_NEAR_DUPLICATE_CHUNKS:
+            near_duplicates = SimHashIndex(await self.get_session_simhashes(document.session_id))
+        skipped = 0
+
+        split_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_PIPELINE_DEPTH)
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_PIPELINE_DEPTH)
+
+        async def split() -> None:
+            nonlocal skipped
+            batch: List[Tuple[int, str, int]] = []
+            index = 0
+            async for page in _aiter(pages):
+                # Table row groups are already chunk sized and must keep their header
+                for chunk in [page] if isinstance(page, TableChunk) else self.text_splitter.split_text(page):
+                    if index > resume_after:
+                        fingerprint = simhash(chunk)
+                        if near_duplicates is not None and near_duplicates.near(fingerprint):
+                            skipped += 1
+                        else:
+                            if near_duplicates is not None:
+                                near_duplicates.add(fingerprint)
+                            batch.append((index, chunk, fingerprint))
+                    index += 1
+                    if len(batch) >= settings.INGEST_BATCH_SIZE:
+                        await split_queue.put(batch)
+                        batch = []
+            if batch:
+                await split_queue.put(batch)
+            await split_queue.put(None)
+
+        async def embed() -> None:
+            while (batch := await split_queue.get()) is not None:
+                embeddings = await self.embeddings.aembed_documents([chunk for _, chunk, _ in batch])
+                await embed_queue.put((batch, embeddings))
+            await embed_queue.put(None)
+
+        async def insert() -> None:
+            nonlocal chunk_count
+            while (item := await embed_queue.get()) is not None:
+                batch, embeddings = item
+                await copy_chunks(self.db, [
+                    (document.id, index, chunk, embedding, to_signed(fingerprint), getattr(chunk, "meta_info", None))
+                    for (index, chunk, fingerprint), embedding in zip(batch, embeddings)
+                ])
+                chunk_count += len(batch)
+                document.meta_info = {**(document.meta_info or {}), "chunk_count": chunk_count}
+                await self.db.commit()
+                self.invalidate_document(document)
+                logger.debug(f"Document {document.id}: committed chunks up to {batch[-1][0]}")
+                if on_progress:
+                    await on_progress(chunk_count)
+
+        await _run_stages([split(), embed(), insert()], [split_queue, embed_queue])
+
+        meta_info = {**(document.meta_info or {}), "status": "complete", "chunk_count": chunk_count}
+        if skipped:
+            meta_info["near_duplicate_chunks"] = meta_info.get("near_duplicate_chunks", 0) + skipped
+            logger.info(f"Document {document.id}: skipped {skipped} near-duplicate chunks")
+        document.meta_info = meta_info
+        await self.db.commit()
+        logger.info(f"Document {document.id} processing complete with {chunk_count} chunks stored")
+        return document
+
+    async def get_session_simhashes(self, session_id) -> List[int]:
+        return [to_unsigned(value) for value in (await self.db.execute(
+            select(DocumentChunk.simhash)
+            .join(Document, Document.id == DocumentChunk.document_id)
+            .where(Document.session_id == session_id, DocumentChunk.simhash.is_not(None))
+        )).scalars().all()]
+
+    async def find_indexed_document(
+        self,
+        session_id: Optional[str] = None,
+        content_hash: Optional[str] = None,
+        text_hash: Optional[str] = None,
+        exclude: Optional[uuid.UUID] = None,
+        all_chunks: bool = False
+    ) -> Optional[Document]:
+        """Oldest completely indexed document with the given fingerprint, in `session_id` or in any session.
+
+        With `all_chunks`, documents that skipped chunks as near duplicates of others in
+        their session are left out: their chunks alone do not cover the file.
+        """
+        query = select(Document).where(Document.meta_info["status"].as_string() == "complete")
+        if all_chunks:
+            query = query.where(func.coalesce(Document.meta_info["near_duplicate_chunks"].as_integer(), 0) == 0)
+        if session_id is not None:
+            query = query.where(Document.session_id == uuid.UUID(str(session_id)))
+        if content_hash is not None:
+            query = query.where(Document.content_hash == content_hash)
+        if text_hash is not None:
+            query = query.where(Document.text_hash == text_hash)
+        if exclude is not None:
+            query = query.where(Document.id != exclude)
+        return (await self.db.execute(query.order_by(Document.created_at).limit(1))).scalars().first()
+
+    async def copy_document_chunks(self, source: Document, document: Document) -> Document:
+        """Index `document` with the chunks and embeddings of `source`, an identical file, without re-embedding"""
+        await self.db.execute(insert(DocumentChunk).from_select(
+            ["id", "document_id", "chunk_index", "content", "embedding", "simhash", "meta_info"],
+            select(
+                func.gen_random_uuid(),
+                literal(document.id, UUID(as_uuid=True)),
+                DocumentChunk.chunk_index,
+                DocumentChunk.content,
+                DocumentChunk.embedding,
+                DocumentChunk.simhash,
+                DocumentChunk.meta_info
+            ).where(DocumentChunk.document_id == source.id)
+        ))
+        document.text_hash = source.text_hash
+        document.meta_info = {
+            **(document.meta_info or {}),
+            "status": "complete",
+            "chunk_count": (source.meta_info or {}).get("chunk_count", 0),
+            "copied_from": str(source.id)
+        }
+        await self.db.commit()
+        self.invalidate_document(document)
+        logger.info(f"Document {document.id}: copied {document.meta_info['chunk_count']} chunks from identical document {source.id}")
+        return document
+
+    async def mark_failed(self, document: Document, error: str) -> None:
+        """Keep the chunks of a document whose ingestion failed for a retry, out of retrieval until then"""
+        document.meta_info = {**(document.meta_info or {}), "status": "failed", "error": error}
+        await self.db.commit()
+        self.invalidate_document(document)
+        logger.info(f"Document {document.id}: ingestion failed after {document.meta_info.get('chunk_count', 0)} chunks")
+
+    def invalidate_document(self, document: Document) -> None:
+        """Drop what was derived from a document whose chunks changed: answers cached
+        over it and its session's in-memory vectors"""
+        response_cache.invalidate_documents([document.id])
+        if self.in_memory_search:
+            self.in_memory_search.invalidate_session(document.session_id)
+
+    def _ann_sql(self, columns: str, document_filter: str, limit: str, exact: bool = False) -> str:
+        """Nearest `limit` chunks of the session with their exact distance.
+
+        With `exact`, the session's chunks are fetched first (MATERIALIZED keeps the
+        planner from walking the shared embedding index) and all of them are ranked.
+        Otherwise the index is walked and the session filter applied to what it returns.
+        With VECTOR_QUANTIZATION the quantised index supplies :rerank_candidates rows,
+        re-ranked by the distance on the full-precision column.
+        """
+        operator = distance_operator()
+        if exact:
+            return f"""
+            WITH session_chunks AS MATERIALIZED (
+                SELECT c.id, c.document_id, c.chunk_index, c.content, c.embedding
+                FROM document_chunks c
+                WHERE c.document_id IN (SELECT d.id FROM documents d WHERE {SESSION_DOCUMENTS})
+                {document_filter}
+            )
+            SELECT {columns}, (c.embedding {operator} :query_embedding) AS distance
+            FROM session_chunks c
+            JOIN documents d ON d.id = c.document_id
+            ORDER BY distance
+            LIMIT {limit}
+            """
+        scope = f"""
+            FROM document_chunks c
+            JOIN documents d ON d.id = c.document_id
+            WHERE {SESSION_DOCUMENTS}
+            {document_filter}
+        """
+        quantized = quantized_order()
+        if quantized is None:
+            return f"""
+            SELECT {columns}, (c.embedding {operator} :query_embedding) AS distance
+            {scope}
+            ORDER BY c.embedding {operator} :query_embedding
+            LIMIT {limit}
+            """
+        return f"""
+            SELECT * FROM (
+                SELECT {columns}, (c.embedding {operator} :query_embedding) AS distance
+                {scope}
+                ORDER BY {quantized}
+                LIMIT :rerank_candidates
+            ) candidates
+            ORDER BY distance
+            LIMIT {limit}
+            """
+
+    def _lexical_sql(self, document_filter: str) -> str:
+        """Best :candidates full-text matches of the session, (chunk id, score) in rank order"""
+        # Terms are OR-ed, a question rarely contains every word of the passage it is about
+        ts_query = f"replace(plainto_tsquery('{settings.TEXT_SEARCH_CONFIG}', :query_text)::text, ' & ', ' | ')::tsquery"
+        return f"""
+                SELECT c.id, ts_rank_cd(c.content_tsv, q.query) AS score
+                FROM document_chunks c
+                JOIN documents d ON d.id = c.document_id
+                CROSS JOIN (SELECT {ts_query} AS query) q
+                WHERE {SESSION_DOCUMENTS}
+                {document_filter}
+                AND c.content_tsv @@ q.query
+                ORDER BY score DESC
+                LIMIT :candidates
+        """
+
+    def _similarity_sql(
+        self,
+        document_ids: List[str] | None = None,
+        hybrid: bool = False,
+        max_distance: bool = False,
+        exact: bool = False
+    ) -> str:
+        """Session-scoped retrieval query, returning (chunk id, document id, chunk index,
+        content, filename, distance) in rank order.
+
+        The session/document filter is pushed into the same statement. With `exact`
+        the session's chunks are ranked by a scan of their own, otherwise ordering
+        uses the operator matching the embedding index so the planner can walk it
+        (see _ann_sql, and _prepare_search for which one a session gets).
+        With `hybrid`, the ANN candidates and the best full-text matches (GIN index on
+        content_tsv) are fused by weighted reciprocal rank in the same round trip.
+        With `max_distance`, ANN candidates further than :max_distance are dropped
+        after the index scan; full-text matches are kept whatever their distance.
+        """
+        operator = distance_operator()
+        document_filter = "AND c.document_id = ANY(:document_ids)" if document_ids else ""
+        distance_filter = "WHERE distance <= :max_distance" if max_distance else ""
+        if not hybrid:
+            return f"""
+            SELECT id, document_id, chunk_index, content, filename, distance FROM (
+                {self._ann_sql("c.id, c.document_id, c.chunk_index, c.content, d.filename", document_filter, ":limit", exact)}
+            ) ann
+            {distance_filter}
+            ORDER BY distance
+            """
+
+        return f"""
+        WITH vector_hits AS (
+            SELECT id, row_number() OVER (ORDER BY distance) AS rank
+            FROM (
+                {self._ann_sql("c.id", document_filter, ":candidates", exact)}
+            ) ann
+            {distance_filter}
+        ),
+        lexical_hits AS (
+            SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+            FROM (
+                {self._lexical_sql(document_filter)}
+            ) fts
+        ),
+        fused AS (
+            SELECT COALESCE(v.id, l.id) AS id,
+                   COALESCE(CAST(:vector_weight AS float8) / (:rrf_k + v.rank), 0)
+                   + COALESCE(CAST(:lexical_weight AS float8) / (:rrf_k + l.rank), 0) AS score
+            FROM vector_hits v
+            FULL OUTER JOIN lexical_hits l ON l.id = v.id
+            ORDER BY score DESC
+            LIMIT :limit
+        )
+        SELECT f.id, c.document_id, c.chunk_index, c.content, d.filename,
+               (c.embedding {operator} :query_embedding) AS distance
+        FROM fused f
+        JOIN document_chunks c ON c.id = f.id
+        JOIN documents d ON d.id = c.document_id
+        ORDER BY f.score DESC
+        """
+
+    def _similarity_params(
+        self,
+        query_embedding: List[float],
+        session_id: str,
+        limit: int,
+        document_ids: List[str] | None = None,
+        query_text: str | None = None,
+        vector_weight: float | None = None,
+        lexical_weight: float | None = None,
+        max_distance: float | None = None
+    ) -> dict:
+        params = {
+            "query_embedding": query_embedding,
+            "session_id": uuid.UUID(str(session_id)),
+            "limit": limit
+        }
+        if max_distance is not None:
+            params["max_distance"] = max_distance
+        if document_ids:
+            params["document_ids"] = [uuid.UUID(str(document_id)) for document_id in document_ids]
+        if quantized_order() is not None:
+            params["rerank_candidates"] = self._ann_limit(limit, hybrid=query_text is not None)
+        if query_text is not None:
+            params.update({
+                "query_text": query_text,
+                "candidates": max(settings.HYBRID_CANDIDATES, limit),
+                "rrf_k": settings.RRF_K,
+                "vector_weight": float(vector_weight),
+                "lexical_weight": float(lexical_weight)
+            })
+        return params
+
+    def _ann_limit(self, limit: int, hybrid: bool) -> int:
+        """Rows read from the embedding index, before any re-rank"""
+        limit = max(limit, settings.HYBRID_CANDIDATES) if hybrid else limit
+        return rerank_candidates(limit) if quantized_order() is not None else limit
+
+    def retrieval_weights(self, vector_weight: float | None, lexical_weight: float | None) -> Tuple[float, float]:
+        """(vector, lexical) weights of a search, the configured ones where None"""
+        vector_weight = settings.HYBRID_VECTOR_WEIGHT if vector_weight is None else vector_weight
+        lexical_weight = settings.HYBRID_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+        if vector_weight < 0 or lexical_weight < 0 or vector_weight + lexical_weight == 0:
+            raise ValueError("Retrieval weights must be non-negative and not both zero")
+        return vector_weight, lexical_weight
+
+    async def _prepare_search(
+        self,
+        session_id: str,
+        limit: int,
+        hybrid: bool,
+        probes: int | None = None,
+        ef_search: int | None = None
+    ) -> bool:
+        """Pick how the session is searched, True for an exact scan of its chunks.
+
+        The embedding index covers every session, so a session holding a small share
+        of the table can have none of its chunks among the nearest rows the index
+        returns. Sessions up to EXACT_SEARCH_MAX_CHUNKS are scanned exactly; larger
+        ones walk the index with ef_search/probes scaled by their share of the table.
+        The session is counted by the tuning statement, in the same round trip.
+        """
+        statement, params = search_tuning(
+            self._ann_limit(limit, hybrid), probes, ef_search,
+            scope_rows=f"""
+                SELECT count(*) FROM document_chunks c JOIN documents d ON d.id = c.document_id
+                WHERE {SESSION_DOCUMENTS}
+            """
+        )
+        tuning = (await self.db.execute(statement, {**params, "session_id": uuid.UUID(str(session_id))})).one()
+        exact = tuning.rows <= settings.EXACT_SEARCH_MAX_CHUNKS
+        logger.debug(
+            f"Session {session_id} has {tuning.rows} chunks, "
+            + ("exact scan" if exact else f"ivfflat.probes={tuning.probes}, hnsw.ef_search={tuning.ef_search}")
+        )
+        return exact
+
+    def _similarity_bindparams(self):
+        return [bindparam("query_embedding", type_=Vector(settings.EMBEDDING_DIMENSIONS))]
+
+    async def explain_similarity_search(
+        self,
+        query_embedding: List[float],
+        session_id: str,
+        limit: int | None = None,
+        document_ids: List[str] | None = None,
+        query_text: str | None = None
+    ) -> List[str]:
+        """EXPLAIN the retrieval query (hybrid when `query_text` is given), used to verify the indexes are picked up"""
         limit = limit or settings.SIMILARITY_TOP_K
+        hybrid = query_text is not None
+        exact = await self._prepare_search(session_id, limit, hybrid)
+        weights = self.retrieval_weights(None, None) if hybrid else (None, None)
+        result = await self.db.execute(
+            explain_statement(self._similarity_sql(document_ids, hybrid=hybrid, exact=exact), self._similarity_bindparams()),
+            self._similarity_params(query_embedding, session_id, limit, document_ids, query_text, *weights)
+        )
+        return [row[0] for row in result.fetchall()]
+
+    async def get_session_document_ids(self, session_id: str) -> List[uuid.UUID]:
+        return list((await self.db.execute(
+            select(Document.id).where(Document.session_id == uuid.UUID(str(session_id)))
+        )).scalars().all())
+
+    async def search_similar_chunks(
+        self,
+        query: str,
+        session_id: str,
+        limit: int | None = None,
+        document_ids: List[str] | None = None,
+        probes: int | None = None,
+        ef_search: int | None = None,
+        vector_weight: float | None = None,
+        lexical_weight: float | None = None,
+        max_distance: float | None = None,
+        query_embedding: List[float] | None = None
+    ) -> tuple[List[DocumentChunk], List[float]]:
+        """Search for relevant chunks in a session and return them with their vector distances.
+
+        Vector and full-text rankings are fused by reciprocal rank, weighted by
+        `vector_weight` / `lexical_weight` (HYBRID_* settings by default). A lexical
+        weight of 0 runs a plain vector search. Vector matches further than
+        `max_distance` are dropped. Pass `query_embedding` when the query is already embedded.
+        The returned chunks and their documents are read-only and not attached to the
+        session; they carry the content, position and filename, not the embedding.
+        """
+        if not query:
+            raise ValueError("Query must not be empty")
+        limit = limit or settings.SIMILARITY_TOP_K
+        vector_weight, lexical_weight = self.retrieval_weights(vector_weight, lexical_weight)
+        hybrid = lexical_weight > 0
         logger.info(f"Searching similar chunks for session {session_id} with query: {query[:100]}{'...' if len(query) > 100 else ''}")
-        query_embedding = await self.embeddings.aembed_query(query)
-        
-        # Use SQLAlchemy text() for raw SQL
-        stmt = text("""
-        SELECT id, (embedding <-> CAST(:query_embedding AS vector)) as distance
-        FROM document_chunks
-        ORDER BY embedding <-> CAST(:query_embedding AS vector)
-        LIMIT :limit
-        """)
-        
-        result = self.db.execute(
+        if query_embedding is None:
+            query_embedding = await self.embeddings.aembed_query(query)
+
+        vectors = await self.in_memory_search.get(self.db, session_id) if self.in_memory_search else None
+        if vectors is not None:
+            result = await self._search_in_memory(
+                vectors, query_embedding, session_id, limit, document_ids,
+                query_text=query if hybrid else None,
+                vector_weight=vector_weight,
+                lexical_weight=lexical_weight,
+                max_distance=max_distance
+            )
+            logger.debug(f"Found {len(result)} {'hybrid' if hybrid else 'vector'} matches in memory for session {session_id}")
+            return self._search_results(result, session_id)
+
+        exact = await self._prepare_search(session_id, limit, hybrid, probes=probes, ef_search=ef_search)
+        stmt = text(
+            self._similarity_sql(document_ids, hybrid=hybrid, max_distance=max_distance is not None, exact=exact)
+        ).bindparams(*self._similarity_bindparams())
+        result = (await self.db.execute(
             stmt,
-            {
-                "query_embedding": query_embedding,
-                "limit": limit
-            }
-        ).fetchall()
-        logger.debug(f"Found {len(result)} similar chunks for session {session_id}")
-        
-        chunk_ids = []
+            self._similarity_params(
+                query_embedding, session_id, limit, document_ids,
+                query_text=query if hybrid else None,
+                vector_weight=vector_weight,
+                lexical_weight=lexical_weight,
+                max_distance=max_distance
+            )
+        )).fetchall()
+        logger.debug(f"Found {len(result)} {'hybrid' if hybrid else 'vector'} matches for session {session_id}")
+        return self._search_results(result, session_id)
+
+    async def _search_in_memory(
+        self,
+        vectors: SessionVectors,
+        query_embedding: List[float],
+        session_id: str,
+        limit: int,
+        document_ids: List[str] | None = None,
+        query_text: str | None = None,
+        vector_weight: float | None = None,
+        lexical_weight: float | None = None,
+        max_distance: float | None = None
+    ) -> list:
+        """The retrieval query's rows computed from the session's in-memory vectors.
+        The full-text half of a hybrid search still runs in Postgres, fused here."""
+        distances = vectors.distances(query_embedding)
+        if query_text is None:
+            return vectors.rows(vectors.nearest(distances, limit, document_ids, max_distance), distances)
+
+        candidates = max(settings.HYBRID_CANDIDATES, limit)
+        vector_hits = [vectors.ids[p] for p in vectors.nearest(distances, candidates, document_ids, max_distance)]
+        params = {"session_id": uuid.UUID(str(session_id)), "query_text": query_text, "candidates": candidates}
+        if document_ids:
+            params["document_ids"] = [uuid.UUID(str(document_id)) for document_id in document_ids]
+        lexical_hits = (await self.db.execute(
+            text(self._lexical_sql("AND c.document_id = ANY(:document_ids)" if document_ids else "")), params
+        )).scalars().all()
+        fused = reciprocal_rank_fusion([vector_hits, lexical_hits], [vector_weight, lexical_weight], settings.RRF_K, limit)
+        # Chunks committed after the vectors were loaded are skipped until the session is reloaded
+        positions = [p for p in map(vectors.position, fused) if p is not None]
+        return vectors.rows(positions, distances)
+
+    def _search_results(self, rows: Iterable[tuple], session_id: str) -> tuple[List[DocumentChunk], List[float]]:
+        """Chunks built from the search rows, no second query to load them and their documents"""
+        documents: Dict[uuid.UUID, Document] = {}
+        chunks = []
         scores = []
-        for row in result:
-            chunk_ids.append(row[0])
-            scores.append(float(row[1]))
-        
-        chunks = self.db.query(DocumentChunk).filter(
-            DocumentChunk.id.in_(chunk_ids)
-        ).all()
-        
-        # Maintain order from similarity search
-        id_to_chunk = {str(chunk.id): chunk for chunk in chunks}
-        sorted_chunks = [id_to_chunk[str(chunk_id)] for chunk_id in chunk_ids]
-        logger.info(f"Returning {len(sorted_chunks)} similar chunks for session {session_id}")
-        return sorted_chunks, scores 
\ No newline at end of file
+        for id, document_id, chunk_index, content, filename, distance in rows:
+            document = documents.get(document_id)
+            if document is None:
+                document = documents[document_id] = Document(id=document_id, filename=filename)
+            chunks.append(DocumentChunk(
+                id=id,
+                document_id=document_id,
+                chunk_index=chunk_index,
+                content=content,
+                document=document
+            ))
+            scores.append(float(distance))
+        logger.info(f"Returning {len(chunks)} similar chunks for session {session_id}")
+        return chunks, scores
+
+async def _aiter(items: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def _run_stages(stages: List[Awaitable[None]], queues: List[asyncio.Queue]) -> None:
+    """Run pipeline stages concurrently, `queues[i]` connecting stage i to stage i + 1.
+
+    When a stage fails, the stages feeding it are cancelled and the ones after it
+    are sent the end-of-stream marker, so work already handed downstream (embedded
+    chunks) is still committed before the error is raised.
+    """
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    error: Optional[BaseException] = None
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.cancelled() or task.exception() is None:
+                    continue
+                failed = tasks.index(task)
+                error = error or task.exception()
+                for upstream in tasks[:failed]:
+                    upstream.cancel()
+                if failed < len(queues) and not tasks[failed + 1].done():
+                    stop = asyncio.ensure_future(queues[failed].put(None))
+                    await asyncio.wait([stop, tasks[failed + 1]], return_when=asyncio.FIRST_COMPLETED)
+                    stop.cancel()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if error:
+        raise error
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from ..db.database import AsyncSessionLocal
+from ..db.models import EmbeddingCache as EmbeddingCacheEntry
+from app.core.settings import settings
+import numpy as np
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str]
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: an in-process LRU in front of the
+    embedding_cache table, keyed by (model, task_type, sha256(text)).
+
+    Cache failures are logged and treated as misses, so embedding never
+    depends on the cache being available.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        memory_size: int = settings.EMBEDDING_CACHE_MEMORY_SIZE,
+        dtype: str = settings.EMBEDDING_CACHE_DTYPE
+    ):
+        self.session_factory = session_factory
+        self.memory_size = memory_size
+        self.dtype = np.dtype(dtype)
+        self._memory: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: CacheKey, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    async def get_many(self, model: str, task_type: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings in input order, None for misses"""
+        keys = [(model, task_type, text_hash(text)) for text in texts]
+        found: Dict[CacheKey, np.ndarray] = {}
+
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+        in_memory = set(found)
+
+        missing = list({key for key in keys if key not in found})
+        if missing:
+            try:
+                async with self.session_factory() as db:
+                    rows = (await db.execute(
+                        select(EmbeddingCacheEntry).where(
+                            tuple_(
+                                EmbeddingCacheEntry.model,
+                                EmbeddingCacheEntry.task_type,
+                                EmbeddingCacheEntry.text_hash
+                            ).in_(missing)
+                        )
+                    )).scalars().all()
+                for row in rows:
+                    key = (row.model, row.task_type, row.text_hash)
+                    vector = np.frombuffer(row.embedding, dtype=row.dtype)
+                    found[key] = vector
+                    self._remember(key, vector)
+            except Exception as e:
+                logger.warning(f"Embedding cache lookup failed, embedding without cache: {str(e)}")
+
+        results: List[Optional[List[float]]] = []
+        for key in keys:
+            if key in in_memory:
+                self.memory_hits += 1
+            elif key in found:
+                self.db_hits += 1
+            else:
+                self.misses += 1
+            results.append(found[key].astype(np.float32).tolist() if key in found else None)
+        logger.debug(f"Embedding cache: {len(texts) - results.count(None)}/{len(texts)} hits for {task_type}")
+        return results
+
+    async def put_many(self, model: str, task_type: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        entries: Dict[CacheKey, np.ndarray] = {}
+        for text, embedding in zip(texts, embeddings):
+            key = (model, task_type, text_hash(text))
+            vector = np.asarray(embedding, dtype=self.dtype)
+            entries[key] = vector
+            self._remember(key, vector)
+        if not entries:
+            return
+
+        try:
+            async with self.session_factory() as db:
+                await db.execute(
+                    insert(EmbeddingCacheEntry)
+                    .values([
+                        {
+                            "model": key[0],
+                            "task_type": key[1],
+                            "text_hash": key[2],
+                            "embedding": vector.tobytes(),
+                            "dtype": self.dtype.name
+                        }
+                        for key, vector in entries.items()
+                    ])
+                    .on_conflict_do_nothing()
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
+
+    def clear_memory(self) -> None:
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else None,
+            "memory_entries": len(self._memory)
+        }
+
+# Process-wide cache shared by every GeminiEmbeddings instance
+embedding_cache = EmbeddingCache()
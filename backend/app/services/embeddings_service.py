@@ -1,67 +1,180 @@
 import google.generativeai as genai
-from typing import List, Any
+from typing import List, Any, Optional
 import numpy as np
 from app.core.settings import settings
+from app.services.rate_limiter import embedding_rate_limiter, Priority
+from app.services.embedding_cache import EmbeddingCache, embedding_cache
+from app.services.resilience import AttemptLog, with_timeout
 import asyncio
+import inspect
 import time
+import weakref
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Bounds batch requests in flight across every GeminiEmbeddings instance in the process
+# (one per event loop, asyncio primitives cannot be shared between loops)
+_embedding_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _embedding_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _embedding_semaphores:
+        _embedding_semaphores[loop] = asyncio.Semaphore(settings.EMBEDDING_MAX_CONCURRENCY)
+    return _embedding_semaphores[loop]
+
+# Latencies of single query embedding requests, the p95 sets the hedging delay
+query_attempts = AttemptLog()
+# Latencies seen before the p95 replaces EMBEDDING_HEDGE_DELAY
+HEDGE_MIN_SAMPLES = 20
+
+# SDK versions that take output_dimensionality get reduced vectors from the API,
+# older ones get the model's full size and the vectors are truncated here
+SUPPORTS_OUTPUT_DIMENSIONALITY = "output_dimensionality" in inspect.signature(genai.embed_content).parameters
+
+def reduce_dimensions(embedding: List[float], dimensions: int) -> List[float]:
+    """Matryoshka truncation: the first `dimensions` values, re-normalised to unit length"""
+    vector = np.asarray(embedding[:dimensions], dtype=np.float64)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
 class GeminiEmbeddings:
-    def __init__(self) -> None:
+    def __init__(self, cache: Optional[EmbeddingCache] = None) -> None:
         genai.configure(api_key=settings.GEMINI_API_KEY)
         self.model = settings.EMBEDDING_MODEL
+        self.dimensions = settings.EMBEDDING_DIMENSIONS
+        self.reduced = self.dimensions < settings.EMBEDDING_MODEL_DIMENSIONS
+        self.request_options = {"output_dimensionality": self.dimensions} if self.reduced and SUPPORTS_OUTPUT_DIMENSIONALITY else {}
+        # Reduced vectors are cached apart from full-size ones of the same model
+        self.cache_model = f"{self.model}@{self.dimensions}" if self.reduced else self.model
         self.batch_size = settings.EMBEDDING_BATCH_SIZE
-        self.request_count = 0
-        self.last_request_time = time.time()
+        self.rate_limiter = embedding_rate_limiter
+        self.cache = cache or (embedding_cache if settings.EMBEDDING_CACHE_ENABLED else None)
+        self.timeout = settings.EMBEDDING_TIMEOUT
+        self.hedge = settings.EMBEDDING_HEDGE_ENABLED
 
-    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of texts in batches with rate limiting"""
-        logger.info(f"Starting batch embedding for {len(texts)} texts")
-        embeddings: List[List[float]] = []
-        
-        for i in range(0, len(texts), self.batch_size):
-            logger.debug(f"Processing batch: texts[{i}:{i+self.batch_size}]")
-            # Rate limiting
-            current_time = time.time()
-            if current_time - self.last_request_time < 60:  # 1 minute window
-                if self.request_count >= settings.EMBEDDING_MAX_RPM:
-                    logger.warning("Rate limit reached, sleeping...")
-                    await asyncio.sleep(60 - (current_time - self.last_request_time))
-                    self.request_count = 0
-                    self.last_request_time = time.time()
-            else:
-                self.request_count = 0
-                self.last_request_time = current_time
-
-            batch = texts[i:i + self.batch_size]
-            batch_embeddings = [
-                genai.embed_content(
+    def _reduce(self, embeddings: List[List[float]]) -> List[List[float]]:
+        if not self.reduced:
+            return embeddings
+        return [reduce_dimensions(embedding, self.dimensions) for embedding in embeddings]
+
+    async def _embed_batch(self, batch: List[str], task_type: str) -> List[List[float]]:
+        """Embed a batch with a single API request, run in a worker thread so the
+        blocking client call does not stall the event loop"""
+        async with _embedding_semaphore():
+            await self.rate_limiter.acquire(requests=len(batch), priority=Priority.INGEST)
+            # A timed out thread cannot be stopped, but the pipeline no longer waits for it
+            result = await with_timeout(
+                asyncio.to_thread(
+                    genai.embed_content,
                     model=self.model,
-                    content=text,
-                    task_type="retrieval_document"
-                )['embedding']
-                for text in batch
-            ]
-            self.request_count += len(batch)
+                    content=batch,
+                    task_type=task_type,
+                    **self.request_options
+                ),
+                self.timeout,
+                "Embedding request"
+            )
             logger.debug(f"Generated embeddings for batch: {len(batch)} texts")
-            embeddings.extend(batch_embeddings)
+            return self._reduce(result['embedding'])
+
+    async def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.gather(*(
+            self._embed_batch(batch, "retrieval_document") for batch in batches
+        ))
+        logger.debug(f"Embedded {len(texts)} texts in {len(batches)} batches")
+        return [embedding for batch in results for embedding in batch]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for a list of texts, one request per batch with
+        up to EMBEDDING_MAX_CONCURRENCY batches in flight. Cached and repeated
+        texts are embedded at most once."""
+        logger.info(f"Starting batch embedding for {len(texts)} texts")
+        if not self.cache:
+            embeddings = await self._embed_texts(texts)
+            logger.info("Completed generating embeddings for all texts")
+            return embeddings
 
-        logger.info("Completed generating embeddings for all texts")
-        return embeddings
+        cached = await self.cache.get_many(self.cache_model, "retrieval_document", texts)
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, cached) if embedding is None))
+        new_embeddings = dict(zip(missing, await self._embed_texts(missing))) if missing else {}
+        if new_embeddings:
+            await self.cache.put_many(self.cache_model, "retrieval_document", list(new_embeddings), list(new_embeddings.values()))
+
+        logger.info(f"Completed generating embeddings for all texts ({len(texts) - len(missing)} from cache)")
+        return [
+            embedding if embedding is not None else new_embeddings[text]
+            for text, embedding in zip(texts, cached)
+        ]
+
+    async def _embed_query(self, text: str) -> List[float]:
+        """One rate limited query embedding request"""
+        await self.rate_limiter.acquire(priority=Priority.QUERY)
+        started = time.perf_counter()
+        result = await with_timeout(
+            asyncio.to_thread(
+                genai.embed_content,
+                model=self.model,
+                content=text,
+                task_type="retrieval_query",
+                **self.request_options
+            ),
+            self.timeout,
+            "Query embedding request"
+        )
+        query_attempts.record("success", time.perf_counter() - started)
+        return self._reduce([result['embedding']])[0]
+
+    def hedge_delay(self) -> float:
+        if query_attempts.samples < HEDGE_MIN_SAMPLES:
+            return settings.EMBEDDING_HEDGE_DELAY
+        return query_attempts.percentile(0.95)
+
+    async def _embed_query_hedged(self, text: str) -> List[float]:
+        """Send a second identical request if the first has not answered within the
+        p95 latency, and use whichever succeeds first. The hedge goes through the rate
+        limiter like any other request."""
+        primary = asyncio.ensure_future(self._embed_query(text))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+
+        query_attempts.count("hedge_sent")
+        hedge = asyncio.ensure_future(self._embed_query(text))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            query_attempts.count("hedge_won")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
 
     async def aembed_query(self, text: str) -> List[float]:
         """Asynchronously get embeddings for a query"""
+        if not text:
+            raise ValueError("Query text must not be empty")
         logger.info(f"Generating embedding for query: {text[:100]}{'...' if len(text) > 100 else ''}")
         try:
-            result = genai.embed_content(
-                model=self.model,
-                content=text,
-                task_type="retrieval_query"
-            )
+            if self.cache:
+                cached = (await self.cache.get_many(self.cache_model, "retrieval_query", [text]))[0]
+                if cached is not None:
+                    logger.info("Query embedding served from cache")
+                    return cached
+
+            embedding = await (self._embed_query_hedged(text) if self.hedge else self._embed_query(text))
+            if self.cache:
+                await self.cache.put_many(self.cache_model, "retrieval_query", [text], [embedding])
             logger.info("Query embedding generation successful")
-            return result['embedding']
+            return embedding
         except Exception as e:
             logger.error(f"Error generating query embedding: {str(e)}", exc_info=True)
-            raise 
\ No newline at end of file
+            raise
@@ -0,0 +1,250 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from ..db.database import AsyncSessionLocal
+from ..db.models import Document
+from ..schemas.models import IngestJobStatus
+from app.services.ingest_service import IngestService
+from app.services.clients import ServiceClients
+from app.core.settings import settings
+import asyncio
+import os
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IngestJob:
+    """An uploaded file waiting for, or going through, the ingestion pipeline"""
+
+    def __init__(self, session_id: str, filename: str, content_type: str, file: BinaryIO):
+        self.id = uuid.uuid4()
+        self.session_id = session_id
+        self.filename = filename
+        self.content_type = content_type
+        self.file: Optional[BinaryIO] = file
+        file.seek(0, os.SEEK_END)
+        self.size_bytes = file.tell()
+        file.seek(0)
+        self.status = IngestJobStatus.QUEUED
+        self.document_id: Optional[uuid.UUID] = None
+        self.chunk_count: Optional[int] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (IngestJobStatus.INDEXED, IngestJobStatus.FAILED)
+
+    @property
+    def chunks_per_second(self) -> Optional[float]:
+        if not self.chunk_count or not self.started_at or not self.finished_at:
+            return None
+        elapsed = (self.finished_at - self.started_at).total_seconds()
+        return round(self.chunk_count / elapsed, 2) if elapsed > 0 else None
+
+class IngestJobQueue:
+    """In-process ingestion queue drained by a pool of asyncio worker tasks.
+
+    Uploads are validated in the request and handed over here, so the HTTP call
+    returns as soon as the job is queued. Each worker runs the pipeline with its
+    own database session. Job state lives in memory, finished jobs are kept up
+    to INGEST_JOB_RETENTION for status lookups. Failed jobs keep their upload so
+    they can be retried from the last committed chunk, their document is marked
+    failed and left out of retrieval meanwhile. Pruning a failed job deletes its
+    partial document, it can no longer be retried.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = AsyncSessionLocal,
+        workers: int = settings.INGEST_WORKERS,
+        max_queued: int = settings.INGEST_QUEUE_SIZE,
+        retention: int = settings.INGEST_JOB_RETENTION
+    ):
+        self.session_factory = session_factory
+        self.worker_count = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        self._jobs: "OrderedDict[uuid.UUID, IngestJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.clients: Optional[ServiceClients] = None
+
+    def start(self, clients: Optional[ServiceClients] = None) -> None:
+        """Start the workers on the running loop, a no-op if they are already running there.
+        Jobs use the application's shared `clients` once given."""
+        if clients is not None:
+            self.clients = clients
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._workers:
+            return
+        # asyncio primitives are bound to one loop, recreate them if the loop changed
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        for job in self._jobs.values():
+            if not job.finished:
+                self._queue.put_nowait(job)
+        self._workers = [
+            asyncio.create_task(self._worker(i), name=f"ingest-worker-{i}")
+            for i in range(self.worker_count)
+        ]
+        logger.info(f"Started {self.worker_count} ingestion workers")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Stopped ingestion workers")
+
+    async def join(self) -> None:
+        """Wait until every queued job has finished"""
+        if self._queue:
+            await self._queue.join()
+
+    def enqueue(self, session_id: str, filename: str, content_type: str, file: BinaryIO) -> IngestJob:
+        """Queue a validated upload, the queue takes ownership of `file` and closes it when done"""
+        self.start()
+        job = IngestJob(session_id, filename, content_type, file)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            file.close()
+            logger.warning(f"Ingestion queue full ({self.max_queued} jobs), rejecting {filename}")
+            raise HTTPException(status_code=503, detail="Too many files waiting to be processed. Please try again shortly.")
+        self._jobs[job.id] = job
+        logger.info(f"Queued ingestion job {job.id} for {filename} ({job.size_bytes} bytes)")
+        return job
+
+    def retry(self, job_id: uuid.UUID) -> Optional[IngestJob]:
+        """Re-queue a failed job, resuming after the chunks it already committed"""
+        job = self._jobs.get(job_id)
+        if not job:
+            return None
+        if job.status != IngestJobStatus.FAILED or not job.file:
+            raise HTTPException(status_code=409, detail="Only failed jobs can be retried")
+        self.start()
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Too many files waiting to be processed. Please try again shortly.")
+        job.status = IngestJobStatus.QUEUED
+        job.error = None
+        job.finished_at = None
+        logger.info(f"Retrying ingestion job {job.id} from chunk {job.chunk_count or 0}")
+        return job
+
+    def get(self, job_id: uuid.UUID) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def list(self, session_id: Optional[str] = None) -> List[IngestJob]:
+        jobs = [job for job in self._jobs.values() if session_id is None or job.session_id == session_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    async def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.retention, 0)]:
+            job = self._jobs.pop(job_id)
+            job.close()
+            if job.status == IngestJobStatus.FAILED:
+                await self._discard(job)
+
+    def _ingest_service(self, db: AsyncSession) -> IngestService:
+        return self.clients.ingest_service(db) if self.clients else IngestService(db)
+
+    async def _failed_document(self, db: AsyncSession, job: IngestJob) -> Optional[Document]:
+        document = await db.get(Document, job.document_id) if job.document_id else None
+        # A failure after the document was indexed, or deleted, leaves nothing partial
+        if document is None or (document.meta_info or {}).get("status") == "complete":
+            return None
+        return document
+
+    async def _mark_failed(self, job: IngestJob) -> None:
+        try:
+            async with self.session_factory() as db:
+                document = await self._failed_document(db, job)
+                if document:
+                    await self._ingest_service(db).document_service.mark_failed(document, job.error)
+        except Exception as e:
+            logger.error(f"Could not mark the document of ingestion job {job.id} failed: {e}", exc_info=True)
+
+    async def _discard(self, job: IngestJob) -> None:
+        try:
+            async with self.session_factory() as db:
+                document = await self._failed_document(db, job)
+                if document:
+                    await self._ingest_service(db).delete_document(document)
+                    logger.info(f"Deleted partial document {document.id} of pruned ingestion job {job.id}")
+        except Exception as e:
+            logger.error(f"Could not delete the partial document of ingestion job {job.id}: {e}", exc_info=True)
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+                await self._prune()
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestJob) -> None:
+        job.started_at = datetime.utcnow()
+
+        async def on_status(status: str) -> None:
+            job.status = IngestJobStatus(status)
+            logger.debug(f"Ingestion job {job.id}: {status}")
+
+        async def on_progress(document: Document, chunk_count: int) -> None:
+            job.document_id = document.id
+            job.chunk_count = chunk_count
+
+        try:
+            async with self.session_factory() as db:
+                document = await self._ingest_service(db).ingest_content(
+                    job.file,
+                    job.content_type,
+                    job.filename,
+                    job.session_id,
+                    on_status=on_status,
+                    on_progress=on_progress,
+                    document_id=job.document_id
+                )
+            job.chunk_count = document.meta_info.get("chunk_count")
+            job.status = IngestJobStatus.INDEXED
+            # Release the spooled upload once indexed, failed jobs keep it until pruned so they can be retried
+            job.close()
+        except Exception as e:
+            job.error = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Ingestion job {job.id} failed after {job.chunk_count or 0} chunks: {job.error}", exc_info=True)
+            # Before the job can be retried, a resumed run must not be marked failed
+            await self._mark_failed(job)
+            job.status = IngestJobStatus.FAILED
+        finally:
+            job.finished_at = datetime.utcnow()
+
+        if job.status == IngestJobStatus.INDEXED:
+            logger.info(f"Ingestion job {job.id} indexed {job.chunk_count} chunks at {job.chunks_per_second} chunks/s")
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status.value: 0 for status in IngestJobStatus}
+        for job in self._jobs.values():
+            counts[job.status.value] += 1
+        return {
+            "workers": len(self._workers),
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "jobs": counts
+        }
+
+# Process-wide queue, started with the app
+ingest_job_queue = IngestJobQueue()
@@ -1,7 +1,14 @@
 from fastapi import UploadFile, HTTPException
-from sqlalchemy.orm import Session
+from typing import Awaitable, BinaryIO, Callable, Optional, Tuple
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.settings import settings
 from .document_service import DocumentService
+from .dedup import TextFingerprint, file_sha256
+from .parsers import PageSpool, group_rows, table_rows
+from ..db.models import Document
+import tempfile
+import uuid
 import magic
 import pandas as pd
 import logging
@@ -9,70 +16,174 @@ import logging
 logger = logging.getLogger(__name__)
 
 class IngestService:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: AsyncSession,
+        document_service: Optional[DocumentService] = None,
+        mime: Optional[magic.Magic] = None
+    ):
         self.db = db
-        self.document_service = DocumentService(db)
+        self.document_service = document_service or DocumentService(db)
+        # libmagic handles are not thread-safe, only use them from the event loop thread
+        self.mime = mime or magic.Magic(mime=True)
         self.supported_types = settings.SUPPORTED_FILE_TYPES
         
     async def process_dataframe(self, df: pd.DataFrame, session_id: str):
-        content = df.to_string()
-        return await self.document_service.process_document(
-            session_id=session_id,
-            file_content=content,
-            filename="dataframe.txt",
-            file_type="txt"
-        )
+        """Index a DataFrame as row-group chunks that repeat its header"""
+        document = await self.document_service.create_document(session_id, "dataframe.txt", "txt")
+        rows = table_rows(df.astype(object).itertuples(index=False, name=None), first_row=2)
+        return await self.document_service.ingest_pages(document, group_rows([str(column) for column in df.columns], rows))
 
-    async def process_file(self, file: UploadFile, session_id: str):
-        logger.info(f"Processing file: {file.filename} for session_id: {session_id}")
+    async def validate_file(self, file: UploadFile) -> Tuple[BinaryIO, str]:
+        """Stream an upload into a spooled temp file, returning it and the detected MIME type.
+
+        The upload is copied block by block, so at most UPLOAD_SPOOL_SIZE bytes are
+        held in memory and oversized files are rejected as soon as they cross
+        MAX_FILE_SIZE. The MIME type is sniffed from the first block.
+        """
+        await file.seek(0)
+        first_block = await file.read(settings.UPLOAD_CHUNK_SIZE)
+        if not first_block:
+            logger.error("Empty file uploaded")
+            raise HTTPException(status_code=400, detail="Empty file uploaded")
+        
+        content_type = self._get_content_type(first_block)
+        logger.info(f"File upload attempt - Name: {file.filename}, Type: {content_type}")
+        
+        if content_type not in self.supported_types:
+            logger.warning(f"Unsupported file type: {content_type}. Supported types: {self.supported_types}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type. Supported types: {', '.join(self.supported_types.values())}"
+            )
+
+        spooled = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_SIZE)
         try:
-            # Check if file is empty
-            await file.seek(0)
-            first_byte = await file.read(1)
-            if not first_byte:
-                logger.error("Empty file uploaded")
-                raise HTTPException(status_code=400, detail="Empty file uploaded")
-            await file.seek(0)
-            
-            content_type = await self._get_content_type(file)
-            logger.info(f"File upload attempt - Name: {file.filename}, Type: {content_type}")
-            
-            if content_type not in self.supported_types:
-                logger.warning(f"Unsupported file type: {content_type}. Supported types: {self.supported_types}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported file type. Supported types: {', '.join(self.supported_types.values())}"
-                )
+            size = 0
+            block = first_block
+            while block:
+                size += len(block)
+                if size > settings.MAX_FILE_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size is {settings.MAX_FILE_SIZE/1024/1024}MB"
+                    )
+                spooled.write(block)
+                block = await file.read(settings.UPLOAD_CHUNK_SIZE)
+        except BaseException:
+            spooled.close()
+            raise
+        spooled.seek(0)
+        logger.debug(f"Spooled {size} bytes for {file.filename}")
+        return spooled, content_type
+
+    async def ingest_content(
+        self,
+        file: BinaryIO,
+        content_type: str,
+        filename: str,
+        session_id: str,
+        on_status: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_progress: Optional[Callable[[Document, int], Awaitable[None]]] = None,
+        document_id: Optional[uuid.UUID] = None
+    ) -> Document:
+        """Parse, chunk, embed and store a validated file, reporting each stage to `on_status`
+        and committed chunks to `on_progress`. Pass the `document_id` of a failed run to resume it.
+
+        A file already indexed in the session returns its existing document. A file
+        indexed in another session is copied with its embeddings instead of being
+        parsed and embedded again. A file whose normalised text matches a document in
+        the session is dropped once extracted, before it is embedded, in favour of that document. A file whose
+        chunks all near-duplicate chunks of the session is kept, with no chunks of its own.
+        """
+        if on_status:
+            await on_status("parsing")
+        if document_id:
+            document = await self.db.get(Document, document_id)
+            if not document:
+                raise HTTPException(status_code=404, detail="Document not found")
+            # Searchable again as its chunks are committed, like a new document
+            meta_info = {**(document.meta_info or {}), "status": "processing"}
+            meta_info.pop("error", None)
+            document.meta_info = meta_info
+            await self.db.commit()
+            self.document_service.invalidate_document(document)
+        else:
+            content_hash = file_sha256(file)
+            duplicate = await self.document_service.find_indexed_document(session_id, content_hash=content_hash)
+            if duplicate:
+                logger.info(f"{filename} is already indexed as document {duplicate.id}, skipping")
+                if on_progress:
+                    await on_progress(duplicate, duplicate.meta_info.get("chunk_count", 0))
+                return duplicate
+            document = await self.document_service.create_document(
+                session_id, filename, self.supported_types[content_type], content_hash=content_hash
+            )
+            source = await self.document_service.find_indexed_document(content_hash=content_hash, all_chunks=True)
+            if source:
+                await self.document_service.copy_document_chunks(source, document)
+                if on_progress:
+                    await on_progress(document, document.meta_info["chunk_count"])
+                return document
+        if on_progress:
+            await on_progress(document, 0)
 
-            content = await file.read()
-            if len(content) == 0:
-                logger.error("File content is empty")
-                raise HTTPException(status_code=400, detail="File content is empty")
-            
-            file_content = self.document_service.read_file_content(content, content_type)
-            logger.debug(f"Extracted file content of length {len(file_content)} for file: {file.filename}")
-            
-            if not file_content:
-                logger.error(f"Could not extract content from file: {file.filename}")
-                raise HTTPException(status_code=400, detail="Could not extract content from file")
-            
-            logger.info(f"Processing document for session_id: {session_id} - Name: {file.filename}, Size: {len(file_content)} chars")
-            document = await self.document_service.process_document(
-                session_id=session_id,
-                file_content=file_content,
-                filename=file.filename,
-                file_type=self.supported_types[content_type]
+        async def batch_committed(chunk_count: int) -> None:
+            if on_status:
+                await on_status("embedding")
+            if on_progress:
+                await on_progress(document, chunk_count)
+
+        # Extraction runs in the parser process pool. Pages are spooled to disk as they are
+        # fingerprinted, and only embedded once the text is known not to be a duplicate.
+        logger.info(f"Processing document for session_id: {session_id} - Name: {filename}")
+        fingerprint = TextFingerprint()
+        with PageSpool() as spool:
+            async for page in fingerprint.wrap(self.document_service.read_file_pages(file, content_type)):
+                spool.write(page)
+
+            document.text_hash = fingerprint.hexdigest()
+            duplicate = document.text_hash and await self.document_service.find_indexed_document(
+                session_id, text_hash=document.text_hash, exclude=document.id
             )
-            
-            logger.info(f"Successfully processed document: {str(document.id)}")
+            if duplicate:
+                logger.info(f"{filename} has the same text as document {duplicate.id}, dropping document {document.id}")
+                await self.delete_document(document)
+                if on_progress:
+                    await on_progress(duplicate, duplicate.meta_info.get("chunk_count", 0))
+                return duplicate
+
+            await self.document_service.ingest_pages(document, spool, on_progress=batch_committed)
+
+        # Chunks skipped as near duplicates are content, already covered by the session
+        if not document.meta_info.get("chunk_count") and not document.meta_info.get("near_duplicate_chunks"):
+            logger.error(f"Could not extract content from file: {filename}")
+            await self.delete_document(document)
+            raise HTTPException(status_code=400, detail="Could not extract content from file")
+        await self.db.commit()
+        
+        logger.info(f"Successfully processed document: {str(document.id)}")
+        return document
+
+    async def delete_document(self, document: Document) -> None:
+        # Chunks go with it through ON DELETE CASCADE, without loading them
+        await self.db.execute(delete(Document).where(Document.id == document.id))
+        await self.db.commit()
+        self.document_service.invalidate_document(document)
+
+    async def process_file(self, file: UploadFile, session_id: str):
+        """Validate and ingest an upload inline"""
+        logger.info(f"Processing file: {file.filename} for session_id: {session_id}")
+        try:
+            spooled, content_type = await self.validate_file(file)
+            with spooled:
+                document = await self.ingest_content(spooled, content_type, file.filename, session_id)
             return {"status": "success", "document_id": str(document.id)}
-            
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error processing file: {str(e)}", exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def _get_content_type(self, file: UploadFile) -> str:
-        header = await file.read(2048)
-        await file.seek(0)
-        mime = magic.Magic(mime=True)
-        return mime.from_buffer(header) 
\ No newline at end of file
+    def _get_content_type(self, header: bytes) -> str:
+        return self.mime.from_buffer(header[:2048])
@@ -1,50 +1,123 @@
 import google.generativeai as genai
 from app.core.settings import settings
-from typing import List, Dict
-import time
+from app.services.rate_limiter import llm_rate_limiter, estimate_tokens, Priority
+from app.services.resilience import (
+    AttemptLog,
+    CircuitBreaker,
+    RetryPolicy,
+    call_with_retry,
+    classify,
+    is_retryable,
+    with_deadline,
+    with_timeout
+)
+from typing import AsyncIterator, List, Dict, Optional
 import logging
-from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
+# Process-wide, so every LLMService sees the same upstream health
+llm_circuit_breaker = CircuitBreaker("llm")
+llm_attempts = AttemptLog()
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, retry_policy: Optional[RetryPolicy] = None, circuit_breaker: Optional[CircuitBreaker] = None):
         genai.configure(api_key=settings.GEMINI_API_KEY)
         self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
         self.temperature = settings.TEMPERATURE
         self.max_tokens = settings.MAX_TOKENS
+        self.rate_limiter = llm_rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or llm_circuit_breaker
+        self.attempts = llm_attempts
+        self.timeout = settings.LLM_TIMEOUT
 
-    async def generate_response(
-        self, 
-        messages: List[Dict[str, str]], 
-        max_retries: int = 3,
-        retry_delay: float = 1.0
-    ) -> str:
-        """Generate a response using the Gemini model with retry logic"""
-        # Format conversation history
-        conversation = "\n".join([
+    def _format_conversation(self, messages: List[Dict[str, str]]) -> str:
+        return "\n".join([
             f"{msg['role'].upper()}: {msg['content']}"
             for msg in messages
         ])
-        
-        for attempt in range(max_retries):
-            try:
-                response = await self.model.generate_content_async(
-                    conversation,
-                    generation_config={
-                        'temperature': self.temperature,
-                        'max_output_tokens': self.max_tokens,
-                    }
-                )
-                logger.info("LLM generation successful.")
-                return response.text
-                
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    error_msg = f"Failed to generate response after {max_retries} attempts: {str(e)}"
-                    logger.error(error_msg)
-                    return "I apologize, but I'm having trouble generating a response right now. Please try again in a moment."
-                else:
-                    logger.warning(f"Attempt {attempt + 1} failed, retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
\ No newline at end of file
+
+    def _generation_config(self) -> Dict[str, float]:
+        return {
+            'temperature': self.temperature,
+            'max_output_tokens': self.max_tokens,
+        }
+
+    async def _generate(self, conversation: str, stream: bool = False):
+        """One attempt, rate limited: the prompt plus the most the response can add
+        count against the TPM quota. The timeout starts once the request is sent."""
+        await self.rate_limiter.acquire(
+            tokens=estimate_tokens(conversation) + self.max_tokens,
+            priority=Priority.QUERY
+        )
+        return await with_timeout(
+            self.model.generate_content_async(
+                conversation,
+                generation_config=self._generation_config(),
+                stream=stream
+            ),
+            self.timeout,
+            "LLM request"
+        )
+
+    async def generate_response(self, messages: List[Dict[str, str]], deadline: Optional[float] = None) -> str:
+        """Generate a response using the Gemini model, retrying transient failures
+        until the monotonic `deadline`.
+
+        Raises UpstreamError subclasses when generation fails.
+        """
+        conversation = self._format_conversation(messages)
+        response = await with_deadline(
+            call_with_retry(
+                "LLM generation",
+                lambda: self._generate(conversation),
+                self.retry_policy,
+                self.circuit_breaker,
+                self.attempts,
+                deadline=deadline
+            ),
+            deadline,
+            "LLM generation"
+        )
+        logger.info("LLM generation successful.")
+        return response.text
+
+    async def stream_response(self, messages: List[Dict[str, str]], deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Stream response text from the Gemini model as chunks arrive.
+
+        Opening the stream is retried like generate_response and must succeed before
+        `deadline`. After that each chunk must arrive within LLM_TIMEOUT; a failure
+        once text has been streamed is raised as an UpstreamError without retrying.
+        """
+        conversation = self._format_conversation(messages)
+        response = await with_deadline(
+            call_with_retry(
+                "LLM streaming",
+                lambda: self._generate(conversation, stream=True),
+                self.retry_policy,
+                self.circuit_breaker,
+                self.attempts,
+                deadline=deadline
+            ),
+            deadline,
+            "LLM streaming"
+        )
+        chunks = response.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await with_timeout(chunks.__anext__(), self.timeout, "LLM stream")
+                except StopAsyncIteration:
+                    break
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            error = classify(e)
+            if error is None:
+                raise
+            if is_retryable(error):
+                self.circuit_breaker.record_failure()
+            logger.error(f"LLM stream interrupted: {error}")
+            raise error from e
+        logger.info("LLM streaming generation complete.")
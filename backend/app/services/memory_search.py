@@ -0,0 +1,263 @@
+"""In-process vector search for small sessions.
+
+A session's chunk embeddings are loaded once into a contiguous float32 matrix
+(optionally memory-mapped from IN_MEMORY_SEARCH_MMAP_DIR) and scored against a
+query with one matrix-vector product, the top k picked with argpartition.
+Sessions are kept in an LRU and dropped whenever one of their documents gets
+or loses chunks. Sessions with more than `max_chunks` chunks are left to
+pgvector. Like the response cache, each worker process keeps its own, so a
+held session is checked against the version of its chunks in the database
+(their count and latest created_at) before every search, and reloaded when
+another worker changed them.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.settings import settings
+import numpy as np
+import os
+import tempfile
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Documents of the session whose chunks are searched, a failed ingestion keeps its chunks for a retry but out of results
+SESSION_DOCUMENTS = "d.session_id = :session_id AND d.meta_info->>'status' IS DISTINCT FROM 'failed'"
+
+# (chunk count, latest chunk created_at) of a session, changes whenever chunks are added or removed
+SessionVersion = Tuple[int, Optional[datetime]]
+
+# (chunk id, document id, chunk index, content, filename, distance), as returned by the SQL search
+SearchRow = Tuple[uuid.UUID, uuid.UUID, int, str, str, float]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], weights: Sequence[float], k: int, limit: int) -> List[Any]:
+    """Ids of several rankings ordered by weighted reciprocal rank, sum of weight / (k + rank)"""
+    scores: Dict[Any, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, id in enumerate(ranking, start=1):
+            scores[id] = scores.get(id, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+class SessionVectors:
+    """Chunks of one session: their embeddings as the rows of one float32 matrix,
+    and the fields retrieval returns"""
+
+    def __init__(
+        self,
+        ids: List[uuid.UUID],
+        document_ids: List[uuid.UUID],
+        chunk_indexes: List[int],
+        contents: List[str],
+        filenames: List[str],
+        matrix: np.ndarray,
+        metric: str = settings.VECTOR_DISTANCE_METRIC,
+        version: Optional[SessionVersion] = None
+    ):
+        self.ids = ids
+        self.document_ids = document_ids
+        self.chunk_indexes = chunk_indexes
+        self.contents = contents
+        self.filenames = filenames
+        self.matrix = matrix
+        self.metric = metric
+        self.version = version
+        self.norms = np.linalg.norm(matrix, axis=1)
+        self._positions = {id: position for position, id in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def distances(self, query: List[float]) -> np.ndarray:
+        """Distance of every chunk to `query`, with the same metric as the SQL operators"""
+        query = np.asarray(query, dtype=np.float32)
+        dots = self.matrix @ query
+        if self.metric == "inner_product":
+            return -dots
+        if self.metric == "l2":
+            return np.sqrt(np.maximum(self.norms ** 2 - 2 * dots + query @ query, 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 1 - dots / (self.norms * np.linalg.norm(query))
+
+    def nearest(
+        self,
+        distances: np.ndarray,
+        limit: int,
+        document_ids: Optional[Iterable[Any]] = None,
+        max_distance: Optional[float] = None
+    ) -> np.ndarray:
+        """Positions of the `limit` nearest chunks in distance order, then those
+        further than `max_distance` dropped"""
+        positions = np.arange(len(self))
+        if document_ids:
+            wanted = {uuid.UUID(str(document_id)) for document_id in document_ids}
+            positions = positions[np.fromiter((id in wanted for id in self.document_ids), bool, len(self))]
+        if limit < len(positions):
+            positions = positions[np.argpartition(distances[positions], limit - 1)[:limit]]
+        positions = positions[np.argsort(distances[positions], kind="stable")]
+        if max_distance is not None:
+            positions = positions[distances[positions] <= max_distance]
+        return positions
+
+    def position(self, chunk_id: uuid.UUID) -> Optional[int]:
+        return self._positions.get(chunk_id)
+
+    def rows(self, positions: Iterable[int], distances: np.ndarray) -> List[SearchRow]:
+        return [
+            (self.ids[p], self.document_ids[p], self.chunk_indexes[p], self.contents[p], self.filenames[p], float(distances[p]))
+            for p in positions
+        ]
+
+class InMemoryVectorSearch:
+    """LRU of the SessionVectors of recently searched sessions"""
+
+    def __init__(
+        self,
+        max_sessions: int = settings.IN_MEMORY_SEARCH_MAX_SESSIONS,
+        max_chunks: int = settings.IN_MEMORY_SEARCH_MAX_CHUNKS,
+        mmap_dir: str = settings.IN_MEMORY_SEARCH_MMAP_DIR
+    ):
+        self.max_sessions = max_sessions
+        self.max_chunks = max_chunks
+        self.mmap_dir = mmap_dir
+        # None marks a session too large to hold, searched with pgvector
+        self._sessions: "OrderedDict[uuid.UUID, Optional[SessionVectors]]" = OrderedDict()
+        # Bumped on every invalidation, a load that raced with one is not kept
+        self._generation = 0
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    async def get(self, db: AsyncSession, session_id: Any) -> Optional[SessionVectors]:
+        """The session's vectors, loaded on first use or when their version changed,
+        None if it is too large"""
+        key = uuid.UUID(str(session_id))
+        generation = self._generation
+        held = self._sessions.get(key)
+        if key in self._sessions and held is None:
+            # Searched with pgvector, which is never stale
+            self._sessions.move_to_end(key)
+            self.hits += 1
+            return None
+        version = await self.version(db, key)
+        if held is not None and key in self._sessions:
+            if held.version == version:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+                return held
+            # Changed by another worker, this one was never told
+            logger.debug(f"Session {key} changed from {held.version} to {version}, reloading it")
+            self._drop(key)
+            self.stale += 1
+        vectors = await self.load(db, key, version)
+        self.loads += 1
+        if self._generation == generation:
+            self.put(key, vectors)
+        return vectors
+
+    async def version(self, db: AsyncSession, session_id: uuid.UUID) -> SessionVersion:
+        row = (await db.execute(
+            text(f"""
+            SELECT count(*) AS chunks, max(c.created_at) AS created_at
+            FROM document_chunks c
+            JOIN documents d ON d.id = c.document_id
+            WHERE {SESSION_DOCUMENTS} AND c.embedding IS NOT NULL
+            """),
+            {"session_id": session_id}
+        )).one()
+        return row.chunks, row.created_at
+
+    async def load(self, db: AsyncSession, session_id: uuid.UUID, version: SessionVersion) -> Optional[SessionVectors]:
+        if version[0] > self.max_chunks:
+            logger.debug(f"Session {session_id} has more than {self.max_chunks} chunks, searching it with pgvector")
+            return None
+        rows = (await db.execute(
+            text(f"""
+            SELECT c.id, c.document_id, c.chunk_index, c.content, d.filename, c.embedding::real[] AS embedding
+            FROM document_chunks c
+            JOIN documents d ON d.id = c.document_id
+            WHERE {SESSION_DOCUMENTS} AND c.embedding IS NOT NULL
+            ORDER BY c.document_id, c.chunk_index
+            """),
+            {"session_id": session_id}
+        )).fetchall()
+        matrix = np.asarray([row.embedding for row in rows], dtype=np.float32).reshape(len(rows), settings.EMBEDDING_DIMENSIONS)
+        if self.mmap_dir:
+            matrix = self._memory_map(session_id, matrix)
+        logger.debug(f"Loaded {len(rows)} chunk embeddings of session {session_id}")
+        return SessionVectors(
+            [row.id for row in rows],
+            [row.document_id for row in rows],
+            [row.chunk_index for row in rows],
+            [row.content for row in rows],
+            [row.filename for row in rows],
+            matrix,
+            version=version
+        )
+
+    def _path(self, session_id: uuid.UUID) -> str:
+        # Per process, workers sharing the directory each map their own files
+        return os.path.join(self.mmap_dir, f"{session_id}.{os.getpid()}.npy")
+
+    def _memory_map(self, session_id: uuid.UUID, matrix: np.ndarray) -> np.ndarray:
+        os.makedirs(self.mmap_dir, exist_ok=True)
+        path = self._path(session_id)
+        # Written aside and renamed over, a mapped file is never truncated in place
+        # (a reader of the old mapping would get SIGBUS), it keeps the old inode
+        with tempfile.NamedTemporaryFile(dir=self.mmap_dir, suffix=".npy.tmp", delete=False) as file:
+            try:
+                np.save(file, matrix)
+            except BaseException:
+                os.remove(file.name)
+                raise
+        os.replace(file.name, path)
+        return np.load(path, mmap_mode="r")
+
+    def put(self, session_id: Any, vectors: Optional[SessionVectors]) -> None:
+        key = uuid.UUID(str(session_id))
+        self._sessions[key] = vectors
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def _drop(self, session_id: uuid.UUID) -> None:
+        self._sessions.pop(session_id, None)
+        if self.mmap_dir:
+            try:
+                os.remove(self._path(session_id))
+            except FileNotFoundError:
+                pass
+
+    def invalidate_session(self, session_id: Any) -> None:
+        """Forget a session whose chunks changed, it is reloaded on its next search"""
+        key = uuid.UUID(str(session_id))
+        self._generation += 1
+        if key in self._sessions:
+            self._drop(key)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        for session_id in list(self._sessions):
+            self._drop(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        searches = self.hits + self.loads
+        return {
+            "enabled": settings.IN_MEMORY_SEARCH_ENABLED,
+            "hits": self.hits,
+            "loads": self.loads,
+            "hit_rate": round(self.hits / searches, 4) if searches else None,
+            "sessions": sum(vectors is not None for vectors in self._sessions.values()),
+            "chunks": sum(len(vectors) for vectors in self._sessions.values() if vectors is not None),
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale": self.stale
+        }
+
+# Process-wide index shared by every DocumentService instance
+memory_search = InMemoryVectorSearch()
@@ -0,0 +1,41 @@
+"""Keyset pagination on (created_at, id).
+
+Pages are read newest first with a row comparison against the last row of the
+previous page, so every page is an index range scan however deep it is. Cursors
+are opaque to clients: the (created_at, id) of that last row, base64 encoded.
+"""
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple, TypeVar
+from sqlalchemy import Select, tuple_
+from fastapi import HTTPException
+import base64
+import uuid
+
+T = TypeVar("T")
+
+def encode_cursor(created_at: datetime, id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """(created_at, id) of a cursor, HTTPException 400 if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def newest_first(query: Select, model, limit: int, cursor: Optional[str] = None) -> Select:
+    """`query` ordered newest first, starting after `cursor`, fetching one extra row
+    to tell whether another page follows"""
+    if cursor:
+        query = query.where(tuple_(model.created_at, model.id) < tuple_(*decode_cursor(cursor)))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+def page(rows: Sequence[T], limit: int) -> Tuple[List[T], Optional[str]]:
+    """Rows of a newest_first query trimmed to `limit`, and the cursor of the next page if any"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,276 @@
+"""File parsers run in a process pool, so CPU-bound extraction never blocks the event loop.
+
+Worker functions are top-level and are given a file path, so only the path and a
+page range cross the process boundary. PDFs are sharded into PDF_PAGES_PER_SHARD page
+ranges extracted in parallel, two shards per worker in flight, and pages are yielded
+in order as shards finish. CSV and Excel files are read row by row into TableChunks:
+groups of rows that repeat the header, sized to TABLE_CHUNK_SIZE, with every sheet
+of a workbook included. A worker writes them to a spool file as they are made, and
+they are read back one at a time, so no process holds a whole table.
+"""
+from concurrent.futures import Executor, ProcessPoolExecutor
+from collections import deque
+from typing import Any, AsyncIterator, BinaryIO, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from app.core.settings import settings
+import PyPDF2
+import openpyxl
+import pandas as pd
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+_parser_pool: Optional[ProcessPoolExecutor] = None
+
+def get_parser_pool() -> Optional[Executor]:
+    """Shared process pool, or None to parse in a thread when PARSER_WORKERS is 0"""
+    global _parser_pool
+    if not settings.PARSER_WORKERS:
+        return None
+    if _parser_pool is None:
+        # spawn: forking a process that runs an event loop and thread pools is unsafe
+        _parser_pool = ProcessPoolExecutor(
+            max_workers=settings.PARSER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        logger.info(f"Started parser pool with {settings.PARSER_WORKERS} workers")
+    return _parser_pool
+
+def shutdown_parser_pool() -> None:
+    global _parser_pool
+    if _parser_pool is not None:
+        _parser_pool.shutdown(cancel_futures=True)
+        _parser_pool = None
+
+# Parsers accept a path (in pool workers) or an open binary file (inline)
+Source = Union[str, BinaryIO]
+
+def pdf_page_count(source: Source) -> int:
+    return len(PyPDF2.PdfReader(source).pages)
+
+def extract_pdf_pages(source: Source, start: int = 0, stop: Optional[int] = None) -> List[str]:
+    """Text of pages [start, stop)"""
+    pages = PyPDF2.PdfReader(source).pages
+    stop = len(pages) if stop is None else min(stop, len(pages))
+    return [pages[i].extract_text() for i in range(start, stop)]
+
+class TableChunk(str):
+    """Rows of one table with its header line, kept whole by the text splitter.
+    `meta_info` holds the sheet (None for CSV) and the range of row numbers."""
+
+    meta_info: Dict[str, Any]
+
+def dump_page(page: str) -> str:
+    """One JSON line for a page, keeping the meta_info of a TableChunk"""
+    record: Dict[str, Any] = {"text": str(page)}
+    if isinstance(page, TableChunk):
+        record["meta_info"] = page.meta_info
+    return json.dumps(record) + "\n"
+
+def load_page(line: str) -> str:
+    record = json.loads(line)
+    if "meta_info" not in record:
+        return record["text"]
+    page = TableChunk(record["text"])
+    page.meta_info = record["meta_info"]
+    return page
+
+class PageSpool:
+    """Extracted pages buffered in a temporary file, so a document can be read a
+    second time without holding its text in memory"""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+
+    def write(self, page: str) -> None:
+        self._file.write(dump_page(page))
+
+    def __iter__(self) -> Iterator[str]:
+        self._file.seek(0)
+        for line in self._file:
+            yield load_page(line)
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "PageSpool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def _cell(value: Any) -> str:
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    # Line breaks inside a cell would break the one-row-per-line layout
+    return " ".join(str(value).split())
+
+def _trim(values: Sequence[str]) -> List[str]:
+    values = list(values)
+    while values and not values[-1]:
+        values.pop()
+    return values
+
+def group_rows(
+    header: Sequence[str],
+    rows: Iterable[Tuple[int, Sequence[str]]],
+    sheet: Optional[str] = None,
+    chunk_size: Optional[int] = None
+) -> Iterator[TableChunk]:
+    """TableChunks of (row number, cells) rows, as many rows per chunk as fit `chunk_size`
+    characters after the header line. A row longer than that gets a chunk of its own."""
+    chunk_size = chunk_size or settings.TABLE_CHUNK_SIZE
+    header_line = " | ".join(header)
+    lines: List[str] = []
+    first = last = 0
+    size = 0
+
+    def chunk() -> TableChunk:
+        label = f"Sheet '{sheet}', rows {first}-{last}" if sheet is not None else f"Rows {first}-{last}"
+        table_chunk = TableChunk("\n".join([label, header_line] + lines))
+        table_chunk.meta_info = {"sheet": sheet, "row_start": first, "row_end": last}
+        return table_chunk
+
+    for number, values in rows:
+        line = " | ".join(values)
+        if lines and len(header_line) + size + len(line) > chunk_size:
+            yield chunk()
+            lines, size = [], 0
+        if not lines:
+            first = number
+        lines.append(line)
+        size += len(line) + 1
+        last = number
+    if lines:
+        yield chunk()
+
+def table_rows(rows: Iterable[Sequence[Any]], first_row: int = 1) -> Iterator[Tuple[int, List[str]]]:
+    """Numbered rows as cell strings, empty rows skipped"""
+    for number, values in enumerate(rows, first_row):
+        cells = _trim([_cell(value) for value in values])
+        if cells:
+            yield number, cells
+
+def _csv_chunks(source: Source) -> Iterator[TableChunk]:
+    # Every cell as read, no type inference, TABLE_ROWS_PER_READ rows in memory at a time
+    with pd.read_csv(source, chunksize=settings.TABLE_ROWS_PER_READ, dtype=str, keep_default_na=False) as reader:
+        frames = iter(reader)
+        first = next(frames, None)
+        if first is None:
+            return
+        header = [_cell(column) for column in first.columns]
+        rows = itertools.chain.from_iterable(
+            frame.itertuples(index=False, name=None) for frame in itertools.chain([first], frames)
+        )
+        # Row 1 is the header
+        yield from group_rows(header, table_rows(rows, first_row=2))
+
+def _excel_chunks(source: Source) -> Iterator[TableChunk]:
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            # Stored dimensions are often wrong, let the reader find the used range
+            sheet.reset_dimensions()
+            rows = table_rows(sheet.iter_rows(values_only=True))
+            header_row = next(rows, None)
+            if header_row is None:
+                continue
+            yield from group_rows(header_row[1], rows, sheet=sheet.title)
+    finally:
+        workbook.close()
+
+def iter_table(source: Source, content_type: str) -> Iterator[TableChunk]:
+    """Row-group chunks of a CSV file or of every sheet of a workbook"""
+    if content_type == 'text/csv':
+        return _csv_chunks(source)
+    return _excel_chunks(source)
+
+def parse_table(source: Source, content_type: str) -> List[TableChunk]:
+    return list(iter_table(source, content_type))
+
+def spool_table(source: Source, content_type: str, spool_path: str) -> int:
+    """Write the chunks of iter_table to `spool_path` as dump_page lines, returns their count"""
+    count = 0
+    with open(spool_path, "w", encoding="utf-8") as spool:
+        for chunk in iter_table(source, content_type):
+            spool.write(dump_page(chunk))
+            count += 1
+    return count
+
+def parse_text(source: Source, content_type: str) -> str:
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            return parse_text(file, content_type)
+    if content_type == 'application/json':
+        return json.dumps(json.load(source), indent=2)
+    return source.read().decode('utf-8')
+
+def is_table(content_type: str) -> bool:
+    return content_type == 'text/csv' or content_type.startswith('application/vnd.openxmlformats')
+
+async def _run(pool: Optional[Executor], func, *args):
+    if pool is None:
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+async def iter_pages(path: str, content_type: str, pool: Optional[Executor] = None) -> AsyncIterator[str]:
+    """Extracted text of the file at `path`, page by page for PDFs, as TableChunks for
+    CSV and Excel and in one piece otherwise"""
+    pool = pool or get_parser_pool()
+    if content_type == 'application/pdf':
+        page_count = await _run(pool, pdf_page_count, path)
+        shard_size = settings.PDF_PAGES_PER_SHARD
+        starts = iter(range(0, page_count, shard_size))
+        # Enough to keep every worker busy, without holding the text of every page
+        in_flight = max(settings.PARSER_WORKERS, 1) * 2
+        shards: Deque[asyncio.Future] = deque()
+
+        def submit(count: int = 1) -> None:
+            for start in itertools.islice(starts, count):
+                shards.append(asyncio.ensure_future(_run(pool, extract_pdf_pages, path, start, start + shard_size)))
+
+        logger.debug(f"Extracting {page_count} PDF pages in shards of {shard_size}, {in_flight} at a time")
+        submit(in_flight)
+        try:
+            while shards:
+                pages = await shards.popleft()
+                submit()
+                for page in pages:
+                    yield page
+        finally:
+            for shard in shards:
+                shard.cancel()
+    elif is_table(content_type):
+        fd, spool_path = tempfile.mkstemp(prefix="table-", suffix=".jsonl")
+        os.close(fd)
+        try:
+            count = await _run(pool, spool_table, path, content_type, spool_path)
+            logger.debug(f"Extracted {count} table chunks")
+            with open(spool_path, encoding="utf-8") as spool:
+                for line in spool:
+                    yield load_page(line)
+        finally:
+            os.unlink(spool_path)
+    else:
+        # JSON and plain text are cheap to parse, keep them out of the process pool
+        yield await asyncio.to_thread(parse_text, path, content_type)
+
+async def iter_file_pages(file: BinaryIO, content_type: str, pool: Optional[Executor] = None) -> AsyncIterator[str]:
+    """iter_pages for an open file, copied to a named temp file the workers can open"""
+    fd, path = tempfile.mkstemp(prefix="upload-")
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            file.seek(0)
+            await asyncio.to_thread(shutil.copyfileobj, file, target)
+        async for page in iter_pages(path, content_type, pool):
+            yield page
+    finally:
+        os.unlink(path)
@@ -0,0 +1,153 @@
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.settings import settings
+import asyncio
+import heapq
+import itertools
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Priority(IntEnum):
+    """Lower value is served first"""
+    QUERY = 0
+    INGEST = 1
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for rate limiting (~4 characters per token)"""
+    return max(len(text) // 4, 1)
+
+class TokenBucketRateLimiter:
+    """Async token bucket enforcing requests-per-minute and tokens-per-minute.
+
+    Both buckets start full and refill continuously. Waiters are served strictly by
+    priority, then arrival order, so chat queries overtake queued ingestion batches.
+    One instance is shared per process (see the module-level limiters below), so the
+    limit holds no matter how many service objects are created per request.
+    """
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: Optional[int] = None):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_bucket = float(requests_per_minute)
+        self._token_bucket = float(tokens_per_minute or 0)
+        self._last_refill = time.monotonic()
+        self._sequence = itertools.count()
+        self._waiters: List[Tuple[int, int]] = []
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.total_acquired = 0
+        self.total_wait_seconds = 0.0
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio primitives are bound to one loop, recreate them if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self._waiters = []
+        return self._condition
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_bucket = min(
+            float(self.requests_per_minute),
+            self._request_bucket + elapsed * self.requests_per_minute / 60
+        )
+        if self.tokens_per_minute:
+            self._token_bucket = min(
+                float(self.tokens_per_minute),
+                self._token_bucket + elapsed * self.tokens_per_minute / 60
+            )
+
+    def _try_consume(self, requests: int, tokens: int) -> float:
+        """Consume capacity if available, otherwise return the seconds until it will be"""
+        self._refill()
+        request_deficit = requests - self._request_bucket
+        token_deficit = tokens - self._token_bucket if self.tokens_per_minute else 0
+        if request_deficit <= 0 and token_deficit <= 0:
+            self._request_bucket -= requests
+            if self.tokens_per_minute:
+                self._token_bucket -= tokens
+            return 0.0
+        wait = max(request_deficit, 0) * 60 / self.requests_per_minute
+        if token_deficit > 0:
+            wait = max(wait, token_deficit * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens: int = 0, requests: int = 1, priority: Priority = Priority.QUERY) -> None:
+        """Wait until `requests` calls carrying `tokens` tokens may be sent"""
+        condition = self._get_condition()
+        # A single call larger than the bucket could never pass, let it through once the bucket is full
+        requests = min(requests, self.requests_per_minute)
+        tokens = min(tokens, self.tokens_per_minute) if self.tokens_per_minute else 0
+        entry = (int(priority), next(self._sequence))
+        started = time.monotonic()
+
+        # Queued before taking the lock so queue_depth and priority include every caller
+        heapq.heappush(self._waiters, entry)
+        try:
+            async with condition:
+                try:
+                    while True:
+                        if self._waiters[0] != entry:
+                            await condition.wait()
+                            continue
+                        wait = self._try_consume(requests, tokens)
+                        if wait <= 0:
+                            break
+                        logger.debug(f"Rate limiter '{self.name}' waiting {wait:.2f}s ({len(self._waiters)} queued)")
+                        try:
+                            # Re-checked when the deficit refills or another waiter leaves the queue
+                            await asyncio.wait_for(condition.wait(), timeout=wait)
+                        except asyncio.TimeoutError:
+                            pass
+                finally:
+                    self._remove_waiter(entry)
+                    condition.notify_all()
+        finally:
+            if entry in self._waiters:
+                # Cancelled before taking the lock, wake the others so the new head is served
+                self._remove_waiter(entry)
+                asyncio.ensure_future(self._notify_all(condition))
+
+        waited = time.monotonic() - started
+        self.total_acquired += requests
+        self.total_wait_seconds += waited
+        if waited > 1:
+            logger.warning(f"Rate limiter '{self.name}' delayed a {Priority(entry[0]).name.lower()} call by {waited:.1f}s")
+
+    def _remove_waiter(self, entry: Tuple[int, int]) -> None:
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    @staticmethod
+    async def _notify_all(condition: asyncio.Condition) -> None:
+        async with condition:
+            condition.notify_all()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "queue_depth": self.queue_depth,
+            "queued_by_priority": {
+                priority.name.lower(): sum(1 for waiter in self._waiters if waiter[0] == priority)
+                for priority in Priority
+            },
+            "available_requests": round(self._request_bucket, 2),
+            "available_tokens": round(self._token_bucket, 2) if self.tokens_per_minute else None,
+            "total_acquired": self.total_acquired,
+            "total_wait_seconds": round(self.total_wait_seconds, 3)
+        }
+
+# Process-wide limiters, one per Gemini quota
+llm_rate_limiter = TokenBucketRateLimiter("llm", settings.MAX_RPM, settings.MAX_TPM)
+embedding_rate_limiter = TokenBucketRateLimiter("embedding", settings.EMBEDDING_MAX_RPM)
@@ -0,0 +1,286 @@
+"""Retries, deadlines and circuit breaking for calls to upstream APIs.
+
+Upstream failures are classified into typed errors the API layer maps to
+responses: UpstreamRateLimitError (429), UpstreamUnavailableError and
+CircuitOpenError (503), DeadlineExceededError (504) and UpstreamError for
+other rejected requests (502). Any other exception is a bug on our side, not
+an upstream failure, and propagates unchanged.
+"""
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from google.api_core import exceptions as google_exceptions
+from app.core.settings import settings
+import asyncio
+import random
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class UpstreamError(Exception):
+    """An upstream call failed and retrying will not help"""
+
+    status_code = 502
+    detail = "The upstream service rejected the request."
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class UpstreamRateLimitError(UpstreamError):
+    status_code = 429
+    detail = "The upstream service is rate limiting requests. Please try again shortly."
+
+class UpstreamUnavailableError(UpstreamError):
+    status_code = 503
+    detail = "The upstream service is temporarily unavailable. Please try again shortly."
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Failing fast, the upstream has failed repeatedly and is not being called"""
+
+class DeadlineExceededError(UpstreamError):
+    """The latency budget of the whole operation ran out"""
+
+    status_code = 504
+    detail = "The request took too long to complete. Please try again."
+
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted,
+    google_exceptions.Unknown,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Server-requested delay in seconds, from a Retry-After header or a gRPC RetryInfo detail"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+    for detail in getattr(error, "details", None) or ():
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    return None
+
+def classify(error: BaseException) -> Optional[UpstreamError]:
+    """Typed error for an upstream failure, retryable unless it is a plain UpstreamError.
+    None when the error did not come from the upstream."""
+    if isinstance(error, UpstreamError):
+        return error
+    message = f"{type(error).__name__}: {error}"
+    if isinstance(error, RATE_LIMIT_ERRORS):
+        return UpstreamRateLimitError(message, retry_after=retry_after(error))
+    if isinstance(error, TRANSIENT_ERRORS):
+        return UpstreamUnavailableError(message, retry_after=retry_after(error))
+    if isinstance(error, google_exceptions.GoogleAPIError):
+        return UpstreamError(message)
+    return None
+
+def is_retryable(error: UpstreamError) -> bool:
+    return isinstance(error, (UpstreamRateLimitError, UpstreamUnavailableError)) and not isinstance(error, CircuitOpenError)
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than a server's Retry-After"""
+
+    def __init__(
+        self,
+        max_attempts: int = settings.LLM_MAX_ATTEMPTS,
+        base_delay: float = settings.LLM_RETRY_BASE_DELAY,
+        max_delay: float = settings.LLM_RETRY_MAX_DELAY
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait after failed attempt number `attempt` (0-based)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets one probe through: success closes it, failure
+    opens it again."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = settings.LLM_CIRCUIT_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError instead of calling an upstream that is down"""
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit open", retry_after=remaining)
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit half open, probe in flight", retry_after=1.0)
+            self._probing = True
+
+    def release(self) -> None:
+        """Let another probe through after one was abandoned without an outcome"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"{self.name} circuit closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"{self.name} circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected
+        }
+
+class AttemptLog:
+    """Outcome counts and latencies of recent attempts"""
+
+    def __init__(self, size: int = 1000):
+        self.outcomes: Dict[str, int] = {}
+        self._latencies: Deque[float] = deque(maxlen=size)
+
+    def record(self, outcome: str, latency: float) -> None:
+        self.count(outcome)
+        self._latencies.append(latency)
+
+    def count(self, outcome: str) -> None:
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "outcomes": dict(self.outcomes),
+            "latency_p50": round(p50, 3) if p50 is not None else None,
+            "latency_p95": round(p95, 3) if p95 is not None else None
+        }
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """Monotonic deadline `seconds` from now, None for no deadline"""
+    return time.monotonic() + seconds if seconds else None
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.monotonic()
+
+async def with_deadline(awaitable: Awaitable[T], deadline: Optional[float], name: str) -> T:
+    """Await within the time left before `deadline`, raising DeadlineExceededError when it runs out"""
+    left = remaining(deadline)
+    if left is not None and left <= 0:
+        raise DeadlineExceededError(f"{name} deadline exceeded")
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError(f"{name} deadline exceeded")
+
+async def with_timeout(awaitable: Awaitable[T], timeout: Optional[float], name: str) -> T:
+    """Await a single upstream request, a timeout is a retryable UpstreamUnavailableError"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout or None)
+    except asyncio.TimeoutError:
+        raise UpstreamUnavailableError(f"{name} timed out after {timeout}s")
+
+async def call_with_retry(
+    name: str,
+    call: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    breaker: CircuitBreaker,
+    attempts: Optional[AttemptLog] = None,
+    deadline: Optional[float] = None
+) -> T:
+    """Await `call()` until it succeeds, backing off between retryable failures.
+
+    Raises the typed error of the last attempt, or CircuitOpenError without calling
+    when the breaker is open. No retry is started that could not begin before `deadline`.
+    """
+    for attempt in range(policy.max_attempts):
+        breaker.before_call()
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            error = classify(e)
+            if error is None:
+                # Says nothing about the upstream's health
+                breaker.release()
+                raise
+            latency = time.perf_counter() - started
+            outcome = type(error).__name__
+            if attempts is not None:
+                attempts.record(outcome, latency)
+            # Requests the upstream rejected are not a sign it is down
+            if type(error) is UpstreamError:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            delay = policy.delay(attempt, error.retry_after)
+            left = remaining(deadline)
+            if not is_retryable(error) or attempt == policy.max_attempts - 1 or (left is not None and delay >= left):
+                logger.error(f"{name} attempt {attempt + 1}/{policy.max_attempts} failed after {latency:.2f}s, giving up: {error}")
+                raise error from e
+            logger.warning(f"{name} attempt {attempt + 1}/{policy.max_attempts} failed after {latency:.2f}s ({outcome}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            latency = time.perf_counter() - started
+            if attempts is not None:
+                attempts.record("success", latency)
+            breaker.record_success()
+            logger.debug(f"{name} attempt {attempt + 1} succeeded in {latency:.2f}s")
+            return result
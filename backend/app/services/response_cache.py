@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set
+from app.core.settings import settings
+import numpy as np
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+DocumentSet = frozenset
+
+class CachedResponse:
+    def __init__(
+        self,
+        document_ids: DocumentSet,
+        embedding: np.ndarray,
+        content: str,
+        used_chunks: List[Dict[str, Any]],
+        retrieval: Hashable = None
+    ):
+        self.id = uuid.uuid4()
+        self.document_ids = document_ids
+        self.retrieval = retrieval
+        self.embedding = embedding
+        self.content = content
+        self.used_chunks = used_chunks
+        self.created_at = time.monotonic()
+
+class ResponseCache:
+    """Semantic answer cache: a question whose embedding is within `radius` cosine
+    distance of a cached question over the same set of documents, retrieved with
+    the same `retrieval` parameters (weights, top k), gets the cached answer and
+    sources.
+
+    Entries expire after `ttl` seconds, the least recently used are evicted past
+    `max_entries`, and entries over a document are dropped when it changes. The
+    cache is in-process, each worker keeps its own.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = settings.RESPONSE_CACHE_TTL,
+        radius: float = settings.RESPONSE_CACHE_RADIUS
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.radius = radius
+        self._entries: "OrderedDict[uuid.UUID, CachedResponse]" = OrderedDict()
+        self._by_documents: Dict[DocumentSet, Set[uuid.UUID]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def document_set(document_ids: Iterable[Any]) -> DocumentSet:
+        return frozenset(str(document_id) for document_id in document_ids)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, entry_id: uuid.UUID) -> None:
+        entry = self._entries.pop(entry_id)
+        scope = self._by_documents[entry.document_ids]
+        scope.discard(entry_id)
+        if not scope:
+            del self._by_documents[entry.document_ids]
+
+    def _expire(self) -> None:
+        # Entries are in LRU order, not creation order, so check them all
+        deadline = time.monotonic() - self.ttl
+        for entry_id in [entry.id for entry in self._entries.values() if entry.created_at < deadline]:
+            self._remove(entry_id)
+            self.expirations += 1
+
+    def lookup(self, document_ids: Iterable[Any], embedding: List[float], retrieval: Hashable = None) -> Optional[CachedResponse]:
+        """Closest cached answer over the same documents and retrieval parameters within the radius, if any"""
+        self._expire()
+        scope = self.document_set(document_ids)
+        candidates = [
+            entry for entry in (self._entries[entry_id] for entry_id in self._by_documents.get(scope, ()))
+            if entry.retrieval == retrieval
+        ]
+        if candidates:
+            distances = 1 - np.stack([entry.embedding for entry in candidates]) @ self._normalize(embedding)
+            best = int(np.argmin(distances))
+            if distances[best] <= self.radius:
+                entry = candidates[best]
+                self._entries.move_to_end(entry.id)
+                self.hits += 1
+                logger.debug(f"Response cache hit at distance {distances[best]:.4f}")
+                return entry
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        document_ids: Iterable[Any],
+        embedding: List[float],
+        content: str,
+        used_chunks: List[Dict[str, Any]],
+        retrieval: Hashable = None
+    ) -> CachedResponse:
+        entry = CachedResponse(self.document_set(document_ids), self._normalize(embedding), content, used_chunks, retrieval)
+        self._entries[entry.id] = entry
+        self._by_documents.setdefault(entry.document_ids, set()).add(entry.id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return entry
+
+    def invalidate_documents(self, document_ids: Iterable[Any]) -> int:
+        """Drop every entry answered over any of `document_ids`"""
+        changed = self.document_set(document_ids)
+        stale = [
+            entry_id
+            for scope, entry_ids in self._by_documents.items() if scope & changed
+            for entry_id in entry_ids
+        ]
+        for entry_id in stale:
+            self._remove(entry_id)
+        self.invalidations += len(stale)
+        if stale:
+            logger.debug(f"Response cache: invalidated {len(stale)} entries")
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_documents.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": settings.RESPONSE_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+# Process-wide cache shared by every ChatService instance
+response_cache = ResponseCache()
@@ -0,0 +1,87 @@
+"""Chat history reads on long sessions: keyset pages vs OFFSET pages.
+
+Each run inserts a session with N messages inside a transaction that is rolled
+back, then times the latest page, a page halfway back through the history with
+a keyset cursor and the same page with OFFSET, and the MAX_HISTORY query used
+for prompts. Keyset reads stay flat as N grows, OFFSET reads grow with depth.
+
+Usage (from backend/, against a database with the schema created):
+    python -m benchmarks.bench_chat_history --sizes 1000 10000 50000
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app.db.database import Base
+from app.db.models import ChatMessage, ChatSession
+from app.services.chat_service import ChatService
+from app.services.pagination import encode_cursor
+from app.core.settings import settings
+import argparse
+import asyncio
+import time
+import uuid
+
+async def timed(coro, repeat: int = 20) -> float:
+    """Median milliseconds of `repeat` runs of the coroutine function"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro()
+        times.append((time.perf_counter() - started) * 1000)
+    return sorted(times)[len(times) // 2]
+
+async def run(SessionLocal, size: int, page_size: int) -> None:
+    async with SessionLocal() as db:
+        session = ChatSession(user_id="bench", title="bench")
+        db.add(session)
+        await db.flush()
+        start = datetime(2024, 1, 1)
+        for offset in range(0, size, 5000):
+            await db.execute(insert(ChatMessage), [
+                {"id": uuid.uuid4(), "session_id": session.id, "role": "user", "content": f"Message {i}",
+                 "created_at": start + timedelta(seconds=i)}
+                for i in range(offset, min(offset + 5000, size))
+            ])
+        await db.execute(select(ChatMessage.id).limit(1))
+        service = ChatService(db)
+        session_id = str(session.id)
+
+        # Cursor halfway back through the history
+        depth = size // 2
+        middle = (await db.execute(
+            select(ChatMessage).where(ChatMessage.session_id == session.id)
+            .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).offset(depth - 1).limit(1)
+        )).scalars().one()
+        cursor = encode_cursor(middle.created_at, middle.id)
+
+        async def offset_page():
+            await db.execute(
+                select(ChatMessage).where(ChatMessage.session_id == session.id)
+                .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).offset(depth).limit(page_size)
+            )
+
+        results = {
+            "latest page": await timed(lambda: service.list_messages(session_id, page_size)),
+            "keyset mid": await timed(lambda: service.list_messages(session_id, page_size, cursor)),
+            "offset mid": await timed(offset_page),
+            "prompt history": await timed(lambda: service.get_chat_history(session_id, settings.MAX_HISTORY)),
+        }
+        print(f"{size:>7} messages " + " ".join(f"{name}={ms:.2f}ms" for name, ms in results.items()))
+        await db.rollback()
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--page-size", type=int, default=settings.PAGE_SIZE)
+    args = parser.parse_args()
+
+    engine = create_async_engine(settings.async_database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+    for size in args.sizes:
+        await run(SessionLocal, size, args.page_size)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Chunk write throughput: ORM add_all vs executemany INSERT vs binary COPY.
+
+Each run inserts N chunks with random 768-d embeddings for a scratch document,
+inside a transaction that is rolled back, so the database is left unchanged.
+By default the ANN index is dropped inside that transaction (and restored by
+the rollback) to measure the write path itself; pass --keep-index to include
+index maintenance. Dropping the index locks document_chunks for the duration,
+so run this against a development database.
+
+Usage (from backend/, against a database with the schema created):
+    python -m benchmarks.bench_chunk_insert --sizes 1000 10000 100000
+"""
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.db.bulk import copy_chunks
+from app.db.database import Base
+from app.db.models import ChatSession, Document, DocumentChunk
+from app.db.vector_index import INDEX_NAME
+from app.core.settings import settings
+import numpy as np
+import argparse
+import asyncio
+import time
+import uuid
+
+async def write_orm(db: AsyncSession, document_id: uuid.UUID, contents, embeddings) -> None:
+    db.add_all([
+        DocumentChunk(document_id=document_id, chunk_index=i, content=content, embedding=embedding)
+        for i, (content, embedding) in enumerate(zip(contents, embeddings))
+    ])
+    await db.flush()
+
+async def write_executemany(db: AsyncSession, document_id: uuid.UUID, contents, embeddings) -> None:
+    await db.execute(insert(DocumentChunk), [
+        {"id": uuid.uuid4(), "document_id": document_id, "chunk_index": i, "content": content, "embedding": embedding}
+        for i, (content, embedding) in enumerate(zip(contents, embeddings))
+    ])
+
+async def write_copy(db: AsyncSession, document_id: uuid.UUID, contents, embeddings) -> None:
+    await copy_chunks(db, [
+        (document_id, i, content, embedding, None, None)
+        for i, (content, embedding) in enumerate(zip(contents, embeddings))
+    ])
+
+METHODS = {"orm": write_orm, "executemany": write_executemany, "copy": write_copy}
+
+async def run(SessionLocal, method: str, size: int, keep_index: bool) -> float:
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((size, settings.EMBEDDING_DIMENSIONS), dtype=np.float32)
+    contents = [f"Benchmark chunk {i} " + "lorem ipsum dolor sit amet " * 18 for i in range(size)]
+
+    async with SessionLocal() as db:
+        if not keep_index:
+            await db.execute(text(f"DROP INDEX IF EXISTS {INDEX_NAME}"))
+        session = ChatSession(title="bench")
+        db.add(session)
+        await db.flush()
+        document = Document(session_id=session.id, filename="bench.txt", file_type="txt", meta_info={})
+        db.add(document)
+        await db.flush()
+
+        started = time.perf_counter()
+        await METHODS[method](db, document.id, contents, embeddings)
+        elapsed = time.perf_counter() - started
+        await db.rollback()
+    return elapsed
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--methods", nargs="+", choices=list(METHODS), default=list(METHODS))
+    parser.add_argument("--keep-index", action="store_true", help="Include ANN index maintenance")
+    args = parser.parse_args()
+
+    engine = create_async_engine(settings.async_database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+    print(f"index {'kept' if args.keep_index else 'dropped'} during writes")
+    for size in args.sizes:
+        for method in args.methods:
+            elapsed = await run(SessionLocal, method, size, args.keep_index)
+            print(f"{size:>7} rows {method:<12} {elapsed:8.2f}s {size / elapsed:10.0f} rows/s")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Concurrent request throughput: sync Session vs AsyncSession inside async handlers.
+
+Simulates N concurrent requests, each running one query that spends `--query-ms`
+in the database (pg_sleep stands in for a vector search). With the sync engine
+every query blocks the event loop, so requests are served one at a time; with
+the async engine they overlap up to the pool size.
+
+Usage (from backend/, against the configured database):
+    python -m benchmarks.bench_db_concurrency --requests 200 --concurrency 20
+"""
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app.core.settings import settings
+import argparse
+import asyncio
+import time
+
+QUERY = text("SELECT pg_sleep(:seconds)")
+
+async def run_sync(requests: int, concurrency: int, seconds: float) -> float:
+    engine = create_engine(
+        settings.sync_database_url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW
+    )
+    SessionLocal = sessionmaker(bind=engine)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            with SessionLocal() as db:
+                db.execute(QUERY, {"seconds": seconds})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return elapsed
+
+async def run_async(requests: int, concurrency: int, seconds: float) -> float:
+    engine = create_async_engine(
+        settings.async_database_url,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW
+    )
+    SessionLocal = async_sessionmaker(engine)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            async with SessionLocal() as db:
+                await db.execute(QUERY, {"seconds": seconds})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(handler() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--query-ms", type=float, default=20)
+    args = parser.parse_args()
+    seconds = args.query_ms / 1000
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.query_ms:.0f} ms per query, "
+          f"pool_size={settings.DB_POOL_SIZE} max_overflow={settings.DB_MAX_OVERFLOW}")
+    for name, runner in (("sync Session", run_sync), ("AsyncSession", run_async)):
+        elapsed = await runner(args.requests, args.concurrency, seconds)
+        print(f"{name:<14} {elapsed:7.2f}s  {args.requests / elapsed:8.1f} req/s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
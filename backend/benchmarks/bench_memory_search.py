@@ -0,0 +1,85 @@
+"""Retrieval latency of small sessions: pgvector vs the in-process NumPy search.
+
+Each run inserts a session with N chunks inside a transaction that is rolled
+back, then times search_similar_chunks through pgvector and through a warm
+InMemoryVectorSearch, vector-only and hybrid, and the cold load of the session
+into memory. The query embedding is passed in, no embedding API is called.
+
+Usage (from backend/, against a database with the schema created):
+    python -m benchmarks.bench_memory_search --sizes 200 1000 2000
+"""
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from unittest.mock import Mock
+from app.db.bulk import copy_chunks
+from app.db.database import Base
+from app.db.models import ChatSession, Document
+from app.services.document_service import DocumentService
+from app.services.memory_search import InMemoryVectorSearch
+from app.core.settings import settings
+import numpy as np
+import argparse
+import asyncio
+import time
+
+async def timed(coro, repeat: int = 50) -> float:
+    """Median milliseconds of `repeat` runs of the coroutine function"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro()
+        times.append((time.perf_counter() - started) * 1000)
+    return sorted(times)[len(times) // 2]
+
+async def run(SessionLocal, size: int) -> None:
+    rng = np.random.default_rng(0)
+    async with SessionLocal() as db:
+        session = ChatSession(user_id="bench", title="bench")
+        db.add(session)
+        await db.flush()
+        document = Document(session_id=session.id, filename="bench.txt", file_type="txt", meta_info={})
+        db.add(document)
+        await db.flush()
+        embeddings = rng.random((size, settings.EMBEDDING_DIMENSIONS), dtype=np.float32)
+        await copy_chunks(db, [
+            (document.id, i, f"Benchmark chunk {i} invoice {i % 97} " + "lorem ipsum dolor sit amet " * 18, embedding, None, None)
+            for i, embedding in enumerate(embeddings)
+        ])
+        session_id = str(session.id)
+        query = rng.random(settings.EMBEDDING_DIMENSIONS, dtype=np.float32).tolist()
+
+        pgvector = DocumentService(db, embeddings=Mock(), text_splitter=Mock())
+        search = InMemoryVectorSearch()
+        memory = DocumentService(db, embeddings=Mock(), text_splitter=Mock(), in_memory_search=search)
+
+        async def cold_load():
+            search.invalidate_session(session_id)
+            await search.get(db, session_id)
+
+        def searching(service, **weights):
+            return lambda: service.search_similar_chunks("invoice 42", session_id, query_embedding=query, **weights)
+
+        results = {
+            "pgvector vector": await timed(searching(pgvector, lexical_weight=0)),
+            "memory vector": await timed(searching(memory, lexical_weight=0)),
+            "pgvector hybrid": await timed(searching(pgvector)),
+            "memory hybrid": await timed(searching(memory)),
+            "memory load": await timed(cold_load, repeat=5),
+        }
+        print(f"{size:>6} chunks " + " ".join(f"{name}={ms:.2f}ms" for name, ms in results.items()))
+        await db.rollback()
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 1000, 2000])
+    args = parser.parse_args()
+
+    engine = create_async_engine(settings.async_database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+    for size in args.sizes:
+        await run(SessionLocal, size)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
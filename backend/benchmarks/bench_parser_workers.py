@@ -0,0 +1,71 @@
+"""PDF extraction throughput of the parser process pool at different worker counts.
+
+Each PDF in docs/sample_files is repeated `--repeat` times into one larger PDF so
+there are enough pages to shard, then extracted through parsers.iter_pages with a
+pool of 1, 2 and 4 processes. CSV files are parsed once per pool for comparison.
+Scaling is bounded by the cores available (reported below).
+
+Usage (from backend/):
+    python -m benchmarks.bench_parser_workers --repeat 50 --workers 1 2 4
+"""
+from concurrent.futures import ProcessPoolExecutor
+from app.services.parsers import iter_pages
+from app.core.settings import settings
+import PyPDF2
+import argparse
+import asyncio
+import glob
+import multiprocessing
+import os
+import tempfile
+import time
+
+SAMPLE_FILES = os.path.join(os.path.dirname(__file__), "..", "..", "docs", "sample_files")
+
+def repeat_pdf(path: str, repeat: int, target: str) -> int:
+    reader = PyPDF2.PdfReader(path)
+    writer = PyPDF2.PdfWriter()
+    for _ in range(repeat):
+        for page in reader.pages:
+            writer.add_page(page)
+    with open(target, "wb") as file:
+        writer.write(file)
+    return len(reader.pages) * repeat
+
+async def extract(path: str, content_type: str, pool: ProcessPoolExecutor) -> int:
+    return len([page async for page in iter_pages(path, content_type, pool)])
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=50, help="Copies of each sample PDF's pages")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    pdfs = sorted(glob.glob(os.path.join(SAMPLE_FILES, "*.pdf")))
+    csvs = sorted(glob.glob(os.path.join(SAMPLE_FILES, "*.csv")))
+    print(f"cpus={os.cpu_count()} pages_per_shard={settings.PDF_PAGES_PER_SHARD}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = []
+        for pdf in pdfs:
+            target = os.path.join(tmp, os.path.basename(pdf))
+            inputs.append((target, repeat_pdf(pdf, args.repeat, target)))
+
+        for workers in args.workers:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                # Start the workers before timing, the pool lives for the whole process in the app
+                await asyncio.gather(*(
+                    asyncio.get_running_loop().run_in_executor(pool, os.getpid) for _ in range(workers)
+                ))
+                for path, pages in inputs:
+                    started = time.perf_counter()
+                    assert await extract(path, "application/pdf", pool) == pages
+                    elapsed = time.perf_counter() - started
+                    print(f"workers={workers} {os.path.basename(path)}: {pages} pages in {elapsed:.2f}s, {pages / elapsed:.1f} pages/s")
+                for path in csvs:
+                    started = time.perf_counter()
+                    await extract(path, "text/csv", pool)
+                    print(f"workers={workers} {os.path.basename(path)}: parsed in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+"""Per-request service construction: building every client vs the shared ServiceClients.
+
+Before, each chat request built a ChatService with its own LLMService (genai.configure
+and GenerativeModel), DocumentService, GeminiEmbeddings and text splitter, and each
+upload built IngestService, DocumentService and a libmagic handle. Now the clients are
+created once in the lifespan and only the session-bound services are built per request.
+No database or network access is needed, services are built around a placeholder session.
+
+Usage (from backend/):
+    python -m benchmarks.bench_service_construction --requests 2000
+"""
+from app.services.chat_service import ChatService
+from app.services.clients import ServiceClients
+from app.services.ingest_service import IngestService
+import argparse
+import time
+
+def per_request(requests: int, build) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        build()
+    return (time.perf_counter() - started) / requests * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    clients = ServiceClients()
+    cases = {
+        "chat, own clients": lambda: ChatService(None),
+        "chat, shared clients": lambda: clients.chat_service(None),
+        "ingest, own clients": lambda: IngestService(None),
+        "ingest, shared clients": lambda: clients.ingest_service(None),
+    }
+    for name, build in cases.items():
+        build()  # warm imports and caches
+        print(f"{name:<24} {per_request(args.requests, build):10.1f}us per request")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Chunk counts and parse time of tabular uploads: DataFrame.to_string vs row groups.
+
+Generates a CSV and a three-sheet workbook with columns of uneven width, then
+chunks each with the previous path (pandas to_string, split by the text
+splitter; read_excel only read the first sheet) and with parsers.parse_table.
+Embedding calls and their cost scale with the chunk count and the characters
+embedded, both reported.
+
+Usage (from backend/):
+    python -m benchmarks.bench_table_ingest --rows 5000 --columns 20
+"""
+from app.services.parsers import parse_table
+from app.services.document_service import create_text_splitter
+import pandas as pd
+import numpy as np
+import argparse
+import io
+import time
+
+EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def make_frame(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {}
+    for c in range(columns):
+        if c % 3 == 0:
+            # A few long values make to_string pad the whole column to their width
+            values = [f"item-{i}" + ("-detail" * 8 if i % 97 == 0 else "") for i in range(rows)]
+        elif c % 3 == 1:
+            values = rng.integers(0, 10_000, rows)
+        else:
+            values = np.round(rng.random(rows) * 1000, 2)
+        data[f"column_{c}"] = values
+    return pd.DataFrame(data)
+
+def to_string_chunks(file: io.BytesIO, content_type: str) -> list:
+    frame = pd.read_csv(file) if content_type == "text/csv" else pd.read_excel(file)
+    return create_text_splitter().split_text(frame.to_string())
+
+def measure(name: str, chunker, data: bytes, content_type: str) -> None:
+    started = time.perf_counter()
+    chunks = chunker(io.BytesIO(data), content_type)
+    elapsed = time.perf_counter() - started
+    print(f"  {name:<12} chunks={len(chunks):>6} chars={sum(len(chunk) for chunk in chunks):>10} time={elapsed:.2f}s")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--columns", type=int, default=20)
+    args = parser.parse_args()
+
+    frame = make_frame(args.rows, args.columns)
+    csv = frame.to_csv(index=False).encode()
+    workbook = io.BytesIO()
+    with pd.ExcelWriter(workbook, engine="openpyxl") as writer:
+        for sheet in range(3):
+            make_frame(args.rows // 3, args.columns, seed=sheet).to_excel(writer, sheet_name=f"Sheet{sheet + 1}", index=False)
+
+    print(f"CSV, {args.rows} rows x {args.columns} columns, {len(csv)} bytes")
+    measure("to_string", to_string_chunks, csv, "text/csv")
+    measure("row groups", parse_table, csv, "text/csv")
+    print(f"XLSX, 3 sheets of {args.rows // 3} rows, {len(workbook.getvalue())} bytes (to_string reads the first sheet only)")
+    measure("to_string", to_string_chunks, workbook.getvalue(), EXCEL)
+    measure("row groups", parse_table, workbook.getvalue(), EXCEL)
+
+if __name__ == "__main__":
+    main()
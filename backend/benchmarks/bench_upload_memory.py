@@ -0,0 +1,59 @@
+"""Peak Python heap per upload: buffered reads vs the spooled upload path.
+
+The buffered path reproduces the previous handling (read everything for the size
+check, read the first byte, read everything again, wrap the bytes in BytesIO for
+the parser). The spooled path is IngestService.validate_file, which copies the
+upload block by block into a SpooledTemporaryFile. Uploads are served from a file
+on disk, as Starlette does for multipart bodies, so only the handling is measured.
+
+Usage (from backend/):
+    python -m benchmarks.bench_upload_memory --sizes 1 5 10
+"""
+from fastapi import UploadFile
+from app.services.ingest_service import IngestService
+from app.core.settings import settings
+import argparse
+import asyncio
+import io
+import tempfile
+import tracemalloc
+
+async def buffered(upload: UploadFile) -> None:
+    contents = await upload.read()
+    assert len(contents) <= settings.MAX_FILE_SIZE
+    await upload.seek(0)
+    await upload.read(1)
+    await upload.seek(0)
+    content = await upload.read()
+    io.BytesIO(content).read()
+
+async def spooled(upload: UploadFile) -> None:
+    file, _ = await IngestService(None).validate_file(upload)
+    file.close()
+
+async def peak_mb(handler, size: int) -> float:
+    with tempfile.TemporaryFile() as source:
+        line = b"2024-01-01,some text value,42\n"
+        source.write(line * (size // len(line)))
+        source.seek(0)
+        upload = UploadFile(filename="bench.txt", file=source)
+
+        tracemalloc.start()
+        await handler(upload)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak / 1024 / 1024
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 5, 10], help="Upload sizes in MB")
+    args = parser.parse_args()
+
+    print(f"chunk={settings.UPLOAD_CHUNK_SIZE // 1024}KB spool={settings.UPLOAD_SPOOL_SIZE // 1024}KB")
+    print(f"{'upload':>8} {'buffered peak':>14} {'spooled peak':>13}")
+    for size_mb in args.sizes:
+        size = int(size_mb * 1024 * 1024) - 1024
+        print(f"{size_mb:6.1f}MB {await peak_mb(buffered, size):12.2f}MB {await peak_mb(spooled, size):11.2f}MB")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""Embedding index size, latency and recall: full precision vs quantised.
+
+Loads N clustered, unit-length vectors into a scratch table, then for each
+VECTOR_QUANTIZATION mode builds the HNSW index retrieval would use and times
+Q held-out queries through it (quantised modes re-rank VECTOR_RERANK_CANDIDATES
+by exact distance, as retrieval does). Reports index size, build time, p50/p99
+latency and recall@k against exact top-k computed with numpy. Vectors are
+normalised, so the exact ranking is the same for every distance metric.
+--dimensions runs at another size than EMBEDDING_DIMENSIONS, e.g. 256 to see
+what a reduced (Matryoshka) embedding size saves.
+
+Quantised modes need pgvector 0.7.0 or later and are reported as skipped
+on older servers.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_quantization --rows 20000 --queries 200 --k 10
+"""
+from sqlalchemy import create_engine, text
+from app.db.vector_index import (
+    QUANTIZATIONS,
+    QUANTIZATION_MIN_VERSION,
+    distance_operator,
+    index_expression,
+    index_params,
+    pgvector_version,
+    quantized_order,
+    rerank_candidates
+)
+from app.core.settings import settings
+import argparse
+import time
+import numpy as np
+
+TABLE = "bench_vector_quantization"
+
+def clustered_vectors(count: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dimensions))
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimensions))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def literal(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{value:.6f}" for value in vector) + "]"
+
+def load(conn, vectors: np.ndarray) -> None:
+    conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    conn.execute(text(f"CREATE TABLE {TABLE} (id integer PRIMARY KEY, embedding vector({vectors.shape[1]}))"))
+    for offset in range(0, len(vectors), 1000):
+        conn.execute(
+            text(f"INSERT INTO {TABLE} (id, embedding) VALUES (:id, CAST(:embedding AS vector))"),
+            [{"id": offset + i, "embedding": literal(vector)} for i, vector in enumerate(vectors[offset:offset + 1000])]
+        )
+
+def run(conn, quantization: str, queries: np.ndarray, exact: np.ndarray, k: int) -> str:
+    params = ", ".join(f"{key} = {value}" for key, value in index_params("hnsw").items())
+    conn.execute(text(f"DROP INDEX IF EXISTS {TABLE}_embedding"))
+    started = time.perf_counter()
+    conn.execute(text(f"CREATE INDEX {TABLE}_embedding ON {TABLE} USING hnsw ({index_expression(quantization)}) WITH ({params})"))
+    build_seconds = time.perf_counter() - started
+    size = conn.execute(text(f"SELECT pg_relation_size('{TABLE}_embedding')")).scalar()
+
+    operator = distance_operator()
+    quantized = quantized_order(":query", column="embedding", quantization=quantization)
+    limit = k if quantized is None else rerank_candidates(k)
+    if quantized is None:
+        search = text(f"SELECT id FROM {TABLE} ORDER BY embedding {operator} CAST(:query AS vector) LIMIT :k")
+    else:
+        search = text(f"""
+            SELECT id FROM (
+                SELECT id, embedding {operator} CAST(:query AS vector) AS distance
+                FROM {TABLE}
+                ORDER BY {quantized}
+                LIMIT :candidates
+            ) candidates
+            ORDER BY distance
+            LIMIT :k
+        """)
+    conn.execute(text("SELECT set_config('hnsw.ef_search', :ef_search, false)"),
+                 {"ef_search": str(max(settings.HNSW_EF_SEARCH, limit))})
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, exact):
+        started = time.perf_counter()
+        ids = conn.execute(search, {"query": literal(query), "k": k, "candidates": limit}).scalars().all()
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(set(ids) & set(expected.tolist()))
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    return (
+        f"{quantization:>8} index={size / 2**20:7.2f}MB build={build_seconds:6.2f}s "
+        f"p50={p50:6.2f}ms p99={p99:6.2f}ms recall@{k}={hits / (len(queries) * k):.3f}"
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument("--dimensions", type=int, default=settings.EMBEDDING_DIMENSIONS)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Index and query expressions are sized from the setting
+    dimensions = settings.EMBEDDING_DIMENSIONS = args.dimensions
+    vectors = clustered_vectors(args.rows + args.queries, dimensions, args.clusters, rng)
+    data, queries = vectors[:args.rows], vectors[args.rows:]
+    exact = np.argsort(-(queries @ data.T), axis=1)[:, :args.k]
+
+    engine = create_engine(settings.sync_database_url)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        version = pgvector_version(conn)
+        print(f"pgvector {'.'.join(map(str, version))}, {args.rows} rows x {dimensions} dims, {args.queries} queries")
+        load(conn, data)
+        try:
+            for quantization in args.modes:
+                if quantization != "none" and version < QUANTIZATION_MIN_VERSION:
+                    print(f"{quantization:>8} skipped, needs pgvector {'.'.join(map(str, QUANTIZATION_MIN_VERSION))}")
+                    continue
+                print(run(conn, quantization, queries, exact, args.k))
+        finally:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,42 @@
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from fastapi.testclient import TestClient
 from app.db.database import Base, get_db
+from app.db.models import ChatSession, Document, DocumentChunk
+from app.services.embeddings_service import GeminiEmbeddings
+from app.services.embedding_cache import embedding_cache
 from app.main import app
+from app.core.config import to_async_database_url
 from app.core.settings import settings
+from unittest.mock import AsyncMock, patch
+import numpy as np
 import os
 
 # Test database URL
 SQLALCHEMY_TEST_DATABASE_URL = settings.sync_database_url.replace(
-    settings.POSTGRES_DB, 
+    settings.POSTGRES_DB,
     f"test_{settings.POSTGRES_DB}"
 )
 
 # Create test engine
 engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL)
 
+# Async test engine, NullPool since each test runs on its own event loop
+async_engine = create_async_engine(to_async_database_url(SQLALCHEMY_TEST_DATABASE_URL), poolclass=NullPool)
+
 # Create test session
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+@pytest.fixture(autouse=True)
+def test_embedding_cache():
+    """The shared embedding cache, used by services built without one, reads and writes the test database"""
+    with patch.object(embedding_cache, "session_factory", AsyncTestingSessionLocal):
+        yield embedding_cache
+    embedding_cache.clear_memory()
 
 @pytest.fixture(scope="function")
 def db_session():
@@ -29,14 +48,66 @@ def db_session():
         session.close()
         Base.metadata.drop_all(bind=engine)
 
+@pytest.fixture(scope="function")
+async def async_db_session():
+    """AsyncSession as used by the services and API"""
+    Base.metadata.create_all(bind=engine)
+    session = AsyncTestingSessionLocal()
+    try:
+        yield session
+    finally:
+        await session.close()
+        Base.metadata.drop_all(bind=engine)
+
 @pytest.fixture(scope="function")
 def client(db_session):
-    def override_get_db():
-        try:
-            yield db_session
-        finally:
-            pass
-    
+    # Fresh session per request, TestClient runs the app on its own event loop
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as test_client:
-        yield test_client 
\ No newline at end of file
+        yield test_client
+    app.dependency_overrides.clear()
+
+def session_with_chunks(embeddings, content=lambda i: f"Chunk {i}"):
+    """Unsaved chat session with one document holding a chunk per embedding, returns (session, document)"""
+    session = ChatSession(user_id="test-user", title="Test")
+    document = Document(session=session, filename="test.txt", file_type="txt", meta_info={})
+    document.chunks = [
+        DocumentChunk(content=content(i), chunk_index=i, embedding=embedding.tolist())
+        for i, embedding in enumerate(embeddings)
+    ]
+    return session, document
+
+async def add_session_with_chunks(db, count: int = 20, content=lambda i: f"Chunk {i}"):
+    """Saved session_with_chunks with `count` random embeddings, returns (session, document)"""
+    session, document = session_with_chunks(np.random.rand(count, settings.EMBEDDING_DIMENSIONS), content)
+    db.add(session)
+    await db.commit()
+    return session, document
+
+@pytest.fixture
+def chunks(request, db_session):
+    """Chunks with random embeddings in one document, 200 unless parametrised
+    indirectly with another count. Returns the embeddings in chunk_index order."""
+    embeddings = np.random.rand(getattr(request, "param", 200), settings.EMBEDDING_DIMENSIONS)
+    db_session.add(session_with_chunks(embeddings)[0])
+    db_session.commit()
+    return embeddings
+
+@pytest.fixture
+def mock_embeddings():
+    """Constant embeddings instead of Gemini calls, yields the aembed_documents mock"""
+    embed = AsyncMock(side_effect=lambda texts: [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts])
+    with patch.object(GeminiEmbeddings, "aembed_documents", embed), \
+            patch.object(GeminiEmbeddings, "aembed_query", AsyncMock(return_value=[0.1] * settings.EMBEDDING_DIMENSIONS)):
+        yield embed
+
+async def create_session(db, title: str = "Test") -> str:
+    """Id of a new chat session"""
+    session = ChatSession(title=title)
+    db.add(session)
+    await db.commit()
+    return str(session.id)
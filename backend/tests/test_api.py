@@ -2,7 +2,10 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.core.settings import settings
+from unittest.mock import AsyncMock, patch
+import json
 import io
+import uuid
 
 @pytest.fixture
 def client():
@@ -57,8 +60,11 @@ def test_file_upload_endpoints(client):
         files=files,
         data=data
     )
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    response = client.get(f"{settings.API_V1_STR}/ingest/jobs/{job['id']}")
     assert response.status_code == 200
-    assert "document_id" in response.json()
     
     # Test invalid file type
     files = {
@@ -96,4 +102,202 @@ def test_api_error_handling(client):
         f"{settings.API_V1_STR}/chat/message",
         data="invalid-json"
     )
-    assert response.status_code == 422 
\ No newline at end of file
+    assert response.status_code == 422 
+def test_chat_streaming_endpoint(db_session):
+    """Test streamed chat response is delivered as Server-Sent Events"""
+    from app.db.database import get_db
+    from app.db.models import ChatSession
+    from tests.conftest import AsyncTestingSessionLocal
+
+    session = ChatSession(user_id="test-user", title="New Chat")
+    db_session.add(session)
+    db_session.commit()
+
+    async def fake_stream(self, messages, deadline=None):
+        for delta in ["Hello", " world"]:
+            yield delta
+
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with patch("app.services.llm_service.LLMService.stream_response", fake_stream), \
+             patch("app.services.document_service.DocumentService.search_similar_chunks",
+                   AsyncMock(return_value=([], []))):
+            response = TestClient(app).post(
+                f"{settings.API_V1_STR}/chat/sessions/{session.id}/messages/stream",
+                json={"content": "Hello"}
+            )
+            missing = TestClient(app).post(
+                f"{settings.API_V1_STR}/chat/sessions/{uuid.uuid4()}/messages/stream",
+                json={"content": "Hello"}
+            )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [event for event, _ in events] == ["user_message", "delta", "delta", "assistant_message"]
+    assert events[-1][1]["content"] == "Hello world"
+    assert events[-1][1]["role"] == "assistant"
+    assert missing.status_code == 404
+
+def test_ingest_job_endpoints(db_session):
+    """Test uploads are queued and their progress can be polled"""
+    from app.db.models import ChatSession
+    from app.services.ingest_jobs import ingest_job_queue
+    from tests.conftest import AsyncTestingSessionLocal
+    import time
+
+    session = ChatSession(user_id="test-user", title="New Chat")
+    db_session.add(session)
+    db_session.commit()
+
+    embed = AsyncMock(side_effect=lambda texts: [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts])
+    with patch.object(ingest_job_queue, "session_factory", AsyncTestingSessionLocal), \
+         patch("app.services.embeddings_service.GeminiEmbeddings.aembed_documents", embed), \
+         TestClient(app) as client:
+        response = client.post(
+            f"{settings.API_V1_STR}/ingest/upload",
+            params={"session_id": str(session.id)},
+            files={"file": ("notes.txt", io.BytesIO(b"Queued ingestion test content"), "text/plain")}
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert job["status"] == "queued"
+
+        for _ in range(50):
+            job = client.get(f"{settings.API_V1_STR}/ingest/jobs/{job['id']}").json()
+            if job["status"] in ("indexed", "failed"):
+                break
+            time.sleep(0.1)
+        assert job["status"] == "indexed", job["error"]
+        assert job["chunk_count"] == 1
+        assert job["document_id"]
+
+        jobs = client.get(f"{settings.API_V1_STR}/ingest/jobs", params={"session_id": str(session.id)}).json()
+        assert [j["id"] for j in jobs] == [job["id"]]
+        assert client.get(f"{settings.API_V1_STR}/ingest/jobs/{session.id}").status_code == 404
+
+def test_upload_size_limit(client):
+    """Test oversized uploads are rejected from Content-Length before the body is parsed"""
+    response = client.post(
+        f"{settings.API_V1_STR}/ingest/upload",
+        params={"session_id": "test-session"},
+        files={"file": ("large.txt", io.BytesIO(b"x" * (settings.MAX_FILE_SIZE + 128 * 1024)), "text/plain")}
+    )
+    assert response.status_code == 413
+
+def test_service_clients_shared(db_session):
+    """Test service clients are created once by the lifespan and reused by every request"""
+    from app.db.database import get_db
+    from app.services.clients import ServiceClients
+    from tests.conftest import AsyncTestingSessionLocal
+
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        with patch("app.main.ServiceClients", wraps=ServiceClients) as create_clients, \
+             patch("app.services.chat_service.LLMService") as create_llm, \
+             patch("magic.Magic") as create_magic, \
+             TestClient(app) as client:
+            session_id = str(uuid.uuid4())
+            for _ in range(3):
+                response = client.get(f"{settings.API_V1_STR}/chat/sessions/{session_id}/messages")
+                assert response.status_code == 200
+            response = client.post(
+                f"{settings.API_V1_STR}/ingest/upload",
+                params={"session_id": session_id},
+                files={"file": ("empty.txt", io.BytesIO(b""), "text/plain")}
+            )
+            assert response.status_code == 400
+            assert client.app.state.clients is app.state.clients
+        create_clients.assert_called_once()
+        create_llm.assert_not_called()
+        # Only for the shared clients, not per upload
+        create_magic.assert_called_once()
+    finally:
+        app.dependency_overrides.clear()
+
+def test_upstream_errors_mapped(db_session):
+    """Test typed LLM errors reach the client as 429/503 with Retry-After"""
+    from app.db.database import get_db
+    from app.db.models import ChatSession
+    from app.services.resilience import CircuitOpenError, UpstreamRateLimitError
+    from tests.conftest import AsyncTestingSessionLocal
+
+    session = ChatSession(user_id="test-user", title="New Chat")
+    db_session.add(session)
+    db_session.commit()
+
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        for error, status in [
+            (UpstreamRateLimitError("quota", retry_after=4.2), 429),
+            (CircuitOpenError("llm circuit open", retry_after=12), 503)
+        ]:
+            with patch("app.services.llm_service.LLMService.generate_response", AsyncMock(side_effect=error)), \
+                 patch("app.services.document_service.DocumentService.search_similar_chunks",
+                       AsyncMock(return_value=([], []))):
+                response = TestClient(app).post(
+                    f"{settings.API_V1_STR}/chat/sessions/{session.id}/messages",
+                    json={"content": "Hello"}
+                )
+            assert response.status_code == status
+            assert response.headers["retry-after"] == str(int(error.retry_after + 0.99))
+            assert response.json()["detail"] == error.detail
+    finally:
+        app.dependency_overrides.clear()
+
+def test_paginated_history_endpoint(db_session):
+    """Test message history is paged with X-Next-Cursor"""
+    from app.db.database import get_db
+    from app.db.models import ChatMessage, ChatSession
+    from datetime import datetime, timedelta
+    from tests.conftest import AsyncTestingSessionLocal
+
+    session = ChatSession(user_id="test-user", title="New Chat")
+    db_session.add(session)
+    db_session.commit()
+    start = datetime(2024, 1, 1)
+    db_session.add_all([
+        ChatMessage(session_id=session.id, role="user", content=f"Message {i}", created_at=start + timedelta(seconds=i))
+        for i in range(5)
+    ])
+    db_session.commit()
+
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as session:
+            yield session
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        client = TestClient(app)
+        url = f"{settings.API_V1_STR}/chat/sessions/{session.id}/messages"
+        response = client.get(url, params={"limit": 3})
+        assert response.status_code == 200
+        assert [m["content"] for m in response.json()] == ["Message 2", "Message 3", "Message 4"]
+
+        response = client.get(url, params={"limit": 3, "cursor": response.headers["x-next-cursor"]})
+        assert [m["content"] for m in response.json()] == ["Message 0", "Message 1"]
+        assert "x-next-cursor" not in response.headers
+
+        sessions = client.get(f"{settings.API_V1_STR}/chat/sessions/test-user")
+        assert sessions.status_code == 200
+        assert [s["id"] for s in sessions.json()] == [str(session.id)]
+        assert client.get(url, params={"limit": settings.MAX_PAGE_SIZE + 1}).status_code == 422
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,37 @@
+import pytest
+from app.db.bulk import copy_chunks, encode_vector
+from app.db.models import ChatSession, Document, DocumentChunk
+from app.core.settings import settings
+from sqlalchemy import select
+import numpy as np
+import struct
+
+def test_vector_binary_encoding():
+    """Embeddings are packed as int16 dimensions, int16 unused, big-endian float4"""
+    encoded = encode_vector(np.array([1.0, -2.5, 0.125], dtype=np.float32))
+    assert encoded == struct.pack("!hh", 3, 0) + struct.pack("!3f", 1.0, -2.5, 0.125)
+
+@pytest.mark.asyncio
+async def test_copy_chunks(async_db_session):
+    """Binary COPY round-trips content, chunk indexes, float32 embeddings, SimHashes and metadata"""
+    session = ChatSession(title="Bulk")
+    async_db_session.add(session)
+    await async_db_session.commit()
+    document = Document(session_id=session.id, filename="bulk.txt", file_type="txt", meta_info={})
+    async_db_session.add(document)
+    await async_db_session.commit()
+
+    embeddings = np.random.rand(50, settings.EMBEDDING_DIMENSIONS).astype(np.float32)
+    rows = [(document.id, i, f"Chunk {i} – naïve ünïcode", embeddings[i], -i if i % 2 else None, {"sheet": "S", "row_start": i} if i % 3 == 0 else None) for i in range(50)]
+    assert await copy_chunks(async_db_session, rows) == 50
+    await async_db_session.commit()
+
+    stored = (await async_db_session.execute(
+        select(DocumentChunk).where(DocumentChunk.document_id == document.id).order_by(DocumentChunk.chunk_index)
+    )).scalars().all()
+    assert [chunk.chunk_index for chunk in stored] == list(range(50))
+    assert stored[3].content == "Chunk 3 – naïve ünïcode"
+    assert [chunk.simhash for chunk in stored[:4]] == [None, -1, None, -3]
+    assert [chunk.meta_info for chunk in stored[:4]] == [{"sheet": "S", "row_start": 0}, None, None, {"sheet": "S", "row_start": 3}]
+    assert all(chunk.id is not None and chunk.created_at is not None for chunk in stored)
+    np.testing.assert_array_equal(np.array([chunk.embedding for chunk in stored], dtype=np.float32), embeddings)
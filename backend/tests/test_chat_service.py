@@ -1,8 +1,12 @@
 import pytest
 from app.services.chat_service import ChatService
+from app.services.response_cache import ResponseCache
 from app.db.models import ChatSession, ChatMessage
+from app.schemas.models import MessageRole
 from app.core.settings import settings
-from unittest.mock import Mock, patch
+from sqlalchemy import select, func
+from unittest.mock import AsyncMock, Mock, patch
+import uuid
 
 @pytest.fixture
 def mock_llm():
@@ -21,19 +25,19 @@ def mock_document_service():
         yield mock
 
 @pytest.mark.asyncio
-async def test_chat_session_management(db_session):
+async def test_chat_session_management(async_db_session):
     """Test chat session CRUD operations"""
-    service = ChatService(db_session)
+    service = ChatService(async_db_session)
     
     # Create & Read
     session = await service.create_session("test-user")
     assert session.user_id == "test-user"
     
-    retrieved = service.get_session(session.id)
+    retrieved = await service.get_session(session.id)
     assert retrieved.id == session.id
     
     # List sessions
-    sessions = service.get_user_sessions("test-user")
+    sessions = await service.get_user_sessions("test-user")
     assert len(sessions) == 1
     assert sessions[0].id == session.id
     
@@ -43,19 +47,19 @@ async def test_chat_session_management(db_session):
         role="user",
         content="Test message"
     )
-    db_session.add(message)
-    db_session.commit()
+    async_db_session.add(message)
+    await async_db_session.commit()
     await service.update_session_title(session.id)
     assert "Test message" in session.title
     
     # Delete (hide)
     await service.delete_session(session.id)
-    assert service.get_session(session.id).hidden
+    assert (await service.get_session(session.id)).hidden
 
 @pytest.mark.asyncio
-async def test_chat_response_generation(db_session, mock_llm, mock_document_service):
+async def test_chat_response_generation(async_db_session, mock_llm, mock_document_service):
     """Test chat response with context and system prompt"""
-    service = ChatService(db_session)
+    service = ChatService(async_db_session)
     session = await service.create_session("test-user")
     
     messages = await service.generate_response(
@@ -79,9 +83,9 @@ async def test_chat_response_generation(db_session, mock_llm, mock_document_serv
               for msg in llm_call)
 
 @pytest.mark.asyncio
-async def test_chat_history_management(db_session):
+async def test_chat_history_management(async_db_session):
     """Test chat history with limits"""
-    service = ChatService(db_session)
+    service = ChatService(async_db_session)
     session = await service.create_session("test-user")
     
     # Add more messages than MAX_HISTORY
@@ -91,8 +95,223 @@ async def test_chat_history_management(db_session):
             role="user",
             content=f"Message {i}"
         )
-        db_session.add(message)
-    db_session.commit()
+        async_db_session.add(message)
+    await async_db_session.commit()
     
-    history = service.get_chat_history(session.id)
-    assert len(history) <= settings.MAX_HISTORY
\ No newline at end of file
+    history = await service.get_chat_history(session.id)
+    assert len(history) <= settings.MAX_HISTORY
+
+@pytest.mark.asyncio
+async def test_chat_response_streaming(async_db_session):
+    """Test streamed response yields deltas and persists the final message once"""
+    service = ChatService(async_db_session)
+    session = await service.create_session("test-user")
+
+    async def fake_stream(messages, deadline=None):
+        for delta in ["Hello", ", ", "world"]:
+            yield delta
+
+    service.llm.stream_response = fake_stream
+    service.document_service.search_similar_chunks = AsyncMock(return_value=([], []))
+
+    events = [
+        (event, data)
+        async for event, data in service.stream_response(str(session.id), "Test question")
+    ]
+
+    assert [event for event, _ in events] == ["user_message", "delta", "delta", "delta", "assistant_message"]
+    assert events[0][1].content == "Test question"
+    assert "".join(data for event, data in events if event == "delta") == "Hello, world"
+
+    assistant_message = events[-1][1]
+    assert assistant_message.role == MessageRole.ASSISTANT
+    assert assistant_message.content == "Hello, world"
+    assert await async_db_session.scalar(select(func.count()).select_from(ChatMessage).where(
+        ChatMessage.session_id == session.id,
+        ChatMessage.role == MessageRole.ASSISTANT
+    )) == 1
+
+@pytest.mark.asyncio
+async def test_chat_response_streaming_error(async_db_session):
+    """Test a failed stream reports an error and saves no assistant message"""
+    service = ChatService(async_db_session)
+    session = await service.create_session("test-user")
+
+    async def failing_stream(messages, deadline=None):
+        yield "Partial"
+        raise RuntimeError("upstream closed")
+
+    service.llm.stream_response = failing_stream
+    service.document_service.search_similar_chunks = AsyncMock(return_value=([], []))
+
+    events = [event async for event, _ in service.stream_response(str(session.id), "Test question")]
+
+    assert events == ["user_message", "delta", "error"]
+    assert await async_db_session.scalar(select(func.count()).select_from(ChatMessage).where(
+        ChatMessage.session_id == session.id,
+        ChatMessage.role == MessageRole.ASSISTANT
+    )) == 0
+
+@pytest.mark.asyncio
+async def test_chat_response_cache(async_db_session):
+    """Test a repeated question is answered from the response cache without retrieval or the LLM"""
+    service = ChatService(async_db_session, cache=ResponseCache())
+    session = await service.create_session("test-user")
+    service.llm.generate_response = AsyncMock(return_value="Cached answer")
+    service.document_service.embeddings.aembed_query = AsyncMock(return_value=[1.0, 0.0, 0.0])
+    service.document_service.search_similar_chunks = AsyncMock(return_value=([], []))
+    service.document_service.get_session_document_ids = AsyncMock(return_value=[uuid.uuid4()])
+
+    first = await service.generate_response(str(session.id), "What is the refund policy?")
+    second = await service.generate_response(str(session.id), "What's the refund policy?")
+
+    assert second[1].content == first[1].content == "Cached answer"
+    assert second[1].meta_info == {"used_chunks": [], "cached": True}
+    service.llm.generate_response.assert_awaited_once()
+    service.document_service.search_similar_chunks.assert_awaited_once()
+    assert service.document_service.search_similar_chunks.await_args.kwargs["query_embedding"] == [1.0, 0.0, 0.0]
+
+    events = [event async for event, _ in service.stream_response(str(session.id), "Refund policy?")]
+    assert events == ["user_message", "delta", "assistant_message"]
+    assert service.cache.stats()["hits"] == 2
+
+    # Context retrieved with other weights may differ, the configured ones passed explicitly do not
+    await service.generate_response(str(session.id), "What is the refund policy?", lexical_weight=0)
+    assert service.llm.generate_response.await_count == 2
+    await service.generate_response(str(session.id), "What is the refund policy?", vector_weight=settings.HYBRID_VECTOR_WEIGHT)
+    assert service.cache.stats()["hits"] == 3
+
+    # Sessions without documents are neither served from nor added to the cache
+    service.document_service.get_session_document_ids = AsyncMock(return_value=[])
+    other = await service.create_session("other-user")
+    for _ in range(2):
+        await service.generate_response(str(other.id), "What is the refund policy?")
+    assert service.llm.generate_response.await_count == 4
+    assert service.cache.stats()["entries"] == 2
+
+@pytest.mark.asyncio
+async def test_chat_turn_budget(async_db_session):
+    """Test a turn that outlasts CHAT_TURN_BUDGET fails with DeadlineExceededError"""
+    from app.services.resilience import DeadlineExceededError
+    import asyncio
+
+    service = ChatService(async_db_session)
+    session = await service.create_session("test-user")
+    service.document_service.search_similar_chunks = AsyncMock(return_value=([], []))
+
+    async def hang(*args, **kwargs):
+        await asyncio.Event().wait()
+
+    service.llm._generate = hang
+    with patch.object(settings, "CHAT_TURN_BUDGET", 0.1), pytest.raises(DeadlineExceededError):
+        await service.generate_response(str(session.id), "Test question")
+
+    service.document_service.search_similar_chunks = hang
+    with patch.object(settings, "CHAT_TURN_BUDGET", 0.1):
+        events = [(event, data) async for event, data in service.stream_response(str(session.id), "Test question")]
+    assert events == [("error", DeadlineExceededError.detail)]
+
+@pytest.mark.asyncio
+async def test_keyset_pagination(async_db_session):
+    """Test message and session pages walk the whole history in order, including timestamp ties"""
+    from datetime import datetime, timedelta
+    from fastapi import HTTPException
+
+    service = ChatService(async_db_session)
+    session = await service.create_session("test-user")
+    start = datetime(2024, 1, 1)
+    # Pairs of messages share a timestamp, the id breaks the tie
+    async_db_session.add_all([
+        ChatMessage(session_id=session.id, role="user", content=f"Message {i}", created_at=start + timedelta(seconds=i // 2))
+        for i in range(25)
+    ])
+    await async_db_session.commit()
+
+    pages, cursor = [], None
+    while True:
+        messages, cursor = await service.list_messages(str(session.id), limit=10, cursor=cursor)
+        pages.append(messages)
+        if not cursor:
+            break
+    assert [len(p) for p in pages] == [10, 10, 5]
+    # Latest page first, each page oldest first
+    ordered = [m for p in reversed(pages) for m in p]
+    assert len({m.id for m in ordered}) == 25
+    assert [(m.created_at, m.id) for m in ordered] == sorted((m.created_at, m.id) for m in ordered)
+
+    latest = await service.get_chat_history(str(session.id), limit=5)
+    assert [m.id for m in latest] == [m.id for m in ordered[-5:]]
+
+    for i in range(4):
+        await service.create_session("test-user")
+    sessions, cursor = await service.list_sessions("test-user", limit=3)
+    more, last = await service.list_sessions("test-user", limit=3, cursor=cursor)
+    assert len(sessions) == 3 and len(more) == 2 and last is None
+    assert {s.id for s in sessions + more} == {s.id for s in await service.get_user_sessions("test-user")}
+
+    with pytest.raises(HTTPException) as raised:
+        await service.list_messages(str(session.id), cursor="not-a-cursor")
+    assert raised.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_prompt_uses_latest_history(async_db_session):
+    """Test the prompt has the system prompt first, then the latest MAX_HISTORY messages"""
+    from datetime import datetime, timedelta
+
+    service = ChatService(async_db_session)
+    session = await service.create_session("test-user")
+    start = datetime(2024, 1, 1)
+    async_db_session.add(ChatMessage(session_id=session.id, role="system", content=settings.SYSTEM_PROMPT, created_at=start))
+    async_db_session.add_all([
+        ChatMessage(session_id=session.id, role="user", content=f"Message {i}", created_at=start + timedelta(seconds=i + 1))
+        for i in range(settings.MAX_HISTORY + 5)
+    ])
+    await async_db_session.commit()
+    service.document_service.search_similar_chunks = AsyncMock(return_value=([], []))
+
+    turn = await service._prepare_turn(str(session.id), "Newest question")
+    assert turn.messages[0] == {"role": "system", "content": settings.SYSTEM_PROMPT}
+    assert [m["content"] for m in turn.messages[1:]] == [
+        f"Message {i}" for i in range(5, settings.MAX_HISTORY + 5)
+    ] + ["Newest question"]
+
+@pytest.mark.asyncio
+async def test_chat_turn_round_trips(async_db_session):
+    """Test a chat turn takes a fixed number of statements, however many chunks are retrieved"""
+    from sqlalchemy import event
+    from app.db.models import Document, DocumentChunk
+
+    service = ChatService(async_db_session)
+    session = await service.create_session("test-user")
+    document = Document(session_id=session.id, filename="manual.txt", file_type="text/plain")
+    async_db_session.add(document)
+    async_db_session.add_all([
+        DocumentChunk(document=document, chunk_index=i, content=f"Section {i} of the manual",
+                      embedding=[1.0] + [0.0] * (settings.EMBEDDING_DIMENSIONS - 1))
+        for i in range(5)
+    ])
+    await async_db_session.commit()
+    service.document_service.embeddings.aembed_query = AsyncMock(
+        return_value=[1.0] + [0.0] * (settings.EMBEDDING_DIMENSIONS - 1)
+    )
+    service.llm.generate_response = AsyncMock(return_value="An answer from the manual")
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    engine = async_db_session.bind.sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        user_message, assistant_message = await service.generate_response(str(session.id), "What does the manual say?")
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    # Session with history, search tuning (which also counts the session's chunks), retrieval, then in one transaction the title
+    # update and the inserts of the system and user messages and of the assistant message
+    assert len(statements) == 6, statements
+    assert {chunk["filename"] for chunk in assistant_message.meta_info["used_chunks"]} == {"manual.txt"}
+    assert "Section 0 of the manual" in service.llm.generate_response.await_args.args[0][-1]["content"]
+
+    history = await service.get_chat_history(str(session.id))
+    assert [msg.role for msg in history] == [MessageRole.SYSTEM, MessageRole.USER, MessageRole.ASSISTANT]
+    assert (await service.get_session(str(session.id))).title == "An answer from the manual"
@@ -0,0 +1,69 @@
+import pytest
+from app.services.context_builder import ContextBuilder, merge_overlap
+from app.services.rate_limiter import estimate_tokens
+from unittest.mock import MagicMock
+import uuid
+
+def make_chunk(document, index, content):
+    chunk = MagicMock()
+    chunk.id = uuid.uuid4()
+    chunk.document = document
+    chunk.document_id = document.id
+    chunk.chunk_index = index
+    chunk.content = content
+    return chunk
+
+@pytest.fixture
+def documents():
+    docs = []
+    for name in ("a.txt", "b.txt"):
+        doc = MagicMock()
+        doc.id = uuid.uuid4()
+        doc.filename = name
+        docs.append(doc)
+    return docs
+
+def test_merge_overlap():
+    assert merge_overlap("the quick brown fox jumps", "brown fox jumps over the dog", 50) == "the quick brown fox jumps over the dog"
+    # Too short to be the splitter's overlap
+    assert merge_overlap("ends with a", "a new start", 50) == "ends with a\na new start"
+
+def test_adjacent_chunks_merged(documents):
+    doc_a, doc_b = documents
+    chunks = [
+        make_chunk(doc_a, 3, "second part of the text, with shared tail"),
+        make_chunk(doc_b, 0, "unrelated passage"),
+        make_chunk(doc_a, 2, "first part of the text. second part of the text"),
+    ]
+    context = ContextBuilder(token_budget=1000, overlap=20).build(chunks, [0.1, 0.2, 0.3])
+
+    assert len(context.passages) == 2
+    merged = context.passages[0]
+    assert merged.content == "first part of the text. second part of the text, with shared tail"
+    assert [chunk.chunk_index for chunk in merged.chunks] == [2, 3]
+    assert merged.distances == [0.3, 0.1]
+    assert context.passages[1].document is doc_b
+    assert "From document 'a.txt':" in context.format()
+
+def test_duplicates_dropped(documents):
+    doc_a, doc_b = documents
+    chunks = [
+        make_chunk(doc_a, 0, "the same paragraph uploaded twice"),
+        make_chunk(doc_b, 4, "the same paragraph uploaded twice"),
+    ]
+    context = ContextBuilder(token_budget=1000).build(chunks, [0.1, 0.2])
+    assert context.chunks == [chunks[0]]
+    assert context.distances == [0.1]
+
+def test_token_budget(documents):
+    doc_a, doc_b = documents
+    long_chunk = make_chunk(doc_a, 0, "x" * 2000)
+    short_chunk = make_chunk(doc_b, 0, "short answer")
+    budget = 100
+    context = ContextBuilder(token_budget=budget).build([long_chunk, short_chunk], [0.1, 0.2])
+
+    # The long chunk does not fit, the next one still does
+    assert context.chunks == [short_chunk]
+    assert context.tokens == estimate_tokens(context.format()) <= budget
+
+    assert ContextBuilder(token_budget=0).build([short_chunk], [0.1]).passages == []
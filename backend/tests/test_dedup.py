@@ -0,0 +1,138 @@
+import pytest
+from app.services.dedup import SimHashIndex, TextFingerprint, file_sha256, simhash, to_signed, to_unsigned
+from app.services.ingest_service import IngestService
+from app.db.models import Document, DocumentChunk
+from app.core.settings import settings
+from sqlalchemy import select, func
+from unittest.mock import patch
+from tests.conftest import create_session
+import io
+
+PARAGRAPH = "Deduplication keeps the vector index lean and top-k results varied. "
+
+def test_text_fingerprint_normalises():
+    """Case, whitespace, line endings and page boundaries do not change the fingerprint"""
+    first, second, other = TextFingerprint(), TextFingerprint(), TextFingerprint()
+    first.update("Hello   World\r\nSecond line")
+    second.update("hello world\n")
+    second.update("  second LINE  ")
+    other.update("Hello World, second line")
+    assert first.hexdigest() == second.hexdigest() != other.hexdigest()
+    assert TextFingerprint().hexdigest() is None
+
+def test_file_sha256_rewinds():
+    file = io.BytesIO(b"x" * (settings.UPLOAD_CHUNK_SIZE * 2 + 1))
+    file.seek(10)
+    assert file_sha256(file) == file_sha256(io.BytesIO(file.getvalue()))
+    assert file.tell() == 0
+
+def test_simhash_near_duplicates():
+    """Lightly edited text lands within a few bits, unrelated text does not"""
+    original = simhash(PARAGRAPH * 6)
+    edited = simhash(PARAGRAPH * 6 + "Minor edit.")
+    unrelated = simhash("Quarterly revenue grew in every region except the northern office. " * 6)
+    index = SimHashIndex([original], max_distance=3)
+    assert index.near(edited)
+    assert not index.near(unrelated)
+    assert index.near(original ^ 0b111) and not index.near(original ^ 0b1111)
+    assert to_unsigned(to_signed(original)) == original and -2 ** 63 <= to_signed(original) < 2 ** 63
+
+@pytest.mark.asyncio
+async def test_duplicate_uploads(async_db_session, mock_embeddings):
+    """Identical files reuse the indexed document, or its chunks from another session, without embedding again"""
+    service = IngestService(async_db_session)
+    session_id = await create_session(async_db_session)
+    content = "\n\n".join(f"Section {i}. " + PARAGRAPH * 4 for i in range(6)).encode()
+
+    document = await service.ingest_content(io.BytesIO(content), "text/plain", "notes.txt", session_id)
+    embedded = mock_embeddings.await_count
+    assert document.content_hash and document.text_hash
+
+    again = await service.ingest_content(io.BytesIO(content), "text/plain", "notes (1).txt", session_id)
+    assert again.id == document.id
+
+    other_session = await create_session(async_db_session)
+    copy = await service.ingest_content(io.BytesIO(content), "text/plain", "notes.txt", other_session)
+    assert copy.id != document.id
+    assert copy.meta_info["copied_from"] == str(document.id)
+    assert copy.meta_info["chunk_count"] == document.meta_info["chunk_count"]
+
+    # Same text, different bytes: dropped once extracted
+    reformatted = content.replace(b"\n\n", b"\r\n\r\n")
+    same_text = await service.ingest_content(io.BytesIO(reformatted), "text/plain", "notes-crlf.txt", session_id)
+    assert same_text.id == document.id
+
+    # Its text was fingerprinted before any chunk was embedded
+    assert mock_embeddings.await_count == embedded
+    counts = dict((await async_db_session.execute(
+        select(Document.session_id, func.count(DocumentChunk.id))
+        .join(DocumentChunk, DocumentChunk.document_id == Document.id)
+        .group_by(Document.session_id)
+    )).all())
+    assert {str(k): v for k, v in counts.items()} == {
+        session_id: document.meta_info["chunk_count"],
+        other_session: document.meta_info["chunk_count"]
+    }
+
+@pytest.mark.asyncio
+async def test_near_duplicate_chunks(async_db_session, mock_embeddings):
+    """With DEDUP_NEAR_DUPLICATE_CHUNKS, repeated chunks are neither embedded nor stored"""
+    service = IngestService(async_db_session)
+    session_id = await create_session(async_db_session)
+    boilerplate = "Confidential. Do not distribute outside the company. " * 8
+    content = "\n\n".join(
+        f"Chapter {i}. " + f"Topic {i} covers a different subject entirely, number {i * 7919}. " * 6 + "\n\n" + boilerplate
+        for i in range(5)
+    ).encode()
+
+    with patch.object(settings, "DEDUP_NEAR_DUPLICATE_CHUNKS", True):
+        document = await service.ingest_content(io.BytesIO(content), "text/plain", "handbook.txt", session_id)
+
+    stored = (await async_db_session.execute(
+        select(DocumentChunk.content).where(DocumentChunk.document_id == document.id)
+    )).scalars().all()
+    assert document.meta_info["near_duplicate_chunks"] >= 4
+    assert sum("Confidential" in chunk for chunk in stored) == 1
+    assert sum(len(call.args[0]) for call in mock_embeddings.await_args_list) == len(stored)
+
+@pytest.mark.asyncio
+async def test_near_identical_reupload(async_db_session, mock_embeddings):
+    """Re-uploading a file whose chunks are all near duplicates is not an extraction failure"""
+    service = IngestService(async_db_session)
+    session_id = await create_session(async_db_session)
+    content = "\n\n".join(f"Topic {i} covers a different subject entirely, number {i * 7919}. " * 6 for i in range(5))
+
+    with patch.object(settings, "DEDUP_NEAR_DUPLICATE_CHUNKS", True):
+        document = await service.ingest_content(io.BytesIO(content.encode()), "text/plain", "notes.txt", session_id)
+        # Same normalised text: the existing document
+        same_text = await service.ingest_content(io.BytesIO(content.upper().encode()), "text/plain", "NOTES.txt", session_id)
+        assert same_text.id == document.id
+
+        # Lightly edited: kept, its chunks already in the session
+        edited = await service.ingest_content(
+            io.BytesIO((content + " Thanks.").encode()), "text/plain", "notes-v2.txt", session_id
+        )
+    assert edited.id != document.id
+    assert edited.meta_info["chunk_count"] == 0
+    assert edited.meta_info["near_duplicate_chunks"] == document.meta_info["chunk_count"]
+
+@pytest.mark.asyncio
+async def test_copy_needs_every_chunk(async_db_session, mock_embeddings):
+    """A document missing chunks skipped as near duplicates in its session is not copied to another"""
+    service = IngestService(async_db_session)
+    session_id = await create_session(async_db_session)
+    boilerplate = "Confidential. Do not distribute outside the company. " * 8
+    first, second = (
+        "\n\n".join(f"Topic {i} covers a different subject entirely, number {i * 7919}. " * 6 + "\n\n" + boilerplate for i in topics).encode()
+        for topics in (range(0, 3), range(3, 6))
+    )
+
+    with patch.object(settings, "DEDUP_NEAR_DUPLICATE_CHUNKS", True):
+        await service.ingest_content(io.BytesIO(first), "text/plain", "first.txt", session_id)
+        partial = await service.ingest_content(io.BytesIO(second), "text/plain", "second.txt", session_id)
+        assert partial.meta_info["near_duplicate_chunks"] >= 1
+
+        other_session = await create_session(async_db_session)
+        document = await service.ingest_content(io.BytesIO(second), "text/plain", "second.txt", other_session)
+    assert "copied_from" not in document.meta_info
+    assert document.meta_info["chunk_count"] > partial.meta_info["chunk_count"]
@@ -1,25 +1,20 @@
 import pytest
 from app.services.document_service import DocumentService
 from app.db.models import Document, DocumentChunk
+from app.db.bulk import copy_chunks
+from app.db.vector_index import uses_sequential_scan
 from app.core.settings import settings
-from unittest.mock import Mock, patch
+from sqlalchemy import text
+from unittest.mock import AsyncMock, Mock, patch
+from tests.conftest import add_session_with_chunks
+import numpy as np
 import io
-
-@pytest.fixture
-def mock_embeddings():
-    with patch('app.services.embeddings_service.GeminiEmbeddings') as mock:
-        embedder = Mock()
-        embedder.aembed_documents.return_value = [
-            [0.1] * settings.EMBEDDING_DIMENSIONS
-        ]
-        embedder.aembed_query.return_value = [0.1] * settings.EMBEDDING_DIMENSIONS
-        mock.return_value = embedder
-        yield mock
+import uuid
 
 @pytest.mark.asyncio
-async def test_document_processing(db_session, mock_embeddings):
+async def test_document_processing(async_db_session, mock_embeddings):
     """Test document processing with different file types"""
-    service = DocumentService(db_session)
+    service = DocumentService(async_db_session)
     
     # Test text processing
     text_doc = await service.process_document(
@@ -48,9 +43,9 @@ async def test_document_processing(db_session, mock_embeddings):
               for chunk in pdf_doc.chunks)
 
 @pytest.mark.asyncio
-async def test_vector_search(db_session, mock_embeddings):
+async def test_vector_search(async_db_session, mock_embeddings):
     """Test vector similarity search"""
-    service = DocumentService(db_session)
+    service = DocumentService(async_db_session)
     
     # Create test document with chunks
     document = await service.process_document(
@@ -74,9 +69,9 @@ async def test_vector_search(db_session, mock_embeddings):
     assert all(chunk.document_id == document.id for chunk in chunks)
 
 @pytest.mark.asyncio
-async def test_document_errors(db_session, mock_embeddings):
+async def test_document_errors(async_db_session, mock_embeddings):
     """Test document service error handling"""
-    service = DocumentService(db_session)
+    service = DocumentService(async_db_session)
     
     # Test invalid session
     with pytest.raises(ValueError):
@@ -101,4 +96,184 @@ async def test_document_errors(db_session, mock_embeddings):
         await service.search_similar_chunks(
             query="",
             session_id="test-session"
-        ) 
\ No newline at end of file
+        ) 
+@pytest.mark.asyncio
+async def test_session_scoped_vector_search(async_db_session):
+    """Test similarity search only returns chunks from the requested session"""
+    session, document = await add_session_with_chunks(async_db_session)
+    other_session, other_document = await add_session_with_chunks(async_db_session)
+    service = DocumentService(async_db_session)
+    service.embeddings.aembed_query = AsyncMock(return_value=np.random.rand(settings.EMBEDDING_DIMENSIONS).tolist())
+
+    # Exact scan so the result does not depend on ivfflat recall over a tiny table
+    await async_db_session.execute(text("SET LOCAL enable_indexscan = off"))
+    chunks, scores = await service.search_similar_chunks("test query", str(session.id), limit=5)
+
+    assert len(chunks) == 5
+    assert all(chunk.document_id == document.id for chunk in chunks)
+    assert scores == sorted(scores)
+
+    chunks, _ = await service.search_similar_chunks(
+        "test query", str(session.id), limit=5, document_ids=[str(other_document.id)]
+    )
+    assert chunks == []
+
+@pytest.mark.asyncio
+async def test_small_session_in_large_table(async_db_session):
+    """A small session is found even when every chunk the shared index ranks first belongs to another session"""
+    rng = np.random.default_rng(0)
+    query_embedding = rng.standard_normal(settings.EMBEDDING_DIMENSIONS)
+    large_session, large_document = await add_session_with_chunks(async_db_session, count=0)
+    # Clustered around the query, they fill the top of the index for it
+    await copy_chunks(async_db_session, [
+        (large_document.id, i, f"Large chunk {i}", query_embedding + 0.1 * rng.standard_normal(settings.EMBEDDING_DIMENSIONS), None, None)
+        for i in range(2000)
+    ])
+    await async_db_session.commit()
+    session, document = await add_session_with_chunks(async_db_session, count=30)
+    service = DocumentService(async_db_session, embeddings=Mock(), text_splitter=Mock())
+
+    plan = await service.explain_similarity_search(query_embedding.tolist(), str(session.id))
+    assert not any("idx_document_chunks_embedding" in line for line in plan), "\n".join(plan)
+    for weights in ({"lexical_weight": 0}, {}):
+        chunks, distances = await service.search_similar_chunks(
+            "Chunk", str(session.id), limit=5, query_embedding=query_embedding.tolist(), **weights
+        )
+        assert len(chunks) == 5
+        assert all(chunk.document_id == document.id for chunk in chunks)
+
+    # Sessions past the threshold walk the index, widened by their share of the table
+    await async_db_session.execute(text("ANALYZE document_chunks"))
+    with patch.object(settings, "EXACT_SEARCH_MAX_CHUNKS", 10):
+        await service.search_similar_chunks("Chunk", str(session.id), limit=5, query_embedding=query_embedding.tolist(), lexical_weight=0)
+    probes = (await async_db_session.execute(text("SHOW ivfflat.probes"))).scalar()
+    assert int(probes) == pytest.approx(settings.IVFFLAT_PROBES * 2030 / 30, rel=0.05)
+
+async def _add_large_session(async_db_session, documents=100, count=3000):
+    """A session large enough, spread over enough documents, for the planner to pick indexes on cost"""
+    session, _ = await add_session_with_chunks(async_db_session, count=0)
+    rows = [Document(session_id=session.id, filename=f"doc-{i}.txt", file_type="txt", meta_info={"status": "complete"}) for i in range(documents)]
+    async_db_session.add_all(rows)
+    await async_db_session.commit()
+    await copy_chunks(async_db_session, [
+        (rows[i % documents].id, i, f"Chunk {i}", np.random.rand(settings.EMBEDDING_DIMENSIONS), None, None)
+        for i in range(count)
+    ])
+    await async_db_session.commit()
+    await async_db_session.execute(text("ANALYZE documents"))
+    await async_db_session.execute(text("ANALYZE document_chunks"))
+    return session
+
+@pytest.mark.asyncio
+async def test_similarity_search_uses_index(async_db_session):
+    """EXPLAIN self-check, with default planner settings: retrieval, vector-only and hybrid,
+    must be served by indexes, never a sequential scan"""
+    small, _ = await add_session_with_chunks(async_db_session)
+    large = await _add_large_session(async_db_session)
+    service = DocumentService(async_db_session)
+    query_embedding = np.random.rand(settings.EMBEDDING_DIMENSIONS).tolist()
+
+    # Small sessions are scanned exactly, their chunks fetched by document_id
+    plan = await service.explain_similarity_search(query_embedding, str(small.id))
+    assert not uses_sequential_scan(plan), "\n".join(plan)
+    assert any("CTE Scan on session_chunks" in line for line in plan), "\n".join(plan)
+    assert any("idx_document_chunks_document_chunk" in line for line in plan), "\n".join(plan)
+    assert not any("idx_document_chunks_embedding" in line for line in plan), "\n".join(plan)
+
+    # Larger ones walk the embedding index
+    with patch.object(settings, "EXACT_SEARCH_MAX_CHUNKS", 100):
+        plan = await service.explain_similarity_search(query_embedding, str(large.id))
+    assert not uses_sequential_scan(plan), "\n".join(plan)
+    assert any("idx_document_chunks_embedding" in line for line in plan), "\n".join(plan)
+
+    # The full-text half of hybrid retrieval reads a small session's chunks by document_id
+    # too, and a larger one's matches from the GIN index
+    query_text = "error code E1234"
+    plan = await service.explain_similarity_search(query_embedding, str(small.id), query_text=query_text)
+    assert not uses_sequential_scan(plan), "\n".join(plan)
+    with patch.object(settings, "EXACT_SEARCH_MAX_CHUNKS", 100):
+        plan = await service.explain_similarity_search(query_embedding, str(large.id), query_text=query_text)
+    assert not uses_sequential_scan(plan), "\n".join(plan)
+    assert any("idx_document_chunks_embedding" in line for line in plan), "\n".join(plan)
+    assert any("idx_document_chunks_content_tsv" in line for line in plan), "\n".join(plan)
+
+@pytest.mark.asyncio
+async def test_hybrid_search_finds_exact_terms(async_db_session):
+    """Exact identifiers ranked poorly by embeddings are recovered by the full-text half of hybrid retrieval"""
+    session, document = await add_session_with_chunks(async_db_session)
+    query_embedding = np.ones(settings.EMBEDDING_DIMENSIONS)
+    # Points away from the query, vector search alone ranks it last
+    async_db_session.add(DocumentChunk(
+        document_id=document.id,
+        content="Part number XK-4471-B ships in boxes of 12",
+        chunk_index=100,
+        embedding=(-query_embedding).tolist()
+    ))
+    await async_db_session.commit()
+    service = DocumentService(async_db_session)
+    service.embeddings.aembed_query = AsyncMock(return_value=query_embedding.tolist())
+
+    await async_db_session.execute(text("SET LOCAL enable_indexscan = off"))
+    chunks, _ = await service.search_similar_chunks("price of XK-4471-B", str(session.id), limit=3, lexical_weight=0)
+    assert all("XK-4471-B" not in chunk.content for chunk in chunks)
+
+    chunks, distances = await service.search_similar_chunks("price of XK-4471-B", str(session.id), limit=3)
+    assert len(chunks) == 3
+    assert any("XK-4471-B" in chunk.content for chunk in chunks)
+    assert len(distances) == 3
+
+    # Lexical only
+    chunks, _ = await service.search_similar_chunks("XK-4471-B", str(session.id), limit=3, vector_weight=0)
+    assert "XK-4471-B" in chunks[0].content
+
+    with pytest.raises(ValueError):
+        await service.search_similar_chunks("XK-4471-B", str(session.id), vector_weight=0, lexical_weight=0)
+
+@pytest.mark.asyncio
+async def test_search_max_distance(async_db_session):
+    """Vector matches past the distance cutoff are dropped, full-text matches are kept in hybrid mode"""
+    session, document = await add_session_with_chunks(async_db_session)
+    query_embedding = np.ones(settings.EMBEDDING_DIMENSIONS)
+    async_db_session.add(DocumentChunk(
+        document_id=document.id,
+        content="Part number XK-4471-B ships in boxes of 12",
+        chunk_index=100,
+        embedding=(-query_embedding).tolist()
+    ))
+    await async_db_session.commit()
+    service = DocumentService(async_db_session)
+    service.embeddings.aembed_query = AsyncMock(return_value=query_embedding.tolist())
+
+    chunks, distances = await service.search_similar_chunks("XK-4471-B", str(session.id), limit=20, lexical_weight=0)
+    cutoff = sorted(distances)[len(distances) // 2]
+    chunks, distances = await service.search_similar_chunks(
+        "XK-4471-B", str(session.id), limit=20, lexical_weight=0, max_distance=cutoff
+    )
+    assert chunks and all(distance <= cutoff for distance in distances)
+    assert all("XK-4471-B" not in chunk.content for chunk in chunks)
+
+    chunks, distances = await service.search_similar_chunks("XK-4471-B", str(session.id), limit=20, max_distance=cutoff)
+    assert any("XK-4471-B" in chunk.content for chunk in chunks)
+    assert max(distances) > cutoff
+
+@pytest.mark.parametrize("quantization", ["halfvec", "binary"])
+def test_quantized_search_reranks(quantization):
+    """With a quantised index, candidates ordered by the quantised expression are re-ranked by exact distance"""
+    service = DocumentService(Mock())
+    with patch.object(settings, "VECTOR_QUANTIZATION", quantization):
+        for hybrid in (False, True):
+            sql = service._similarity_sql(hybrid=hybrid)
+            assert "halfvec" in sql if quantization == "halfvec" else "binary_quantize(c.embedding)" in sql
+            assert "LIMIT :rerank_candidates" in sql
+            assert "ORDER BY distance" in sql
+
+        params = service._similarity_params([0.0] * settings.EMBEDDING_DIMENSIONS, str(uuid.uuid4()), 5)
+        assert params["rerank_candidates"] == max(settings.VECTOR_RERANK_CANDIDATES, 5)
+        params = service._similarity_params(
+            [0.0] * settings.EMBEDDING_DIMENSIONS, str(uuid.uuid4()), 500, query_text="q", vector_weight=1, lexical_weight=1
+        )
+        assert params["rerank_candidates"] >= params["candidates"] >= 500
+
+    sql = service._similarity_sql()
+    assert ":rerank_candidates" not in sql
+    assert "rerank_candidates" not in service._similarity_params([0.0] * settings.EMBEDDING_DIMENSIONS, str(uuid.uuid4()), 5)
@@ -0,0 +1,56 @@
+import pytest
+from app.services.embedding_cache import EmbeddingCache, text_hash
+from app.db.models import EmbeddingCache as EmbeddingCacheEntry
+from app.core.settings import settings
+from tests.conftest import AsyncTestingSessionLocal
+from sqlalchemy import select, func
+import numpy as np
+
+MODEL = settings.EMBEDDING_MODEL
+
+@pytest.mark.asyncio
+async def test_cache_memory_and_database(async_db_session):
+    """Test entries are served from memory, then from Postgres once evicted"""
+    cache = EmbeddingCache(session_factory=AsyncTestingSessionLocal)
+    vector = np.random.rand(settings.EMBEDDING_DIMENSIONS).tolist()
+
+    assert await cache.get_many(MODEL, "retrieval_document", ["hello"]) == [None]
+    await cache.put_many(MODEL, "retrieval_document", ["hello"], [vector])
+
+    assert await cache.get_many(MODEL, "retrieval_document", ["hello"]) == [np.float32(vector).tolist()]
+    cache.clear_memory()
+    assert await cache.get_many(MODEL, "retrieval_document", ["hello"]) == [np.float32(vector).tolist()]
+
+    # Task type is part of the key
+    assert await cache.get_many(MODEL, "retrieval_query", ["hello"]) == [None]
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["db_hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+
+    row = (await async_db_session.execute(select(EmbeddingCacheEntry))).scalars().one()
+    assert row.text_hash == text_hash("hello")
+    assert len(row.embedding) == settings.EMBEDDING_DIMENSIONS * 4
+
+@pytest.mark.asyncio
+async def test_cache_compact_storage(async_db_session):
+    """Test float16 storage halves entry size and duplicates are written once"""
+    cache = EmbeddingCache(session_factory=AsyncTestingSessionLocal, dtype="float16")
+    vector = np.random.rand(settings.EMBEDDING_DIMENSIONS).tolist()
+
+    await cache.put_many(MODEL, "retrieval_document", ["a", "a"], [vector, vector])
+    await cache.put_many(MODEL, "retrieval_document", ["a"], [vector])
+    cache.clear_memory()
+
+    cached = (await cache.get_many(MODEL, "retrieval_document", ["a"]))[0]
+    assert np.allclose(cached, vector, atol=1e-3)
+    row = (await async_db_session.execute(select(EmbeddingCacheEntry))).scalars().one()
+    assert len(row.embedding) == settings.EMBEDDING_DIMENSIONS * 2
+
+def test_memory_lru_eviction():
+    cache = EmbeddingCache(memory_size=2)
+    for name in ["a", "b", "c"]:
+        cache._remember((MODEL, "retrieval_document", name), np.zeros(2, dtype=np.float32))
+    assert list(key[2] for key in cache._memory) == ["b", "c"]
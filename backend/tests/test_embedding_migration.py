@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import text
+from app.db.embedding_migration import column_dimensions, migrate_embeddings
+from app.db.vector_index import INDEX_NAME, index_stats
+from app.core.settings import settings
+from tests.conftest import engine
+from unittest.mock import patch
+import numpy as np
+import json
+
+@pytest.fixture
+def restore_embedding_column(db_session):
+    """Resize the column back to EMBEDDING_DIMENSIONS after the test, even a failed one"""
+    yield
+    db_session.rollback()
+    with engine.connect() as conn:
+        resized = column_dimensions(conn) != settings.EMBEDDING_DIMENSIONS
+    if resized:
+        migrate_embeddings(engine, embed=lambda contents: [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in contents])
+
+def stored(db_session):
+    return db_session.execute(
+        text("SELECT chunk_index, embedding::text FROM document_chunks ORDER BY chunk_index")
+    ).fetchall()
+
+@pytest.mark.parametrize("chunks", [30], indirect=True)
+def test_truncate_stored_embeddings(db_session, chunks, restore_embedding_column):
+    """Test stored embeddings are truncated, re-normalised and re-indexed at the new size"""
+    with patch.object(settings, "EMBEDDING_DIMENSIONS", 256):
+        report = migrate_embeddings(engine, batch_size=7)
+        assert report["from"] == settings.EMBEDDING_MODEL_DIMENSIONS
+        assert report["to"] == 256
+        assert report["chunks"] == 30
+
+        with engine.connect() as conn:
+            assert column_dimensions(conn) == 256
+            assert column_dimensions(conn, "embedding_resized") is None
+        for index, embedding in stored(db_session):
+            vector = np.array(json.loads(embedding))
+            expected = chunks[index][:256] / np.linalg.norm(chunks[index][:256])
+            assert np.allclose(vector, expected, atol=1e-5)
+
+        stats = index_stats(db_session)
+        assert stats["exists"] and INDEX_NAME in stats["definition"]
+        # Release the reads, the migration locks the table
+        db_session.rollback()
+        assert migrate_embeddings(engine)["chunks"] == 0
+
+    # Growing back needs new embeddings
+    with pytest.raises(ValueError, match="--source api"):
+        migrate_embeddings(engine)
+    report = migrate_embeddings(engine, embed=lambda contents: [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in contents])
+    assert report["chunks"] == 30
+    with engine.connect() as conn:
+        assert column_dimensions(conn) == settings.EMBEDDING_DIMENSIONS
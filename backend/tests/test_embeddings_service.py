@@ -1,8 +1,11 @@
 import pytest
 from app.services.embeddings_service import GeminiEmbeddings
+from app.services.embedding_cache import EmbeddingCache
 from app.core.settings import settings
+from tests.conftest import AsyncTestingSessionLocal
 from unittest.mock import Mock, patch
 import numpy as np
+import time
 
 @pytest.fixture
 def mock_gemini():
@@ -12,8 +15,13 @@ def mock_gemini():
         mock.return_value = model
         yield mock
 
+@pytest.fixture
+def no_embedding_cache():
+    with patch.object(settings, "EMBEDDING_CACHE_ENABLED", False):
+        yield
+
 @pytest.mark.asyncio
-async def test_embedding_dimensions(mock_gemini):
+async def test_embedding_dimensions(mock_gemini, no_embedding_cache):
     """Test embedding dimensions and format"""
     embeddings = GeminiEmbeddings()
     
@@ -29,21 +37,24 @@ async def test_embedding_dimensions(mock_gemini):
     assert all(len(emb) == settings.EMBEDDING_DIMENSIONS for emb in doc_embeddings)
 
 @pytest.mark.asyncio
-async def test_rate_limiting(mock_gemini):
-    """Test rate limit tracking and batching"""
+async def test_rate_limiting(mock_gemini, no_embedding_cache):
+    """Test embedding calls go through the shared process-wide rate limiter"""
     embeddings = GeminiEmbeddings()
+    assert embeddings.rate_limiter is GeminiEmbeddings().rate_limiter
     
     # Process multiple batches
     texts = ["test"] * (settings.EMBEDDING_BATCH_SIZE * 2)
-    await embeddings.aembed_documents(texts)
+    acquired = embeddings.rate_limiter.total_acquired
+    with patch('google.generativeai.embed_content', side_effect=lambda model, content, task_type: {
+        "embedding": [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in content]
+    }):
+        await embeddings.aembed_documents(texts)
     
     # Verify rate limiting
-    assert embeddings.request_count == len(texts)
-    assert embeddings.last_request_time > 0
-    mock_gemini.return_value.embed_content.call_count == len(texts)
+    assert embeddings.rate_limiter.total_acquired - acquired == len(texts)
 
 @pytest.mark.asyncio
-async def test_embedding_errors(mock_gemini):
+async def test_embedding_errors(mock_gemini, no_embedding_cache):
     """Test error handling in embedding service"""
     embeddings = GeminiEmbeddings()
     
@@ -54,4 +65,114 @@ async def test_embedding_errors(mock_gemini):
     # Test batch size limit
     large_batch = ["test"] * (settings.EMBEDDING_BATCH_SIZE + 1)
     with pytest.raises(ValueError):
-        await embeddings.aembed_documents(large_batch) 
\ No newline at end of file
+        await embeddings.aembed_documents(large_batch) 
+@pytest.mark.asyncio
+async def test_batched_concurrent_embedding(no_embedding_cache):
+    """Test one request per batch with bounded concurrency"""
+    in_flight = 0
+    max_in_flight = 0
+
+    def fake_embed_content(model, content, task_type):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        time.sleep(0.05)
+        in_flight -= 1
+        return {"embedding": [[float(len(text))] * settings.EMBEDDING_DIMENSIONS for text in content]}
+
+    texts = [f"text {i}" for i in range(settings.EMBEDDING_BATCH_SIZE * 6 + 1)]
+    with patch('google.generativeai.embed_content', side_effect=fake_embed_content) as mock_embed:
+        embeddings = GeminiEmbeddings()
+        result = await embeddings.aembed_documents(texts)
+
+    assert mock_embed.call_count == 7
+    assert all(isinstance(call.kwargs["content"], list) for call in mock_embed.call_args_list)
+    assert len(result) == len(texts)
+    # Order is preserved across concurrently completed batches
+    assert [embedding[0] for embedding in result] == [float(len(text)) for text in texts]
+    assert 1 < max_in_flight <= settings.EMBEDDING_MAX_CONCURRENCY
+
+@pytest.mark.asyncio
+async def test_cached_embeddings(async_db_session):
+    """Test cached and repeated texts are not re-embedded"""
+    cache = EmbeddingCache(session_factory=AsyncTestingSessionLocal)
+    fake_embed_content = lambda model, content, task_type: {
+        "embedding": [[float(len(text))] * settings.EMBEDDING_DIMENSIONS for text in content]
+    }
+
+    with patch('google.generativeai.embed_content', side_effect=fake_embed_content) as mock_embed:
+        embeddings = GeminiEmbeddings(cache=cache)
+        first = await embeddings.aembed_documents(["a", "bb", "a"])
+        assert mock_embed.call_count == 1
+        assert mock_embed.call_args.kwargs["content"] == ["a", "bb"]
+
+        second = await embeddings.aembed_documents(["bb", "a", "ccc"])
+        assert mock_embed.call_count == 2
+        assert mock_embed.call_args.kwargs["content"] == ["ccc"]
+
+    assert first[0] == first[2] == second[1]
+    assert second[2][0] == 3.0
+
+@pytest.mark.asyncio
+async def test_hedged_query_embedding(no_embedding_cache):
+    """Test a slow query embedding is hedged with a rate limited duplicate and the faster answer wins"""
+    from app.services.embeddings_service import query_attempts
+    from unittest.mock import AsyncMock
+
+    delays = iter([0.5, 0.0])
+
+    def fake_embed_content(model, content, task_type):
+        time.sleep(next(delays))
+        return {"embedding": [0.5] * settings.EMBEDDING_DIMENSIONS}
+
+    with patch('google.generativeai.embed_content', side_effect=fake_embed_content) as mock_embed, \
+         patch.object(settings, "EMBEDDING_HEDGE_DELAY", 0.05):
+        embeddings = GeminiEmbeddings()
+        embeddings.hedge = True
+        embeddings.rate_limiter = Mock(acquire=AsyncMock())
+        sent, won = query_attempts.outcomes.get("hedge_sent", 0), query_attempts.outcomes.get("hedge_won", 0)
+
+        started = time.perf_counter()
+        assert await embeddings.aembed_query("slow query") == [0.5] * settings.EMBEDDING_DIMENSIONS
+        assert time.perf_counter() - started < 0.4
+
+    assert mock_embed.call_count == 2
+    assert embeddings.rate_limiter.acquire.await_count == 2
+    assert query_attempts.outcomes["hedge_sent"] == sent + 1
+    assert query_attempts.outcomes["hedge_won"] == won + 1
+
+@pytest.mark.asyncio
+async def test_query_embedding_timeout(no_embedding_cache):
+    """Test a hung embedding request fails with a typed error after EMBEDDING_TIMEOUT"""
+    from app.services.resilience import UpstreamUnavailableError
+
+    def hung_embed_content(model, content, task_type):
+        time.sleep(0.3)
+        return {"embedding": [0.5] * settings.EMBEDDING_DIMENSIONS}
+
+    with patch('google.generativeai.embed_content', side_effect=hung_embed_content):
+        embeddings = GeminiEmbeddings()
+        embeddings.timeout = 0.05
+        with pytest.raises(UpstreamUnavailableError):
+            await embeddings.aembed_query("hung query")
+
+@pytest.mark.asyncio
+async def test_reduced_dimensions(no_embedding_cache):
+    """Test embeddings are truncated to EMBEDDING_DIMENSIONS and re-normalised"""
+    full = np.random.rand(settings.EMBEDDING_MODEL_DIMENSIONS)
+    def embed_content(model, content, task_type, **options):
+        if isinstance(content, list):
+            return {"embedding": [full.tolist() for _ in content]}
+        return {"embedding": full.tolist()}
+
+    with patch.object(settings, "EMBEDDING_DIMENSIONS", 256), \
+         patch('google.generativeai.embed_content', side_effect=embed_content):
+        embeddings = GeminiEmbeddings()
+        assert embeddings.cache_model == f"{settings.EMBEDDING_MODEL}@256"
+        query_embedding = await embeddings.aembed_query("test query")
+        doc_embeddings = await embeddings.aembed_documents(["doc 1", "doc 2"])
+
+    expected = full[:256] / np.linalg.norm(full[:256])
+    assert np.allclose(query_embedding, expected)
+    assert all(np.allclose(embedding, expected) for embedding in doc_embeddings)
+    assert GeminiEmbeddings().cache_model == settings.EMBEDDING_MODEL
@@ -0,0 +1,166 @@
+import pytest
+from app.services.ingest_jobs import IngestJobQueue
+from app.schemas.models import IngestJobStatus
+from app.db.models import Document, DocumentChunk
+from app.services.document_service import DocumentService
+from app.core.settings import settings
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from unittest.mock import Mock, patch
+from tests.conftest import AsyncTestingSessionLocal, create_session
+import io
+
+async def _document_status(db, job):
+    return (await db.execute(select(Document.meta_info["status"].as_string()).where(Document.id == job.document_id))).scalar()
+
+@pytest.fixture
+async def job_queue():
+    queue = IngestJobQueue(session_factory=AsyncTestingSessionLocal, workers=2, max_queued=10)
+    yield queue
+    await queue.stop()
+
+@pytest.mark.asyncio
+async def test_ingest_job_lifecycle(async_db_session, mock_embeddings, job_queue):
+    """Queued uploads are indexed in the background with progress reported per job"""
+    session_id = await create_session(async_db_session)
+    # Distinct files, identical ones would be deduplicated
+    contents = [(f"Notes {i}. " + "Background ingestion keeps uploads off the request path. " * 200).encode() for i in range(3)]
+
+    jobs = [job_queue.enqueue(session_id, f"notes-{i}.txt", "text/plain", io.BytesIO(content)) for i, content in enumerate(contents)]
+    assert all(job.status == IngestJobStatus.QUEUED for job in jobs)
+    await job_queue.join()
+
+    for job in jobs:
+        assert job.status == IngestJobStatus.INDEXED, job.error
+        assert job.document_id is not None
+        assert job.chunk_count > 0
+        assert job.chunks_per_second is not None
+        assert job.file is None
+    assert job_queue.get(jobs[0].id) is jobs[0]
+    assert len(job_queue.list(session_id)) == 3
+    assert job_queue.list("other-session") == []
+
+    stored = (await async_db_session.execute(select(func.count(DocumentChunk.id)))).scalar()
+    assert stored == sum(job.chunk_count for job in jobs)
+    assert job_queue.stats()["jobs"]["indexed"] == 3
+
+@pytest.mark.asyncio
+async def test_ingest_job_failure(async_db_session, mock_embeddings, job_queue):
+    """Pipeline errors mark the job failed without stopping the workers"""
+    session_id = await create_session(async_db_session)
+    mock_embeddings.side_effect = RuntimeError("quota exceeded")
+
+    failed = job_queue.enqueue(session_id, "notes.txt", "text/plain", io.BytesIO(b"Some content"))
+    await job_queue.join()
+    assert failed.status == IngestJobStatus.FAILED
+    assert "quota exceeded" in failed.error
+
+    mock_embeddings.side_effect = lambda texts: [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts]
+    job = job_queue.enqueue(session_id, "notes.txt", "text/plain", io.BytesIO(b"Some content"))
+    await job_queue.join()
+    assert job.status == IngestJobStatus.INDEXED
+
+@pytest.mark.asyncio
+async def test_ingest_job_resume(async_db_session, mock_embeddings, job_queue):
+    """Batches are committed as they are embedded, a retried job resumes after the last one"""
+    session_id = await create_session(async_db_session)
+    content = "\n\n".join(f"Paragraph {i}. " + "Streaming ingestion commits batch by batch. " * 8 for i in range(12))
+    embedded = []
+
+    def flaky_embed(texts):
+        if len(embedded) == 2:
+            raise RuntimeError("quota exceeded")
+        embedded.append(list(texts))
+        return [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts]
+    mock_embeddings.side_effect = flaky_embed
+
+    with patch.object(settings, "INGEST_BATCH_SIZE", 3):
+        job = job_queue.enqueue(session_id, "notes.txt", "text/plain", io.BytesIO(content.encode()))
+        await job_queue.join()
+        assert job.status == IngestJobStatus.FAILED
+        assert job.chunk_count == 6
+        assert job.file is not None
+
+        # Committed batches are kept for the retry, out of retrieval meanwhile
+        stored = (await async_db_session.execute(
+            select(func.max(DocumentChunk.chunk_index)).where(DocumentChunk.document_id == job.document_id)
+        )).scalar()
+        assert stored == 5
+        assert await _document_status(async_db_session, job) == "failed"
+        chunks, _ = await DocumentService(async_db_session, embeddings=Mock(), text_splitter=Mock()).search_similar_chunks(
+            "Streaming ingestion", session_id, query_embedding=[0.1] * settings.EMBEDDING_DIMENSIONS
+        )
+        assert chunks == []
+
+        mock_embeddings.side_effect = lambda texts: embedded.append(list(texts)) or [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts]
+        assert job_queue.retry(job.id) is job
+        await job_queue.join()
+
+    assert job.status == IngestJobStatus.INDEXED, job.error
+    assert job.file is None
+    assert await _document_status(async_db_session, job) == "complete"
+    chunks = (await async_db_session.execute(
+        select(DocumentChunk.chunk_index, DocumentChunk.content)
+        .where(DocumentChunk.document_id == job.document_id)
+        .order_by(DocumentChunk.chunk_index)
+    )).all()
+    assert [index for index, _ in chunks] == list(range(len(chunks)))
+    assert job.chunk_count == len(chunks) > 6
+    # Chunks stored before the failure were not embedded again
+    assert sum(len(batch) for batch in embedded) == len(chunks)
+    with pytest.raises(HTTPException) as exc:
+        job_queue.retry(job.id)
+    assert exc.value.status_code == 409
+
+@pytest.mark.asyncio
+async def test_ingest_queue_limits(async_db_session, mock_embeddings):
+    """A full queue rejects uploads, finished jobs are pruned beyond the retention limit"""
+    session_id = await create_session(async_db_session)
+    queue = IngestJobQueue(session_factory=AsyncTestingSessionLocal, workers=1, max_queued=1, retention=1)
+    try:
+        queue.enqueue(session_id, "a.txt", "text/plain", io.BytesIO(b"First"))
+        with pytest.raises(HTTPException) as exc:
+            queue.enqueue(session_id, "b.txt", "text/plain", io.BytesIO(b"Second"))
+        assert exc.value.status_code == 503
+
+        await queue.join()
+        queue.enqueue(session_id, "c.txt", "text/plain", io.BytesIO(b"Third"))
+        await queue.join()
+        queue.enqueue(session_id, "d.txt", "text/plain", io.BytesIO(b"Fourth"))
+        assert [job.filename for job in queue.list()] == ["d.txt", "c.txt"]
+    finally:
+        await queue.stop()
+
+@pytest.mark.asyncio
+async def test_pruned_failed_job_deletes_document(async_db_session, mock_embeddings):
+    """A failed job pruned with its upload can no longer be retried, its partial document is deleted"""
+    session_id = await create_session(async_db_session)
+    content = "\n\n".join(f"Paragraph {i}. " + "Pruned jobs leave nothing behind. " * 8 for i in range(12))
+    calls = []
+
+    def flaky_embed(texts):
+        calls.append(texts)
+        if len(calls) == 2:
+            raise RuntimeError("quota exceeded")
+        return [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts]
+    mock_embeddings.side_effect = flaky_embed
+
+    queue = IngestJobQueue(session_factory=AsyncTestingSessionLocal, workers=1, retention=1)
+    try:
+        with patch.object(settings, "INGEST_BATCH_SIZE", 3):
+            failed = queue.enqueue(session_id, "notes.txt", "text/plain", io.BytesIO(content.encode()))
+            await queue.join()
+        assert failed.status == IngestJobStatus.FAILED
+        assert await _document_status(async_db_session, failed) == "failed"
+
+        queue.enqueue(session_id, "other.txt", "text/plain", io.BytesIO(b"Other content"))
+        await queue.join()
+        assert queue.get(failed.id) is None
+        assert failed.file is None
+        assert await _document_status(async_db_session, failed) is None
+        stored = (await async_db_session.execute(
+            select(func.count(DocumentChunk.id)).where(DocumentChunk.document_id == failed.document_id)
+        )).scalar()
+        assert stored == 0
+    finally:
+        await queue.stop()
@@ -8,8 +8,8 @@ import io
 from unittest.mock import Mock, patch
 
 @pytest.fixture
-def ingest_service(db_session):
-    return IngestService(db_session)
+def ingest_service(async_db_session):
+    return IngestService(async_db_session)
 
 @pytest.fixture
 def mock_document_service():
@@ -20,9 +20,9 @@ def mock_document_service():
         yield mock
 
 @pytest.mark.asyncio
-async def test_file_processing(db_session, mock_document_service):
+async def test_file_processing(async_db_session, mock_document_service):
     """Test successful file processing"""
-    service = IngestService(db_session)
+    service = IngestService(async_db_session)
     
     # Test valid file upload
     content = b"Test content"
@@ -37,9 +37,9 @@ async def test_file_processing(db_session, mock_document_service):
     mock_document_service.return_value.process_document.assert_called_once()
 
 @pytest.mark.asyncio
-async def test_file_validation(db_session):
+async def test_file_validation(async_db_session):
     """Test file validation checks"""
-    service = IngestService(db_session)
+    service = IngestService(async_db_session)
     
     # Test file size limit
     large_content = b"x" * (settings.MAX_FILE_SIZE + 1)
@@ -64,9 +64,9 @@ async def test_file_validation(db_session):
     assert "Unsupported file type" in str(exc.value.detail)
 
 @pytest.mark.asyncio
-async def test_ingest_errors(db_session):
+async def test_ingest_errors(async_db_session):
     """Test ingest service error handling"""
-    service = IngestService(db_session)
+    service = IngestService(async_db_session)
     
     # Test missing file
     with pytest.raises(ValueError):
@@ -79,4 +79,77 @@ async def test_ingest_errors(db_session):
         content_type="text/plain"
     )
     with pytest.raises(ValueError):
-        await service.process_file(file, "") 
\ No newline at end of file
+        await service.process_file(file, "") 
+class CountingReader(io.BytesIO):
+    """Tracks how much of an upload has been read"""
+    def __init__(self, content: bytes):
+        super().__init__(content)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+@pytest.mark.asyncio
+async def test_spooled_upload(async_db_session):
+    """Uploads are streamed to a spooled file and size-checked incrementally"""
+    service = IngestService(async_db_session)
+
+    # Small uploads stay in memory
+    spooled, content_type = await service.validate_file(
+        UploadFile(filename="small.txt", file=io.BytesIO(b"Small upload"))
+    )
+    with spooled:
+        assert content_type == "text/plain"
+        assert not spooled._rolled
+        assert service.document_service.read_file_content(spooled, content_type) == "Small upload"
+
+    # Larger uploads are spooled to disk, not held in memory
+    content = b"line of text\n" * (settings.UPLOAD_SPOOL_SIZE // 13 + 1000)
+    spooled, content_type = await service.validate_file(
+        UploadFile(filename="large.txt", file=io.BytesIO(content))
+    )
+    with spooled:
+        assert spooled._rolled
+        assert service.document_service.read_file_content(spooled, content_type) == content.decode()
+
+    # Oversized uploads are rejected once they cross the limit, without reading the rest
+    reader = CountingReader(b"x" * (settings.MAX_FILE_SIZE * 2))
+    with pytest.raises(HTTPException) as exc:
+        await service.validate_file(UploadFile(filename="huge.txt", file=reader))
+    assert exc.value.status_code == 413
+    assert reader.bytes_read <= settings.MAX_FILE_SIZE + settings.UPLOAD_CHUNK_SIZE
+
+@pytest.mark.asyncio
+async def test_table_ingestion(async_db_session):
+    """CSV uploads and DataFrames are stored as row-group chunks with their row ranges"""
+    from app.db.models import ChatSession, DocumentChunk
+    from sqlalchemy import select
+    from unittest.mock import AsyncMock
+    import pandas as pd
+
+    session = ChatSession(title="Tables")
+    async_db_session.add(session)
+    await async_db_session.commit()
+    service = IngestService(async_db_session)
+    service.document_service.embeddings.aembed_documents = AsyncMock(
+        side_effect=lambda texts: [[0.1] * settings.EMBEDDING_DIMENSIONS for _ in texts]
+    )
+
+    csv = "Region,Units\n" + "".join(f"Region {i},{i}\n" for i in range(200))
+    document = await service.ingest_content(io.BytesIO(csv.encode()), "text/csv", "units.csv", str(session.id))
+    chunks = (await async_db_session.execute(
+        select(DocumentChunk).where(DocumentChunk.document_id == document.id).order_by(DocumentChunk.chunk_index)
+    )).scalars().all()
+    assert len(chunks) == document.meta_info["chunk_count"] > 1
+    assert all(chunk.content.split("\n")[1] == "Region | Units" for chunk in chunks)
+    assert chunks[0].meta_info["row_start"] == 2 and chunks[-1].meta_info["row_end"] == 201
+
+    frame = pd.DataFrame({"Item": ["Rent", "Power"], "Cost": [100.0, None]})
+    document = await service.process_dataframe(frame, str(session.id))
+    stored = (await async_db_session.execute(
+        select(DocumentChunk).where(DocumentChunk.document_id == document.id)
+    )).scalars().all()
+    assert [chunk.content for chunk in stored] == ["Rows 2-3\nItem | Cost\nRent | 100\nPower"]
+    assert stored[0].meta_info == {"sheet": None, "row_start": 2, "row_end": 3}
@@ -6,11 +6,11 @@ from fastapi import UploadFile, HTTPException
 import io
 
 @pytest.mark.integration
-async def test_complete_rag_flow(db_session):
+async def test_complete_rag_flow(async_db_session):
     """Test complete RAG flow: upload, search, and chat"""
     # Setup services
-    ingest_service = IngestService(db_session)
-    chat_service = ChatService(db_session)
+    ingest_service = IngestService(async_db_session)
+    chat_service = ChatService(async_db_session)
     session = await chat_service.create_session("test-user")
 
     # Upload multiple documents
@@ -41,10 +41,10 @@ async def test_complete_rag_flow(db_session):
               for chunk in messages[1].meta_info["used_chunks"])
 
 @pytest.mark.integration
-async def test_error_handling_flow(db_session):
+async def test_error_handling_flow(async_db_session):
     """Test error handling in the complete flow"""
-    ingest_service = IngestService(db_session)
-    chat_service = ChatService(db_session)
+    ingest_service = IngestService(async_db_session)
+    chat_service = ChatService(async_db_session)
     session = await chat_service.create_session("test-user")
     
     # Test invalid file upload
@@ -48,4 +48,29 @@ async def test_llm_parameters(mock_gemini):
     await service.generate_response(messages)
     
     call_kwargs = mock_gemini.return_value.generate_content.call_args[1]
-    assert call_kwargs.get('temperature') == settings.TEMPERATURE
\ No newline at end of file
+    assert call_kwargs.get('temperature') == settings.TEMPERATURE
+@pytest.mark.asyncio
+async def test_llm_retries_without_blocking(mock_gemini):
+    """Test failed attempts back off with asyncio.sleep and exhausted retries raise a typed error"""
+    from app.services.resilience import CircuitBreaker, RetryPolicy, UpstreamUnavailableError
+    from google.api_core import exceptions as google_exceptions
+    from unittest.mock import AsyncMock
+
+    response = Mock(text="Recovered")
+    mock_gemini.return_value.generate_content_async = AsyncMock(
+        side_effect=[google_exceptions.ServiceUnavailable("down"), response]
+    )
+    service = LLMService(retry_policy=RetryPolicy(max_attempts=2), circuit_breaker=CircuitBreaker("test"))
+    service.rate_limiter = Mock(acquire=AsyncMock())
+
+    with patch("app.services.resilience.asyncio.sleep", new_callable=AsyncMock) as sleep, \
+         patch("time.sleep") as blocking_sleep:
+        assert await service.generate_response([{"role": "user", "content": "Hello"}]) == "Recovered"
+        sleep.assert_awaited_once()
+        blocking_sleep.assert_not_called()
+
+        mock_gemini.return_value.generate_content_async = AsyncMock(
+            side_effect=google_exceptions.ServiceUnavailable("down")
+        )
+        with pytest.raises(UpstreamUnavailableError):
+            await service.generate_response([{"role": "user", "content": "Hello"}])
@@ -0,0 +1,173 @@
+import pytest
+from app.services.document_service import DocumentService
+from app.services.ingest_service import IngestService
+from app.services.memory_search import InMemoryVectorSearch, SessionVectors, reciprocal_rank_fusion
+from app.db.models import Document
+from app.core.settings import settings
+from sqlalchemy import text
+from unittest.mock import AsyncMock, Mock
+from tests.conftest import add_session_with_chunks
+import numpy as np
+import os
+import uuid
+
+def session_vectors(count=50, dimensions=8, documents=2, metric="cosine"):
+    rng = np.random.default_rng(0)
+    document_ids = [uuid.uuid4() for _ in range(documents)]
+    return SessionVectors(
+        [uuid.uuid4() for _ in range(count)],
+        [document_ids[i % documents] for i in range(count)],
+        list(range(count)),
+        [f"Chunk {i}" for i in range(count)],
+        ["test.txt"] * count,
+        rng.standard_normal((count, dimensions)).astype(np.float32),
+        metric=metric
+    )
+
+@pytest.mark.parametrize("metric", ["cosine", "l2", "inner_product"])
+def test_distances_match_operators(metric):
+    """Test distances follow the pgvector operator of each metric and the top k is exact"""
+    vectors = session_vectors(metric=metric)
+    query = np.random.default_rng(1).standard_normal(8)
+    expected = {
+        "cosine": 1 - vectors.matrix @ query / (np.linalg.norm(vectors.matrix, axis=1) * np.linalg.norm(query)),
+        "l2": np.linalg.norm(vectors.matrix - query, axis=1),
+        "inner_product": -(vectors.matrix @ query),
+    }[metric]
+    distances = vectors.distances(query.tolist())
+    assert np.allclose(distances, expected, atol=1e-5)
+
+    nearest = vectors.nearest(distances, 5)
+    assert list(nearest) == list(np.argsort(expected)[:5])
+    assert len(vectors.nearest(distances, 500)) == 50
+
+def test_nearest_filters():
+    vectors = session_vectors()
+    distances = vectors.distances(np.ones(8).tolist())
+    document_id = vectors.document_ids[0]
+    nearest = vectors.nearest(distances, 10, document_ids=[str(document_id)])
+    assert len(nearest) == 10
+    assert all(vectors.document_ids[p] == document_id for p in nearest)
+
+    cutoff = float(np.median(distances))
+    assert all(distances[p] <= cutoff for p in vectors.nearest(distances, 50, max_distance=cutoff))
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], [1.0, 1.0], k=60, limit=3)
+    assert fused[0] == "c"
+    assert set(fused) <= {"a", "b", "c", "d"} and len(fused) == 3
+    assert reciprocal_rank_fusion([["a", "b"], ["b"]], [1.0, 0.0], k=60, limit=2) == ["a", "b"]
+
+def test_lru_and_invalidation():
+    search = InMemoryVectorSearch(max_sessions=2)
+    sessions = [uuid.uuid4() for _ in range(3)]
+    for session_id in sessions:
+        search.put(session_id, session_vectors())
+    assert sessions[0] not in search._sessions
+    assert search.evictions == 1
+
+    search.invalidate_session(sessions[1])
+    assert sessions[1] not in search._sessions
+    assert search.stats()["sessions"] == 1
+    assert search.stats()["invalidations"] == 1
+
+def test_memory_map_replaces_file(tmp_path):
+    """Mapping a session again leaves an existing mapping of it readable"""
+    search = InMemoryVectorSearch(mmap_dir=str(tmp_path))
+    session_id = uuid.uuid4()
+    old = search._memory_map(session_id, np.zeros((100, 8), dtype=np.float32))
+    new = search._memory_map(session_id, np.ones((10, 8), dtype=np.float32))
+    assert old.sum() == 0 and old.shape == (100, 8)
+    assert new.sum() == 80
+    assert len(list(tmp_path.iterdir())) == 1
+
+@pytest.mark.asyncio
+async def test_vector_search_without_postgres():
+    """Vector-only retrieval from a held session only checks its version in the database"""
+    vectors = session_vectors(dimensions=settings.EMBEDDING_DIMENSIONS)
+    vectors.version = (len(vectors), None)
+    session_id = uuid.uuid4()
+    search = InMemoryVectorSearch()
+    search.put(session_id, vectors)
+    version = Mock(one=Mock(return_value=Mock(chunks=len(vectors), created_at=None)))
+    db = Mock(execute=AsyncMock(return_value=version))
+    service = DocumentService(db, embeddings=Mock(), text_splitter=Mock(), in_memory_search=search)
+
+    query = vectors.matrix[7].tolist()
+    chunks, distances = await service.search_similar_chunks("query", str(session_id), limit=3, lexical_weight=0, query_embedding=query)
+
+    db.execute.assert_awaited_once()
+    assert search.stats()["hits"] == 1
+    assert chunks[0].id == vectors.ids[7]
+    assert chunks[0].document.filename == "test.txt"
+    assert distances[0] == pytest.approx(0, abs=1e-5)
+    assert distances == sorted(distances)
+
+def _content(i):
+    # Full-text matches with distinct scores, so both rankings are free of ties
+    return f"Chunk {i} about " + ("invoices " * (i // 5 + 1) if i % 5 == 0 else "shipping")
+
+@pytest.mark.asyncio
+async def test_in_memory_matches_sql(async_db_session):
+    """In-memory results equal the exact SQL search, vector-only and hybrid"""
+    session, _ = await add_session_with_chunks(async_db_session, count=40, content=_content)
+    query = np.random.rand(settings.EMBEDDING_DIMENSIONS).tolist()
+    sql = DocumentService(async_db_session, embeddings=Mock(), text_splitter=Mock())
+    memory = DocumentService(async_db_session, embeddings=Mock(), text_splitter=Mock(), in_memory_search=InMemoryVectorSearch())
+
+    await async_db_session.execute(text("SET LOCAL enable_indexscan = off"))
+    for weights in ({"lexical_weight": 0}, {"vector_weight": 1.0, "lexical_weight": 0.7}):
+        expected, expected_distances = await sql.search_similar_chunks("invoices", str(session.id), limit=8, query_embedding=query, **weights)
+        chunks, distances = await memory.search_similar_chunks("invoices", str(session.id), limit=8, query_embedding=query, **weights)
+        assert {chunk.id for chunk in chunks} == {chunk.id for chunk in expected}
+        assert sorted(distances) == pytest.approx(sorted(expected_distances), abs=1e-5)
+    assert memory.in_memory_search.stats()["loads"] == 1
+
+@pytest.mark.asyncio
+async def test_large_sessions_use_pgvector(async_db_session):
+    session, _ = await add_session_with_chunks(async_db_session, count=10)
+    search = InMemoryVectorSearch(max_chunks=5)
+    assert await search.get(async_db_session, session.id) is None
+    assert await search.get(async_db_session, session.id) is None
+    assert search.stats()["loads"] == 1
+
+@pytest.mark.asyncio
+async def test_invalidated_on_new_chunks(async_db_session, tmp_path):
+    """A session held in memory is dropped when a document of it gets chunks"""
+    session, source = await add_session_with_chunks(async_db_session, count=10)
+    search = InMemoryVectorSearch(mmap_dir=str(tmp_path))
+    vectors = await search.get(async_db_session, session.id)
+    assert len(vectors) == 10
+    assert isinstance(vectors.matrix, np.memmap)
+    assert [path.name for path in tmp_path.iterdir()] == [f"{session.id}.{os.getpid()}.npy"]
+
+    copy = Document(session_id=session.id, filename="copy.txt", file_type="txt", meta_info={})
+    async_db_session.add(copy)
+    await async_db_session.commit()
+    service = DocumentService(async_db_session, embeddings=Mock(), text_splitter=Mock(), in_memory_search=search)
+    await service.copy_document_chunks(source, copy)
+
+    assert not list(tmp_path.iterdir())
+    assert len(await search.get(async_db_session, session.id)) == 20
+
+    await IngestService(async_db_session, document_service=service).delete_document(copy)
+    assert len(await search.get(async_db_session, session.id)) == 10
+
+@pytest.mark.asyncio
+async def test_reloaded_after_another_worker_changes_it(async_db_session):
+    """A held session whose chunks were changed by another worker, which invalidated
+    only its own copy, is reloaded on its next search"""
+    session, source = await add_session_with_chunks(async_db_session, count=10)
+    search, other_worker = InMemoryVectorSearch(), InMemoryVectorSearch()
+    assert len(await search.get(async_db_session, session.id)) == 10
+
+    copy = Document(session_id=session.id, filename="copy.txt", file_type="txt", meta_info={})
+    async_db_session.add(copy)
+    await async_db_session.commit()
+    service = DocumentService(async_db_session, embeddings=Mock(), text_splitter=Mock(), in_memory_search=other_worker)
+    await service.copy_document_chunks(source, copy)
+
+    assert len(await search.get(async_db_session, session.id)) == 20
+    assert len(await search.get(async_db_session, session.id)) == 20
+    assert search.stats()["stale"] == 1
+    assert search.stats()["loads"] == 2
@@ -0,0 +1,115 @@
+import pytest
+from app.services import parsers
+from app.services.parsers import PageSpool, TableChunk, iter_file_pages, extract_pdf_pages, parse_table
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+import multiprocessing
+import io
+import os
+
+SAMPLE_FILES = os.path.join(os.path.dirname(__file__), "..", "..", "docs", "sample_files")
+
+@pytest.fixture(scope="module")
+def parser_pool():
+    pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"))
+    yield pool
+    pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_sharded_pdf_extraction(parser_pool):
+    """Sharded extraction in the process pool yields every page in order"""
+    path = os.path.join(SAMPLE_FILES, "sample_document.pdf")
+    with open(path, "rb") as file:
+        expected = extract_pdf_pages(file)
+        with patch.object(parsers.settings, "PDF_PAGES_PER_SHARD", 1):
+            pages = [page async for page in iter_file_pages(file, "application/pdf", parser_pool)]
+    assert len(pages) == len(expected) > 1
+    assert pages == expected
+
+@pytest.mark.asyncio
+async def test_pdf_shards_in_flight_bounded():
+    """Only two shards per worker are extracted ahead of the page being read"""
+    started = []
+
+    def extract(path, start, stop):
+        started.append(start)
+        return [f"Page {start}"]
+
+    with patch.object(parsers.settings, "PARSER_WORKERS", 0), patch.object(parsers.settings, "PDF_PAGES_PER_SHARD", 1), \
+            patch.object(parsers, "pdf_page_count", return_value=10), patch.object(parsers, "extract_pdf_pages", extract):
+        pages = []
+        async for page in parsers.iter_pages("document.pdf", "application/pdf"):
+            pages.append(page)
+            assert len(started) <= len(pages) + 2
+    assert pages == [f"Page {i}" for i in range(10)]
+
+@pytest.mark.asyncio
+async def test_table_parsing_in_pool(parser_pool):
+    """CSV parsing runs in the pool and yields row-group chunks with their metadata"""
+    path = os.path.join(SAMPLE_FILES, "sample_data.csv")
+    with open(path, "rb") as file:
+        pages = [page async for page in iter_file_pages(file, "text/csv", parser_pool)]
+    expected = parse_table(path, "text/csv")
+    assert pages == expected and len(pages) > 1
+    assert [page.meta_info for page in pages] == [chunk.meta_info for chunk in expected]
+
+def test_csv_row_groups():
+    """Every chunk repeats the header, rows are not split and none is lost"""
+    header = "Region,Product,Units,Notes\n"
+    rows = "".join(f"North,Widget {i},{i},\"line one\nline two\"\n" for i in range(300))
+    with patch.object(parsers.settings, "TABLE_ROWS_PER_READ", 7):
+        chunks = parse_table(io.BytesIO((header + rows).encode()), "text/csv")
+    assert all(chunk.split("\n")[1] == "Region | Product | Units | Notes" for chunk in chunks)
+    assert all(len(chunk) <= parsers.settings.TABLE_CHUNK_SIZE + 20 for chunk in chunks)
+    assert chunks[0].meta_info == {"sheet": None, "row_start": 2, "row_end": chunks[0].meta_info["row_end"]}
+    assert chunks[-1].meta_info["row_end"] == 301
+    # Row ranges are contiguous across chunks and cells keep their line breaks as spaces
+    assert all(a.meta_info["row_end"] + 1 == b.meta_info["row_start"] for a, b in zip(chunks, chunks[1:]))
+    assert "North | Widget 0 | 0 | line one line two" in chunks[0]
+
+def test_excel_sheets():
+    """Every sheet of a workbook is read, with the sheet name in the text and metadata"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    sales = workbook.active
+    sales.title = "Sales"
+    sales.append(["Region", "Q1", None])
+    sales.append(["North", 1.0, None])
+    sales.append([])
+    sales.append(["South", 2.5])
+    costs = workbook.create_sheet("Costs")
+    costs.append(["Item", "Cost"])
+    costs.append(["Rent", 100])
+    workbook.create_sheet("Empty")
+    file = io.BytesIO()
+    workbook.save(file)
+    file.seek(0)
+
+    chunks = parse_table(file, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    assert chunks == [
+        "Sheet 'Sales', rows 2-4\nRegion | Q1\nNorth | 1\nSouth | 2.5",
+        "Sheet 'Costs', rows 2-2\nItem | Cost\nRent | 100"
+    ]
+    assert [chunk.meta_info for chunk in chunks] == [
+        {"sheet": "Sales", "row_start": 2, "row_end": 4},
+        {"sheet": "Costs", "row_start": 2, "row_end": 2}
+    ]
+
+@pytest.mark.asyncio
+async def test_text_parsing_inline():
+    """Text and JSON are parsed in a thread, without the pool"""
+    pages = [page async for page in iter_file_pages(io.BytesIO(b'{"a": 1}'), "application/json", None)]
+    assert pages == ['{\n  "a": 1\n}']
+
+def test_page_spool():
+    """Spooled pages read back in order, table chunks with their metadata"""
+    table = TableChunk("Rows 2-3\nA | B\n1 | 2")
+    table.meta_info = {"sheet": None, "row_start": 2, "row_end": 3}
+    with PageSpool() as spool:
+        for page in ["First page\nwith two lines", table]:
+            spool.write(page)
+        for _ in range(2):
+            pages = list(spool)
+            assert pages == ["First page\nwith two lines", table]
+            assert type(pages[0]) is str and pages[1].meta_info == table.meta_info
@@ -0,0 +1,57 @@
+import pytest
+from app.services.rate_limiter import TokenBucketRateLimiter, Priority, estimate_tokens
+import asyncio
+import time
+
+@pytest.mark.asyncio
+async def test_requests_per_minute():
+    """Test bursts up to the bucket size, then waits for refill"""
+    limiter = TokenBucketRateLimiter("test", requests_per_minute=600)  # 10 per second
+
+    started = time.monotonic()
+    for _ in range(600):
+        await limiter.acquire()
+    assert time.monotonic() - started < 0.5
+
+    await limiter.acquire(requests=2)
+    assert time.monotonic() - started >= 0.15
+    assert limiter.stats()["total_acquired"] == 602
+
+@pytest.mark.asyncio
+async def test_tokens_per_minute():
+    """Test token budget is enforced independently of request count"""
+    limiter = TokenBucketRateLimiter("test", requests_per_minute=1000, tokens_per_minute=600)
+
+    await limiter.acquire(tokens=600)
+    started = time.monotonic()
+    await limiter.acquire(tokens=3)  # 10 tokens per second
+    assert time.monotonic() - started >= 0.25
+
+@pytest.mark.asyncio
+async def test_queries_overtake_ingestion():
+    """Test queued queries are served before queued ingestion and queue depth is exposed"""
+    limiter = TokenBucketRateLimiter("test", requests_per_minute=1200)  # 20 per second
+    await limiter.acquire(requests=1200)
+
+    order = []
+
+    async def call(name, priority):
+        await limiter.acquire(priority=priority)
+        order.append(name)
+
+    ingest = [asyncio.create_task(call(f"ingest-{i}", Priority.INGEST)) for i in range(3)]
+    await asyncio.sleep(0)
+    query = asyncio.create_task(call("query", Priority.QUERY))
+    await asyncio.sleep(0)
+
+    stats = limiter.stats()
+    assert limiter.queue_depth == 4
+    assert stats["queued_by_priority"] == {"query": 1, "ingest": 3}
+
+    await asyncio.gather(query, *ingest)
+    assert order[0] == "query"
+    assert limiter.queue_depth == 0
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 100
@@ -0,0 +1,138 @@
+import pytest
+from app.services.resilience import (
+    AttemptLog,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    UpstreamError,
+    UpstreamRateLimitError,
+    UpstreamUnavailableError,
+    call_with_retry,
+    classify
+)
+from google.api_core import exceptions as google_exceptions
+from unittest.mock import AsyncMock, Mock, patch
+
+@pytest.fixture
+def sleeps():
+    with patch("app.services.resilience.asyncio.sleep", new_callable=AsyncMock) as sleep:
+        yield sleep
+
+def rate_limited(seconds: int) -> google_exceptions.ResourceExhausted:
+    return google_exceptions.ResourceExhausted("quota", response=Mock(headers={"Retry-After": str(seconds)}))
+
+def test_classify():
+    error = classify(rate_limited(7))
+    assert isinstance(error, UpstreamRateLimitError)
+    assert error.retry_after == 7
+
+    detail = Mock(retry_delay=Mock(seconds=2, nanos=500_000_000))
+    assert classify(google_exceptions.ResourceExhausted("quota", details=[detail])).retry_after == 2.5
+    assert isinstance(classify(google_exceptions.ServiceUnavailable("down")), UpstreamUnavailableError)
+    assert type(classify(google_exceptions.InvalidArgument("bad prompt"))) is UpstreamError
+    assert classify(TypeError("bad argument")) is None
+
+def test_backoff_jitter():
+    policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=4.0)
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= min(4.0, 2 ** attempt)
+    assert policy.delay(0, retry_after=10) == 10
+
+@pytest.mark.asyncio
+async def test_retry_honours_retry_after(sleeps):
+    call = AsyncMock(side_effect=[rate_limited(3), google_exceptions.ServiceUnavailable("down"), "ok"])
+    attempts = AttemptLog()
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=1.0)
+
+    assert await call_with_retry("test", call, policy, CircuitBreaker("test"), attempts) == "ok"
+    assert call.await_count == 3
+    delays = [c.args[0] for c in sleeps.await_args_list]
+    assert delays[0] == 3
+    assert 0 <= delays[1] <= 1.0
+    assert attempts.outcomes == {"UpstreamRateLimitError": 1, "UpstreamUnavailableError": 1, "success": 1}
+    assert attempts.stats()["latency_p50"] is not None
+
+@pytest.mark.asyncio
+async def test_non_retryable_and_exhausted(sleeps):
+    call = AsyncMock(side_effect=google_exceptions.InvalidArgument("bad prompt"))
+    with pytest.raises(UpstreamError) as raised:
+        await call_with_retry("test", call, RetryPolicy(max_attempts=3), CircuitBreaker("test"))
+    assert type(raised.value) is UpstreamError
+    assert call.await_count == 1
+
+    call = AsyncMock(side_effect=google_exceptions.ServiceUnavailable("down"))
+    with pytest.raises(UpstreamUnavailableError):
+        await call_with_retry("test", call, RetryPolicy(max_attempts=3), CircuitBreaker("test"))
+    assert call.await_count == 3
+    assert sleeps.await_count == 2
+
+@pytest.mark.asyncio
+async def test_local_errors_propagate(sleeps):
+    """Errors that are not upstream failures are raised as they are and leave the breaker alone"""
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout
+    call = AsyncMock(side_effect=TypeError("bad argument"))
+    with pytest.raises(TypeError):
+        await call_with_retry("test", call, RetryPolicy(max_attempts=3), breaker)
+    assert call.await_count == 1
+    assert breaker.consecutive_failures == 1
+
+    # The half-open probe was given back, the next call still gets through
+    call = AsyncMock(return_value="ok")
+    assert await call_with_retry("test", call, RetryPolicy(max_attempts=3), breaker) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_circuit_breaker(sleeps):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    failing = AsyncMock(side_effect=google_exceptions.ServiceUnavailable("down"))
+    with pytest.raises(UpstreamUnavailableError):
+        await call_with_retry("test", failing, RetryPolicy(max_attempts=2), breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Fails fast without calling
+    healthy = AsyncMock(return_value="ok")
+    with pytest.raises(CircuitOpenError) as raised:
+        await call_with_retry("test", healthy, RetryPolicy(max_attempts=2), breaker)
+    assert 0 < raised.value.retry_after <= 30
+    healthy.assert_not_awaited()
+    assert breaker.stats()["rejected"] == 1
+
+    # After the timeout one probe goes through and closes the circuit
+    breaker.opened_at -= 30
+    assert await call_with_retry("test", healthy, RetryPolicy(max_attempts=2), breaker) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_failure_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 30
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+@pytest.mark.asyncio
+async def test_deadlines(sleeps):
+    import asyncio
+    from app.services.resilience import DeadlineExceededError, deadline_after, with_deadline, with_timeout
+
+    async def hang():
+        await asyncio.Event().wait()
+
+    with pytest.raises(DeadlineExceededError):
+        await with_deadline(hang(), deadline_after(0.01), "test")
+    with pytest.raises(UpstreamUnavailableError):
+        await with_timeout(hang(), 0.01, "test")
+    assert await with_deadline(AsyncMock(return_value="ok")(), None, "test") == "ok"
+
+    # A Retry-After longer than the time left is not waited for
+    call = AsyncMock(side_effect=rate_limited(30))
+    with pytest.raises(UpstreamRateLimitError) as raised:
+        await call_with_retry("test", call, RetryPolicy(max_attempts=3), CircuitBreaker("test"), deadline=deadline_after(5))
+    assert raised.value.retry_after == 30
+    assert call.await_count == 1
+    sleeps.assert_not_awaited()
@@ -0,0 +1,59 @@
+import pytest
+from app.services.response_cache import ResponseCache
+from unittest.mock import patch
+import numpy as np
+import uuid
+
+SOURCES = [{"chunk_id": "c1", "filename": "a.txt"}]
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+@pytest.fixture
+def documents():
+    return [uuid.uuid4(), uuid.uuid4()]
+
+def test_lookup_within_radius(documents):
+    cache = ResponseCache(radius=0.05)
+    cache.store(documents, [1, 0, 0], "Answer", SOURCES)
+
+    hit = cache.lookup(list(reversed(documents)), unit([1, 0.1, 0]))
+    assert hit.content == "Answer"
+    assert hit.used_chunks == SOURCES
+
+    # Too far, a different set of documents, or other retrieval parameters
+    assert cache.lookup(documents, unit([1, 1, 0])) is None
+    assert cache.lookup(documents[:1], [1, 0, 0]) is None
+    assert cache.lookup(documents, [1, 0, 0], retrieval=(1.0, 0.0, 5)) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["hit_rate"] == pytest.approx(1 / 4, abs=1e-4)
+
+def test_invalidate_documents(documents):
+    cache = ResponseCache()
+    cache.store(documents, [1, 0], "Both", SOURCES)
+    cache.store(documents[1:], [1, 0], "Second only", SOURCES)
+
+    assert cache.invalidate_documents([documents[0]]) == 1
+    assert cache.lookup(documents, [1, 0]) is None
+    assert cache.lookup(documents[1:], [1, 0]).content == "Second only"
+    assert cache.stats()["invalidations"] == 1
+
+def test_lru_and_ttl_eviction(documents):
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.store(documents, [1, 0, 0], "x", SOURCES)
+    cache.store(documents, [0, 1, 0], "y", SOURCES)
+    assert cache.lookup(documents, [1, 0, 0]).content == "x"
+    cache.store(documents, [0, 0, 1], "z", SOURCES)
+
+    # "y" was least recently used
+    assert cache.lookup(documents, [0, 1, 0]) is None
+    assert cache.stats()["evictions"] == 1
+
+    with patch("app.services.response_cache.time.monotonic", return_value=10 ** 9):
+        assert cache.lookup(documents, [1, 0, 0]) is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["expirations"] == 2
@@ -119,4 +119,16 @@ def test_schema_validations():
             session_id=session_id,
             role=MessageRole.USER,
             content=""  # cannot be empty
-        ) 
\ No newline at end of file
+        ) 
+def test_message_retrieval_weights():
+    """Test optional per-message retrieval weights"""
+    message = ChatMessageCreate(content="Find SKU AB-12")
+    assert message.vector_weight is None and message.lexical_weight is None
+
+    message = ChatMessageCreate(content="Find SKU AB-12", vector_weight=0.5, lexical_weight=2)
+    assert message.lexical_weight == 2.0
+
+    with pytest.raises(ValueError):
+        ChatMessageCreate(content="Find SKU AB-12", lexical_weight=-1)
+    with pytest.raises(ValueError):
+        ChatMessageCreate(content="Find SKU AB-12", vector_weight=0, lexical_weight=0)
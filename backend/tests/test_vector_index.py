@@ -0,0 +1,106 @@
+import pytest
+from app.db.vector_index import (
+    INDEX_NAME,
+    check_quantization_support,
+    create_index_sql,
+    index_stats,
+    ivfflat_lists,
+    measure_recall,
+    quantized_order,
+    rebuild_index,
+    search_tuning,
+    similarity_to_distance
+)
+from app.core.settings import settings
+from sqlalchemy import text
+from tests.conftest import engine
+from unittest.mock import patch
+
+def test_create_index_sql():
+    """Test index DDL follows the configured type and parameters"""
+    sql = create_index_sql(index_type="hnsw", concurrently=True)
+    assert sql.startswith(f"CREATE INDEX CONCURRENTLY {INDEX_NAME}")
+    assert "USING hnsw (embedding vector_cosine_ops)" in sql
+    assert f"m = {settings.HNSW_M}" in sql
+    assert f"ef_construction = {settings.HNSW_EF_CONSTRUCTION}" in sql
+
+    assert "USING ivfflat" in create_index_sql(index_type="ivfflat", row_count=5000)
+
+    with pytest.raises(ValueError):
+        create_index_sql(index_type="flat")
+
+def test_quantized_index_sql():
+    """Test quantised indexes are expression indexes over the full-precision column"""
+    dimensions = settings.EMBEDDING_DIMENSIONS
+    assert quantized_order() is None
+    with patch.object(settings, "VECTOR_QUANTIZATION", "halfvec"):
+        assert f"USING hnsw ((embedding::halfvec({dimensions})) halfvec_cosine_ops)" in create_index_sql(index_type="hnsw")
+        assert quantized_order() == f"(c.embedding::halfvec({dimensions})) <=> CAST(:query_embedding AS halfvec({dimensions}))"
+    with patch.object(settings, "VECTOR_QUANTIZATION", "binary"):
+        assert f"USING hnsw ((binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops)" in create_index_sql(index_type="hnsw")
+        assert "<~>" in quantized_order()
+    with patch.object(settings, "VECTOR_QUANTIZATION", "int8"):
+        with pytest.raises(ValueError):
+            create_index_sql()
+
+def test_quantization_needs_pgvector_07():
+    """Test quantised indexes are refused on servers without halfvec and bit support"""
+    check_quantization_support(None, "none")
+    with patch("app.db.vector_index.pgvector_version", return_value=(0, 6, 2)):
+        with pytest.raises(RuntimeError, match="0.7.0"):
+            check_quantization_support(None, "halfvec")
+    with patch("app.db.vector_index.pgvector_version", return_value=(0, 7, 4)):
+        check_quantization_support(None, "binary")
+
+def test_ivfflat_lists_sizing():
+    """Test ivfflat lists are sized from the row count unless configured"""
+    with patch.object(settings, "IVFFLAT_LISTS", 0):
+        assert ivfflat_lists(0) == 1
+        assert ivfflat_lists(50_000) == 50
+        assert ivfflat_lists(4_000_000) == 2000
+    with patch.object(settings, "IVFFLAT_LISTS", 100):
+        assert ivfflat_lists(50_000) == 100
+
+@pytest.mark.parametrize("index_type", ["ivfflat", "hnsw"])
+def test_rebuild_and_report(db_session, chunks, index_type):
+    """Test online rebuild swaps the index in and recall is measured against an exact scan"""
+    build = rebuild_index(engine, index_type)
+    assert build["index_type"] == index_type
+    assert build["rows"] == 200
+    assert build["build_seconds"] >= 0
+
+    stats = index_stats(db_session)
+    assert stats["exists"]
+    assert f"USING {index_type}" in stats["definition"]
+    assert stats["size_bytes"] > 0
+    indexes = db_session.execute(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = 'document_chunks' AND indexname LIKE :name"),
+        {"name": f"{INDEX_NAME}%"}
+    ).scalars().all()
+    assert indexes == [INDEX_NAME]
+
+    recall = measure_recall(db_session, sample_size=5, k=5)
+    assert recall["queries"] == 5
+    assert 0 <= recall["recall"] <= 1
+
+def test_search_tuning_scales_with_selectivity(db_session, chunks):
+    """Test the index scan is widened for a session holding a small share of the table"""
+    db_session.execute(text("ANALYZE document_chunks"))
+
+    tuning = db_session.execute(*search_tuning(5)).one()
+    assert tuning.rows is None
+    assert (tuning.probes, tuning.ef_search) == (str(settings.IVFFLAT_PROBES), str(settings.HNSW_EF_SEARCH))
+
+    statement, params = search_tuning(5, scope_rows="SELECT count(*) / 10 FROM document_chunks")
+    tuning = db_session.execute(statement, params).one()
+    assert tuning.rows == 20
+    assert (tuning.probes, tuning.ef_search) == (str(settings.IVFFLAT_PROBES * 10), str(settings.HNSW_EF_SEARCH * 10))
+    assert db_session.execute(text("SHOW hnsw.ef_search")).scalar() == tuning.ef_search
+
+    statement, params = search_tuning(5, scope_rows="SELECT 0")
+    assert db_session.execute(statement, params).one().ef_search == "1000"
+
+def test_similarity_to_distance():
+    assert similarity_to_distance(0.7, "cosine") == pytest.approx(0.3)
+    assert similarity_to_distance(0.7, "inner_product") == pytest.approx(-0.7)
+    assert similarity_to_distance(0.5, "l2") == pytest.approx(1.0)
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { createSession, sendMessage, getUserSessions, getChatHistory, deleteSession } from '../services/api';
+import { createSession, streamMessage, getUserSessions, getChatHistory, deleteSession } from '../services/api';
 import FileUpload from './FileUpload';
 import Sidebar from './Sidebar';
 import { Message, ChatSession } from '../types';
@@ -62,18 +62,33 @@ const ChatInterface: React.FC = () => {
         session_id: currentSession.id,
         created_at: new Date().toISOString()
       };
-      setMessages(prev => [...prev, tempMessage]);
+      // Placeholder filled in as the response streams
+      const streamingMessage: Message = {
+        id: 'streaming-' + Date.now(),
+        role: 'assistant',
+        content: '',
+        session_id: currentSession.id,
+        created_at: new Date().toISOString()
+      };
+      setMessages(prev => [...prev, tempMessage, streamingMessage]);
 
-      // Send to API and get response
-      const messages = await sendMessage(currentSession.id, content);
-      
-      // Replace temp message and add both messages
-      setMessages(prev => [
-        ...prev.filter(m => m.id !== tempMessage.id),
-        ...messages
-      ]);
+      await streamMessage(currentSession.id, content, {
+        // Replace temp messages with the saved ones as they arrive
+        onUserMessage: (message) => {
+          setMessages(prev => prev.map(m => (m.id === tempMessage.id ? message : m)));
+        },
+        onDelta: (text) => {
+          setMessages(prev => prev.map(m => (
+            m.id === streamingMessage.id ? { ...m, content: m.content + text } : m
+          )));
+        },
+        onAssistantMessage: (message) => {
+          setMessages(prev => prev.map(m => (m.id === streamingMessage.id ? message : m)));
+        },
+      });
     } catch (error) {
       console.error('Error sending message:', error);
+      setMessages(prev => prev.filter(m => !m.id.startsWith('streaming-')));
       alert('Failed to send message. Please try again.');
     } finally {
       setLoading(false);
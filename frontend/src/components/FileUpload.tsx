@@ -1,13 +1,26 @@
 import React, { useState } from 'react';
-import { uploadFile } from '../services/api';
+import { getIngestJob, uploadFile } from '../services/api';
+import { IngestJob } from '../types';
 import axios from 'axios';
 
+const POLL_INTERVAL_MS = 1000;
+
+const waitForJob = async (job: IngestJob, onProgress: (job: IngestJob) => void): Promise<IngestJob> => {
+  while (job.status !== 'indexed' && job.status !== 'failed') {
+    await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+    job = await getIngestJob(job.id);
+    onProgress(job);
+  }
+  return job;
+};
+
 interface FileUploadProps {
   sessionId: string | null;
 }
 
 const FileUpload: React.FC<FileUploadProps> = ({ sessionId }) => {
   const [uploading, setUploading] = useState(false);
+  const [progress, setProgress] = useState<string | null>(null);
 
   const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
     if (!sessionId) {
@@ -27,10 +40,16 @@ const FileUpload: React.FC<FileUploadProps> = ({ sessionId }) => {
       console.log('Uploading file:', file.name, 'type:', file.type);
       console.log('Session ID:', sessionId);
       
-      await uploadFile(formData, sessionId);
-      console.log('Upload response:', formData);
-      
-      alert('File uploaded successfully!');
+      const queued = await uploadFile(formData, sessionId);
+      console.log('Upload queued as job:', queued.id);
+      setProgress(queued.status);
+
+      const job = await waitForJob(queued, (update) => setProgress(update.status));
+      if (job.status === 'failed') {
+        alert(`Failed to process file: ${job.error}`);
+      } else {
+        alert(`File uploaded successfully! Indexed ${job.chunk_count} chunks.`);
+      }
     } catch (error) {
       console.error('Error uploading file:', error);
       if (axios.isAxiosError(error)) {
@@ -39,6 +58,7 @@ const FileUpload: React.FC<FileUploadProps> = ({ sessionId }) => {
       alert('Failed to upload file');
     } finally {
       setUploading(false);
+      setProgress(null);
       // Reset file input
       event.target.value = '';
     }
@@ -61,7 +81,7 @@ const FileUpload: React.FC<FileUploadProps> = ({ sessionId }) => {
           ${!sessionId ? 'tooltip' : ''}`}
         data-tooltip={!sessionId ? 'Please start a chat first' : ''}
       >
-        {uploading ? 'Uploading...' : 'Upload Document'}
+        {uploading ? (progress ? `${progress.charAt(0).toUpperCase()}${progress.slice(1)}...` : 'Uploading...') : 'Upload Document'}
       </label>
       <span className="ml-2 text-sm text-gray-600">
         Supported formats: PDF, TXT, CSV, JSON, XLSX
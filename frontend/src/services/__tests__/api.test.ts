@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { createSession, getUserSessions, sendMessage, uploadFile } from '../api';
+import { createSession, getChatHistory, getUserSessions, sendMessage, uploadFile } from '../api';
 
 jest.mock('axios');
 const mockedAxios = axios as jest.Mocked<typeof axios>;
@@ -35,7 +35,17 @@ describe('API Service', () => {
     
     const result = await getUserSessions('test_user');
     expect(result).toEqual(mockSessions);
-    expect(mockedAxios.get).toHaveBeenCalledWith('/chat/sessions/test_user');
+    expect(mockedAxios.get).toHaveBeenCalledWith('/chat/sessions/test_user', undefined);
+  });
+
+  it('follows the next cursor through every page', async () => {
+    mockedAxios.get
+      .mockResolvedValueOnce({ data: [{ id: '3' }, { id: '4' }], headers: { 'x-next-cursor': 'older' } })
+      .mockResolvedValueOnce({ data: [{ id: '1' }, { id: '2' }], headers: {} });
+
+    const result = await getChatHistory('123');
+    expect(result.map((message) => message.id)).toEqual(['1', '2', '3', '4']);
+    expect(mockedAxios.get).toHaveBeenLastCalledWith('/chat/sessions/123/messages', { params: { cursor: 'older' } });
   });
 
   it('sends a message', async () => {
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { ChatSession, Message } from '../types';
+import { ChatSession, IngestJob, Message } from '../types';
 
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8000/api/v1';
 
@@ -15,14 +15,25 @@ export const createSession = async (userId: string): Promise<ChatSession> => {
   return response.data;
 };
 
+// Listings are paginated, each response carries the cursor of the next (older) page until the last one.
+const getAllPages = async <T>(url: string, olderFirst = false): Promise<T[]> => {
+  let items: T[] = [];
+  let cursor: string | undefined;
+  do {
+    const response = await api.get<T[]>(url, cursor ? { params: { cursor } } : undefined);
+    items = olderFirst ? [...response.data, ...items] : [...items, ...response.data];
+    cursor = response.headers?.['x-next-cursor'];
+  } while (cursor);
+  return items;
+};
+
 export const getUserSessions = async (userId: string): Promise<ChatSession[]> => {
-  const response = await api.get(`/chat/sessions/${userId}`);
-  return response.data;
+  return getAllPages<ChatSession>(`/chat/sessions/${userId}`);
 };
 
+// Each page is in chronological order, older pages go before it
 export const getChatHistory = async (sessionId: string): Promise<Message[]> => {
-  const response = await api.get(`/chat/sessions/${sessionId}/messages`);
-  return response.data;
+  return getAllPages<Message>(`/chat/sessions/${sessionId}/messages`, true);
 };
 
 export const sendMessage = async (sessionId: string, content: string): Promise<Message[]> => {
@@ -30,7 +41,66 @@ export const sendMessage = async (sessionId: string, content: string): Promise<M
   return response.data;
 };
 
-export const uploadFile = async (formData: FormData, sessionId: string): Promise<any> => {
+export interface StreamHandlers {
+  onUserMessage?: (message: Message) => void;
+  onDelta: (text: string) => void;
+  onAssistantMessage?: (message: Message) => void;
+}
+
+// Streams the assistant response over Server-Sent Events. EventSource only supports GET,
+// so the POST body is sent with fetch and the event stream is parsed from the response body.
+export const streamMessage = async (
+  sessionId: string,
+  content: string,
+  handlers: StreamHandlers
+): Promise<void> => {
+  const response = await fetch(`${API_BASE_URL}/chat/sessions/${sessionId}/messages/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream',
+    },
+    body: JSON.stringify({ content }),
+  });
+  if (!response.ok || !response.body) {
+    throw new Error(`Streaming request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const dispatch = (block: string) => {
+    let event = 'message';
+    const dataLines: string[] = [];
+    block.split('\n').forEach((line) => {
+      if (line.startsWith('event:')) event = line.slice(6).trim();
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+    });
+    if (dataLines.length === 0) return;
+    const data = JSON.parse(dataLines.join('\n'));
+
+    if (event === 'user_message') handlers.onUserMessage?.(data);
+    else if (event === 'delta') handlers.onDelta(data);
+    else if (event === 'assistant_message') handlers.onAssistantMessage?.(data);
+    else if (event === 'error') throw new Error(data);
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf('\n\n');
+    while (boundary !== -1) {
+      dispatch(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf('\n\n');
+    }
+  }
+  if (buffer.trim()) dispatch(buffer);
+};
+
+export const uploadFile = async (formData: FormData, sessionId: string): Promise<IngestJob> => {
   const response = await api.post(`/ingest/upload?session_id=${sessionId}`, formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
@@ -39,6 +109,11 @@ export const uploadFile = async (formData: FormData, sessionId: string): Promise
   return response.data;
 };
 
+export const getIngestJob = async (jobId: string): Promise<IngestJob> => {
+  const response = await api.get(`/ingest/jobs/${jobId}`);
+  return response.data;
+};
+
 export const deleteSession = async (sessionId: string): Promise<void> => {
   await api.delete(`/chat/sessions/${sessionId}`);
 }; 
\ No newline at end of file
@@ -17,4 +17,21 @@ export interface Message {
       chunk_index?: number;
     }>;
   };
-} 
\ No newline at end of file
+}
+
+export type IngestJobStatus = 'queued' | 'parsing' | 'embedding' | 'indexed' | 'failed';
+
+export interface IngestJob {
+  id: string;
+  session_id: string;
+  filename: string;
+  status: IngestJobStatus;
+  document_id: string | null;
+  chunk_count: number | null;
+  size_bytes: number;
+  error: string | null;
+  created_at: string;
+  started_at: string | null;
+  finished_at: string | null;
+  chunks_per_second: number | null;
+}